@@ -2,18 +2,13 @@ import django
 from django.conf import settings
 django.setup()
 from collector.models import PuzzlePiece
+from collector import progress
+from collector.UtilityOps import UtilityOps
 from urllib.parse import urlparse
-import hashlib
 import requests
 import getopt
 import sys
 
-def hash_my_data(url):
-        url = url.encode("utf-8")
-        hash_object = hashlib.sha256(url)
-        hex_dig = hash_object.hexdigest()
-        return hex_dig
-
 def main():
 	inputfile = "images.txt"
 	priority = 0
@@ -42,6 +37,9 @@ def main():
 			if len(line) > 200:
 				raise ValueError('URL too long to fit')
 			print(line)
+			if PuzzlePiece.objects.filter(hash=UtilityOps.UrlHash(line)).exists():
+				print("Looks like that puzzle piece image has already been submitted. Thanks for submitting!")
+				continue
 			host = urlparse(line).hostname 
 			if host in ["tjl.co","gamerdvr.com","dropbox.com","www.gamerdvr.com","www.dropbox.com"]:
 				raise ValueError('We cannot accept images from gamerdvr or dropbox or tjl.co - try another host please, Discord works great!')
@@ -51,11 +49,12 @@ def main():
 				raise ValueError('That URL does not seem to exist. Please verify and try again.')
 			i = PuzzlePiece()
 			i.url = line
-			i.hash = hash_my_data(line)
+			i.hash = UtilityOps.UrlHash(line)
 			i.ip_address = "127.0.0.1"
 			i.approved = True
 			i.priority = priority
 			i.save()
+			progress.pieceSubmitted()
 		except KeyError as ex:
 			print ("There was an issue with your request.")
 		except ValueError as ex:
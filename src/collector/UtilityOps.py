@@ -1,3 +1,7 @@
+from django.conf import settings
+import hashlib
+import hmac
+from urllib.parse import urlsplit, urlunsplit
 
 class UtilityOps:
 	@staticmethod
@@ -20,3 +24,49 @@ class UtilityOps:
 		return default
 
 
+	@staticmethod
+	def SecretlyHash(data):
+		# Keyed hash of an already hashed ip, safe to publish as an identifier
+		key = settings.PSEUDONYM_KEY.encode("utf-8")
+		return hmac.new(key, data.encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+	@staticmethod
+	def CanonicalSolutionHash(center, walls, links):
+		# The same in-game piece always gets the same hash, no matter which
+		# side it was transcribed as "top": use the smallest of the six rotations
+		candidates = []
+		for rotation in range(6):
+			rotatedWalls = "".join("1" if walls[(i + rotation) % 6] else "0" for i in range(6))
+			rotatedLinks = " ".join(links[(i + rotation) % 6] for i in range(6))
+			candidates.append("{} {} {}".format(center, rotatedWalls, rotatedLinks).upper())
+		return hashlib.sha256(min(candidates).encode("utf-8")).hexdigest()
+
+
+	@staticmethod
+	def CanonicalUrl(url):
+		# One spelling per image, so PuzzlePiece.hash catches the same image
+		# submitted through another host alias, with a query string or as the
+		# page instead of the direct link. Only used for hashing, the piece
+		# keeps the URL as submitted. CanonicalUrl(CanonicalUrl(x)) == CanonicalUrl(x).
+		parts = urlsplit(url.strip())
+		host = (parts.hostname or "").lower()
+		if host.startswith("www."):
+			host = host[4:]
+		path = parts.path.rstrip("/")
+		if host in ("imgur.com", "i.imgur.com", "m.imgur.com") and path.count("/") == 1:
+			# imgur.com/abc, i.imgur.com/abc.png and .jpg are the same image,
+			# ids are case sensitive
+			return "https://i.imgur.com/" + path[1:].split(".")[0]
+		if host in ("gyazo.com", "i.gyazo.com") and path.count("/") == 1:
+			return "https://i.gyazo.com/" + path[1:].split(".")[0].lower()
+		if host in ("cdn.discordapp.com", "media.discordapp.net"):
+			# media. is the resizing proxy for cdn., ?width=... only scales
+			return "https://cdn.discordapp.com" + path
+		# Everything else: scheme and host case and the fragment don't matter
+		return urlunsplit(("https", host + (":{}".format(parts.port) if parts.port else ""), path, parts.query, ""))
+
+
+	@staticmethod
+	def UrlHash(url):
+		return hashlib.sha256(UtilityOps.CanonicalUrl(url).encode("utf-8")).hexdigest()
@@ -0,0 +1,69 @@
+from django.db import transaction
+from django.db.models import Max, Q
+from .models import ArchivedTranscription, BadImage, ConfidentSolution, TranscriptionData, TranscriptionRawData
+import itertools
+
+# Transcriptions of pieces that left the queue (solved or reported bad) move
+# to ArchivedTranscription. Everything that looks at old transcriptions goes
+# through here and sees both tables.
+COLUMNS = [
+	"id", "puzzlePiece_id", "ip_address", "submitted_date", "bad_image", "orientation", "datahash", "center",
+	"wall1", "wall2", "wall3", "wall4", "wall5", "wall6",
+	"link1", "link2", "link3", "link4", "link5", "link6",
+]
+
+
+def archiveBatch(batchSize):
+	# Moves up to batchSize transcriptions of resolved pieces, returns how many
+	candidates = TranscriptionData.objects.filter(
+		Q(puzzlePiece_id__in=ConfidentSolution.objects.values("puzzlePiece_id")) |
+		Q(puzzlePiece_id__in=BadImage.objects.values("puzzlePiece_id")))
+	# MySQL 5.7 resets AUTO_INCREMENT to the highest id left after a restart,
+	# so the newest transcription stays put or its id could be handed out again
+	newest = TranscriptionData.objects.aggregate(newest=Max("id"))["newest"]
+	ids = list(candidates.exclude(id=newest).order_by("id").values_list("id", flat=True)[:batchSize])
+	if not ids:
+		return 0
+
+	with transaction.atomic():
+		raws = {raw.transcription_id: raw for raw in TranscriptionRawData.objects.filter(transcription_id__in=ids)}
+		archived = []
+		for row in TranscriptionData.objects.filter(id__in=ids).select_for_update().values(*COLUMNS):
+			raw = raws.get(row["id"])
+			archived.append(ArchivedTranscription(
+				rawCompressed=raw.compressed if raw else False,
+				rawPayload=bytes(raw.payload) if raw else None,
+				**row))
+		ArchivedTranscription.objects.bulk_create(archived)
+		# Takes the raw data along
+		TranscriptionData.objects.filter(id__in=[a.id for a in archived]).delete()
+	return len(archived)
+
+
+def pieceTranscriptions(puzzlepieceId, *fields):
+	# Live and archived transcriptions of one piece, oldest first
+	live = TranscriptionData.objects.filter(puzzlePiece_id=puzzlepieceId)
+	archived = ArchivedTranscription.objects.filter(puzzlePiece_id=puzzlepieceId)
+	if fields:
+		live = live.only(*fields)
+		archived = archived.only(*fields)
+	return sorted(itertools.chain(live, archived), key=lambda t: t.id)
+
+
+def findTranscription(transcriptionId):
+	transcription = TranscriptionData.objects.filter(id=transcriptionId).first()
+	if transcription is None:
+		transcription = ArchivedTranscription.objects.filter(id=transcriptionId).first()
+	return transcription
+
+
+def rawText(transcription):
+	if isinstance(transcription, ArchivedTranscription):
+		return transcription.rawText()
+	raw = TranscriptionRawData.objects.filter(transcription=transcription).first()
+	return raw.text() if raw else None
+
+
+def allTranscriptions(queryset=lambda model: model.objects.all()):
+	# Both tables one after the other, queryset builds the query for each
+	return itertools.chain(queryset(TranscriptionData).iterator(), queryset(ArchivedTranscription).iterator())
@@ -0,0 +1,105 @@
+from django.conf import settings
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+from .models import BadImage, ConfidentSolution, PuzzlePiece
+import datetime
+import json
+
+# Incremental feed of changed pieces and solutions, ordered by
+# (last_modified, id). A cursor is that pair as "<microseconds>-<id>", every
+# record carries the cursor to resume after it.
+#
+# Anything that changes a fed row has to bump last_modified: save() does,
+# QuerySet.update() only when last_modified is passed along (touch()).
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+class CursorError(ValueError):
+	pass
+
+
+def encodeCursor(lastModified, id):
+	return "{}-{}".format((lastModified - EPOCH) // datetime.timedelta(microseconds=1), id)
+
+
+def decodeCursor(cursor):
+	try:
+		micros, id = cursor.split("-")
+		return EPOCH + datetime.timedelta(microseconds=int(micros)), int(id)
+	except (ValueError, OverflowError):
+		raise CursorError("Invalid cursor {!r}".format(cursor))
+
+
+def touch(model, **filters):
+	# For the places that write with update(), which skips auto_now
+	return model.objects.filter(**filters).update(last_modified=timezone.now())
+
+
+def _pieces():
+	return PuzzlePiece.objects.annotate(
+		bad=Exists(BadImage.objects.filter(puzzlePiece=OuterRef("pk"))),
+		solved=Exists(ConfidentSolution.objects.filter(puzzlePiece=OuterRef("pk"))),
+	).values("id", "url", "approved", "priority", "transCount", "duplicateOf_id", "bad", "solved", "deadLink", "last_modified")
+
+
+def _solutions():
+	return ConfidentSolution.objects.values(
+		"id", "puzzlePiece_id", "confidence", "datahash", "canonicalhash", "center",
+		"wall1", "wall2", "wall3", "wall4", "wall5", "wall6",
+		"link1", "link2", "link3", "link4", "link5", "link6", "last_modified")
+
+
+def _pieceRecord(row):
+	return {
+		"id": row["id"],
+		"url": row["url"],
+		"approved": row["approved"],
+		"priority": row["priority"],
+		"transCount": row["transCount"],
+		"duplicateOf": row["duplicateOf_id"],
+		"bad": row["bad"],
+		"solved": row["solved"],
+		"dead": row["deadLink"],
+	}
+
+
+def _solutionRecord(row):
+	return {
+		"id": row["id"],
+		"puzzlePiece": row["puzzlePiece_id"],
+		"confidence": row["confidence"],
+		"datahash": row["datahash"],
+		"canonicalhash": row["canonicalhash"],
+		"center": row["center"],
+		"walls": [row["wall" + str(i)] for i in range(1, 7)],
+		"links": [row["link" + str(i)] for i in range(1, 7)],
+	}
+
+
+FEEDS = {
+	"pieces": (_pieces, _pieceRecord),
+	"solutions": (_solutions, _solutionRecord),
+}
+
+
+def changesAfter(kind, cursor, limit):
+	# Up to limit rows changed after cursor (None for everything). Rows from
+	# the last CHANGES_SETTLE_SECONDS are held back: last_modified is set
+	# before the write commits, a transaction still running could otherwise
+	# show up later behind a cursor that already moved past it.
+	query, record = FEEDS[kind]
+	rows = query().filter(last_modified__lte=timezone.now() - datetime.timedelta(seconds=settings.CHANGES_SETTLE_SECONDS))
+	if cursor:
+		lastModified, id = decodeCursor(cursor)
+		rows = rows.filter(Q(last_modified__gt=lastModified) | Q(last_modified=lastModified, id__gt=id))
+	# Always the primary, the replica may be behind by more than the settle time
+	rows = rows.using("default").order_by("last_modified", "id")[:limit]
+
+	lines = []
+	for row in rows:
+		cursor = encodeCursor(row["last_modified"], row["id"])
+		data = record(row)
+		data["last_modified"] = row["last_modified"].isoformat()
+		data["cursor"] = cursor
+		lines.append(json.dumps(data) + "\n")
+	return lines, cursor
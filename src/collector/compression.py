@@ -0,0 +1,97 @@
+from django.utils.cache import patch_vary_headers
+import asyncio
+import gzip
+import re
+
+try:
+	import brotli
+except ImportError:
+	# Optional, without it everyone gets gzip
+	brotli = None
+
+# Negotiated compression for the API and the CSV exports. Only data formats:
+# HTML pages carry the CSRF token and compressing them would open them up to
+# BREACH.
+COMPRESSIBLE = ("application/json", "text/csv", "application/x-ndjson")
+MIN_LENGTH = 256
+GZIP_LEVEL = 6
+# 11 is several times slower for a few percent, too slow for a CSV export
+BROTLI_QUALITY = 5
+
+codingPattern = re.compile(r"\s*([^\s;,]+)\s*(?:;\s*q=([0-9.]+))?")
+
+
+def negotiate(request):
+	# "br", "gzip" or None for the uncompressed body
+	accepted = {}
+	for part in request.META.get("HTTP_ACCEPT_ENCODING", "").split(","):
+		match = codingPattern.match(part)
+		if match:
+			try:
+				accepted[match.group(1).lower()] = float(match.group(2) or 1)
+			except ValueError:
+				pass
+	for coding in ("br", "gzip"):
+		if coding == "br" and brotli is None:
+			continue
+		if accepted.get(coding, accepted.get("*", 0)) > 0:
+			return coding
+	return None
+
+
+def compress(data, coding):
+	if coding == "br":
+		return brotli.compress(data, quality=BROTLI_QUALITY)
+	if coding == "gzip":
+		return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+	return data
+
+
+def precompress(data):
+	# All variants of a body, for responses that are cached and served many times
+	bodies = {None: data, "gzip": compress(data, "gzip")}
+	if brotli is not None:
+		bodies["br"] = compress(data, "br")
+	return bodies
+
+
+def compressible(response):
+	contentType = response.get("Content-Type", "").split(";")[0].strip().lower()
+	return response.status_code == 200 and not response.streaming and contentType in COMPRESSIBLE \
+		and not response.has_header("Content-Encoding")
+
+
+class CompressionMiddleware:
+	# Compresses JSON, CSV and NDJSON responses that aren't compressed yet.
+	# Responses from collector.conditional come precompressed and are left
+	# alone. Works in both modes like RequestMetricsMiddleware.
+	sync_capable = True
+	async_capable = True
+
+	def __init__(self, get_response):
+		self.get_response = get_response
+		if asyncio.iscoroutinefunction(get_response):
+			self._is_coroutine = asyncio.coroutines._is_coroutine
+
+	def __call__(self, request):
+		if asyncio.iscoroutinefunction(self.get_response):
+			return self.__acall__(request)
+		return self.process(request, self.get_response(request))
+
+	async def __acall__(self, request):
+		return self.process(request, await self.get_response(request))
+
+	def process(self, request, response):
+		if not compressible(response) or len(response.content) < MIN_LENGTH:
+			return response
+		patch_vary_headers(response, ("Accept-Encoding",))
+		coding = negotiate(request)
+		if coding is None:
+			return response
+		response.content = compress(response.content, coding)
+		response["Content-Length"] = str(len(response.content))
+		response["Content-Encoding"] = coding
+		if response.has_header("ETag"):
+			# Different bytes, different strong validator
+			response["ETag"] = '{}-{}"'.format(response["ETag"].rstrip('"'), coding)
+		return response
@@ -0,0 +1,103 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, router
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from functools import wraps
+from .compression import compressible, negotiate, precompress
+from .models import PuzzlePiece
+from . import pseudonyms
+from . import progress
+import hashlib
+
+# ETags and a body cache for the exports and the pieces API. The tag is a hash
+# of the request and a data version read in one query from indexed maxima and
+# the progress counters, so a poll that changed nothing is answered with a 304
+# before the view runs. Bodies are cached per tag with all compressed
+# variants, so a hit neither queries nor compresses. Entries over
+# CONDITIONAL_CACHE_MAX_BYTES would be dropped by memcached anyway and aren't
+# stored.
+#
+# Writes to the exported tables have to move one of these: inserts move a max
+# id, updates bump last_modified (save(), or passed to update()).
+VERSION_SQL = """
+	SELECT
+		(SELECT MAX(last_modified) FROM collector_puzzlepiece),
+		(SELECT MAX(last_modified) FROM collector_confidentsolution),
+		(SELECT MAX(id) FROM collector_confidencetracking),
+		(SELECT MAX(id) FROM collector_badimage),
+		(SELECT MAX(id) FROM collector_rotatedimage),
+		(SELECT MAX(id) FROM collector_transcriptiondata),
+		(SELECT MAX(id) FROM collector_archivedtranscription),
+		(SELECT COALESCE(SUM(value), 0) FROM collector_progresscounter WHERE name IN (%s, %s, %s, %s))
+"""
+
+
+def dataVersion():
+	# From the database the view is going to read, see collector.dbrouting
+	with connections[router.db_for_read(PuzzlePiece)].cursor() as cursor:
+		cursor.execute(VERSION_SQL, [progress.PIECES, progress.SOLVED, progress.BAD, progress.TRANSCRIPTIONS])
+		return cursor.fetchone()
+
+
+def representationTag(request):
+	# Accept picks the DRF renderer, the pseudonym key the submitter column
+	parts = [request.get_full_path(), request.META.get("HTTP_ACCEPT", ""), pseudonyms.keyId()]
+	parts.extend(str(value) for value in dataVersion())
+	return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()[:32]
+
+
+def etagFor(tag, coding):
+	return '"{}-{}"'.format(tag, coding) if coding else '"{}"'.format(tag)
+
+
+def matches(request, tag):
+	header = request.META.get("HTTP_IF_NONE_MATCH")
+	if not header:
+		return False
+	offered = {etag.strip().replace("W/", "", 1) for etag in header.split(",")}
+	return "*" in offered or any(etagFor(tag, coding) in offered for coding in (None, "gzip", "br"))
+
+
+def conditional_response(timeout, urlNames=None):
+	# Replaces cache_page on GET views returning JSON or CSV. urlNames limits
+	# it to some routes of a viewset (not get_random).
+	def decorator(view):
+		@wraps(view)
+		def wrapped(request, *args, **kwargs):
+			match = request.resolver_match
+			if request.method not in ("GET", "HEAD") or (urlNames and (match is None or match.url_name not in urlNames)):
+				return view(request, *args, **kwargs)
+
+			tag = representationTag(request)
+			coding = negotiate(request)
+			if matches(request, tag):
+				response = HttpResponseNotModified()
+			else:
+				key = "conditional:" + tag
+				entry = cache.get(key)
+				# Read by the request metrics like a cache_page hit or miss
+				request._cache_update_cache = entry is None
+				if entry is None:
+					response = view(request, *args, **kwargs)
+					if hasattr(response, "render") and not response.is_rendered:
+						response.render()
+					if not compressible(response):
+						return response
+					entry = {
+						"headers": {name: response[name] for name in ("Content-Type", "Content-Disposition") if response.has_header(name)},
+						"bodies": precompress(response.content),
+					}
+					if sum(len(body) for body in entry["bodies"].values()) <= settings.CONDITIONAL_CACHE_MAX_BYTES:
+						cache.set(key, entry, timeout)
+				response = HttpResponse(entry["bodies"][coding])
+				for name, value in entry["headers"].items():
+					response[name] = value
+				if coding:
+					response["Content-Encoding"] = coding
+			response["ETag"] = etagFor(tag, coding)
+			patch_vary_headers(response, ("Accept", "Accept-Encoding"))
+			patch_cache_control(response, public=True, no_cache=True)
+			return response
+		return wrapped
+	return decorator
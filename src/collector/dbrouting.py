@@ -0,0 +1,108 @@
+from asgiref.local import Local
+from django.conf import settings
+from django.core.cache import cache
+from functools import wraps
+from . import UtilityOps as UtilityOps
+import asyncio
+import hashlib
+
+REPLICA_DB = "replica"
+PRIMARY_DB = "default"
+PIN_COOKIE = "pinned"
+
+# Per request (thread or coroutine) flag telling the router that the current
+# view only reads and may be served from the replica
+_state = Local()
+
+
+def replicaConfigured():
+	return REPLICA_DB in settings.DATABASES
+
+
+def _pinKey(request):
+	ip = UtilityOps.UtilityOps.GetClientIP(request) or ""
+	return "dbrouting:pinned:" + hashlib.sha256(ip.encode("utf-8")).hexdigest()
+
+
+def pinToPrimary(request):
+	# Called after a client wrote something. For the next REPLICA_LAG_SECONDS
+	# all reads by that client go to the primary, so they always see their own
+	# submission even if the replica is lagging behind. The pin travels in a
+	# signed cookie (set by PinToPrimaryMiddleware) so any worker or node sees
+	# it, and under the hashed ip in the shared cache for API clients that
+	# don't keep cookies.
+	if replicaConfigured():
+		# DRF wraps the HttpRequest the middleware gets to see
+		getattr(request, "_request", request)._pinToPrimary = True
+		cache.set(_pinKey(request), True, settings.REPLICA_LAG_SECONDS)
+
+
+def isPinnedToPrimary(request):
+	if request.get_signed_cookie(PIN_COOKIE, default=None, salt=PIN_COOKIE, max_age=settings.REPLICA_LAG_SECONDS) is not None:
+		return True
+	return cache.get(_pinKey(request)) is not None
+
+
+def replica_reads(view):
+	# Route all reads of a view to the replica. Only safe methods are routed,
+	# anything else (and any client that just wrote) stays on the primary.
+	@wraps(view)
+	def wrapped(request, *args, **kwargs):
+		if not replicaConfigured() or request.method not in ("GET", "HEAD") or isPinnedToPrimary(request):
+			return view(request, *args, **kwargs)
+		previous = getattr(_state, "use_replica", False)
+		_state.use_replica = True
+		try:
+			response = view(request, *args, **kwargs)
+			# Template responses evaluate their querysets while rendering,
+			# which would otherwise happen after we left the replica scope
+			if hasattr(response, "render") and not response.is_rendered:
+				response.render()
+			return response
+		finally:
+			_state.use_replica = previous
+	return wrapped
+
+
+class PinToPrimaryMiddleware:
+	# Hands out the cookie for pinToPrimary. Works in both modes like
+	# RequestMetricsMiddleware.
+	sync_capable = True
+	async_capable = True
+
+	def __init__(self, get_response):
+		self.get_response = get_response
+		if asyncio.iscoroutinefunction(get_response):
+			self._is_coroutine = asyncio.coroutines._is_coroutine
+
+	def __call__(self, request):
+		if asyncio.iscoroutinefunction(self.get_response):
+			return self.__acall__(request)
+		return self.process(request, self.get_response(request))
+
+	async def __acall__(self, request):
+		return self.process(request, await self.get_response(request))
+
+	def process(self, request, response):
+		if getattr(request, "_pinToPrimary", False):
+			response.set_signed_cookie(PIN_COOKIE, "1", salt=PIN_COOKIE, max_age=settings.REPLICA_LAG_SECONDS,
+				httponly=True, samesite="Lax")
+		return response
+
+
+class ReplicaRouter:
+	def db_for_read(self, model, **hints):
+		if getattr(_state, "use_replica", False) and replicaConfigured():
+			return REPLICA_DB
+		return PRIMARY_DB
+
+	def db_for_write(self, model, **hints):
+		return PRIMARY_DB
+
+	def allow_relation(self, obj1, obj2, **hints):
+		# Both aliases hold the same data
+		return True
+
+	def allow_migrate(self, db, app_label, model_name=None, **hints):
+		# The replica receives its schema through replication
+		return db != REPLICA_DB
@@ -0,0 +1,108 @@
+from django.conf import settings
+from io import BytesIO
+from PIL import Image, ImageOps
+import hashlib
+import os
+import requests
+import tempfile
+
+# Screenshots are a few MB at most, anything bigger is not a puzzle piece
+MAX_IMAGE_BYTES = 20 * 1024 * 1024
+FETCH_TIMEOUT = 10
+
+
+def fetchImage(session, url, timeout=FETCH_TIMEOUT):
+	# Returns the raw image bytes, or None if the image could not be fetched
+	try:
+		with session.get(url, timeout=timeout, stream=True) as response:
+			if response.status_code != 200:
+				return None
+			data = BytesIO()
+			for chunk in response.iter_content(64 * 1024):
+				data.write(chunk)
+				if data.tell() > MAX_IMAGE_BYTES:
+					return None
+			return data.getvalue()
+	except requests.RequestException:
+		return None
+
+
+def differenceHash(data):
+	# 64 bit dHash: shrink to 9x8 greyscale and record whether each pixel is
+	# brighter than its right neighbour. Survives rescaling and recompression,
+	# which is what happens when a screenshot is uploaded somewhere else.
+	image = Image.open(BytesIO(data))
+	image = image.convert("L").resize((9, 8), Image.LANCZOS)
+	pixels = list(image.getdata())
+	value = 0
+	for row in range(8):
+		for col in range(8):
+			value = (value << 1) | (1 if pixels[row * 9 + col] > pixels[row * 9 + col + 1] else 0)
+	return "{:016x}".format(value)
+
+
+def normalizeImage(data, maxSize):
+	# Upright (EXIF orientation applied), at most maxSize pixels on the long
+	# side, progressive JPEG. Usually a fraction of the original PNG.
+	image = Image.open(BytesIO(data))
+	image = ImageOps.exif_transpose(image)
+	image = image.convert("RGB")
+	image.thumbnail((maxSize, maxSize), Image.LANCZOS)
+	output = BytesIO()
+	image.save(output, "JPEG", quality=85, optimize=True, progressive=True)
+	return output.getvalue()
+
+
+def cachedImagePath(name):
+	# Spread the files over 256 directories, two hex digits each
+	return os.path.join(settings.IMAGE_CACHE_ROOT, name[:2], name)
+
+
+def storeCachedImage(data):
+	# Content addressed: the name is the hash of the bytes, so a stored file
+	# never changes and identical images are only stored once
+	name = hashlib.sha256(data).hexdigest() + ".jpg"
+	path = cachedImagePath(name)
+	if not os.path.exists(path):
+		os.makedirs(os.path.dirname(path), exist_ok=True)
+		fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+		with os.fdopen(fd, "wb") as outfile:
+			outfile.write(data)
+		os.chmod(tmp, 0o644)
+		os.replace(tmp, path)
+	return name
+
+
+def hammingDistance(a, b):
+	return bin(int(a, 16) ^ int(b, 16)).count("1")
+
+
+class MultiIndexHash:
+	# Near-duplicate lookup over 64 bit hashes. The hash is split into
+	# maxDistance + 1 chunks; two hashes within maxDistance bits of each other
+	# agree exactly on at least one chunk, so a query only has to look at the
+	# entries sharing a chunk with it instead of every stored hash.
+	def __init__(self, maxDistance=3):
+		self.maxDistance = maxDistance
+		self.chunks = maxDistance + 1
+		self.bits = 64 // self.chunks
+		self._tables = [{} for _ in range(self.chunks)]
+
+	def _keys(self, value):
+		value = int(value, 16)
+		mask = (1 << self.bits) - 1
+		return [(value >> (i * self.bits)) & mask for i in range(self.chunks)]
+
+	def add(self, value, item):
+		for table, key in zip(self._tables, self._keys(value)):
+			table.setdefault(key, []).append((value, item))
+
+	def find(self, value):
+		# Returns (distance, item) of the closest stored hash, or None
+		best = None
+		for table, key in zip(self._tables, self._keys(value)):
+			for other, item in table.get(key, ()):
+				distance = hammingDistance(value, other)
+				if distance <= self.maxDistance and (best is None or distance < best[0]):
+					best = (distance, item)
+		return best
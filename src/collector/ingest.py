@@ -0,0 +1,110 @@
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .models import TranscriptionData, TranscriptionRawData
+from . import progress
+from . import stats
+import json
+import sqlite3
+import threading
+
+# Write-behind queue for transcriptions. With INGEST_QUEUE_PATH set the
+# submission views only validate and append to a local SQLite file (WAL,
+# fsync on commit), the flushingest command moves them into the database in
+# batches. A submission leaves the queue only after it is in the database and
+# its piece was re-evaluated, so a crash anywhere means it is flushed again.
+# (puzzlePiece, ip_address) is the idempotency key: one vote per person and
+# piece, a flush skips submissions the database already has.
+FIELDS = [
+	"puzzlePiece_id", "ip_address", "bad_image", "orientation", "datahash", "center",
+	"wall1", "wall2", "wall3", "wall4", "wall5", "wall6",
+	"link1", "link2", "link3", "link4", "link5", "link6",
+]
+
+_local = threading.local()
+
+
+def enabled():
+	return bool(settings.INGEST_QUEUE_PATH)
+
+
+def _connection():
+	path = settings.INGEST_QUEUE_PATH
+	if getattr(_local, "path", None) != path:
+		connection = sqlite3.connect(path, timeout=30, isolation_level=None)
+		connection.execute("PRAGMA journal_mode=WAL")
+		connection.execute("PRAGMA synchronous=FULL")
+		connection.execute("""
+			CREATE TABLE IF NOT EXISTS submissions (
+				id INTEGER PRIMARY KEY AUTOINCREMENT,
+				piece INTEGER NOT NULL,
+				ip TEXT NOT NULL,
+				payload TEXT NOT NULL,
+				UNIQUE (piece, ip)
+			)""")
+		_local.connection = connection
+		_local.path = path
+	return _local.connection
+
+
+def enqueue(transcription, rawText):
+	# False if this person already has a submission for the piece queued
+	# Keeps the time of the submission, not of the flush
+	transcription.submitted_date = timezone.now()
+	payload = {field: getattr(transcription, field) for field in FIELDS}
+	payload["raw"] = rawText
+	payload["submitted"] = transcription.submitted_date.isoformat()
+	cursor = _connection().execute(
+		"INSERT OR IGNORE INTO submissions (piece, ip, payload) VALUES (?, ?, ?)",
+		(transcription.puzzlePiece_id, transcription.ip_address, json.dumps(payload)))
+	return cursor.rowcount == 1
+
+
+def pending():
+	return _connection().execute("SELECT COUNT(*) FROM submissions").fetchone()[0]
+
+
+def flushBatch(batchSize, reevaluate):
+	# Moves up to batchSize queued submissions into the database, calls
+	# reevaluate(pieceId) for every piece that got one. Returns how many left
+	# the queue.
+	connection = _connection()
+	rows = connection.execute("SELECT id, payload FROM submissions ORDER BY id LIMIT ?", (batchSize,)).fetchall()
+	if not rows:
+		return 0
+	queued = [(id, json.loads(payload)) for id, payload in rows]
+
+	with transaction.atomic():
+		pieces = {data["puzzlePiece_id"] for _, data in queued}
+		ips = {data["ip_address"] for _, data in queued}
+		known = set(TranscriptionData.objects.filter(puzzlePiece_id__in=pieces, ip_address__in=ips)
+			.values_list("puzzlePiece_id", "ip_address"))
+		fresh = [data for _, data in queued if (data["puzzlePiece_id"], data["ip_address"]) not in known]
+
+		TranscriptionData.objects.bulk_create(
+			[TranscriptionData(**{field: data[field] for field in FIELDS}) for data in fresh],
+			batch_size=batchSize)
+		# MySQL doesn't hand back the ids of a bulk insert
+		ids = {}
+		if fresh:
+			ids = {(piece, ip): id for id, piece, ip in TranscriptionData.objects
+				.filter(puzzlePiece_id__in={data["puzzlePiece_id"] for data in fresh}, ip_address__in={data["ip_address"] for data in fresh})
+				.values_list("id", "puzzlePiece_id", "ip_address")}
+		# auto_now stamped them with the time of the flush, bulk_update leaves
+		# it alone. Submissions queued before this was stored keep that.
+		TranscriptionData.objects.bulk_update(
+			[TranscriptionData(id=ids[(data["puzzlePiece_id"], data["ip_address"])], submitted_date=parse_datetime(data["submitted"]))
+				for data in fresh if "submitted" in data],
+			["submitted_date"], batch_size=batchSize)
+		for data in fresh:
+			if data["raw"] is not None:
+				TranscriptionRawData.store(TranscriptionData(id=ids[(data["puzzlePiece_id"], data["ip_address"])]), data["raw"])
+			stats.recordTranscription(data["ip_address"], data["bad_image"])
+		if fresh:
+			progress.transcriptionSubmitted(len(fresh))
+
+	for pieceId in sorted(pieces):
+		reevaluate(pieceId)
+	connection.execute("DELETE FROM submissions WHERE id <= ?", (queued[-1][0],))
+	return len(queued)
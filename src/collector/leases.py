@@ -0,0 +1,62 @@
+from django.conf import settings
+from django.core.cache import cache
+import time
+
+# Short lived reservations for pieces handed out by the queue, so a crowd of
+# transcribers spreads over the candidates instead of overshooting the same
+# few. A piece has LEASE_SLOTS cache entries, each taken with cache.add, so
+# two requests never end up with the same one. Every transcriber holds at most
+# one lease, recorded under their hashed ip: taking a new piece gives back the
+# old one, and refreshing the page doesn't count twice. Entries expire on
+# their own, nothing ever has to sweep.
+
+
+def _slotKey(puzzlepieceId, slot):
+	return "lease:{}:{}".format(puzzlepieceId, slot)
+
+
+def _clientKey(client):
+	return "lease:client:{}".format(client)
+
+
+def inFlight(puzzlepieceIds):
+	# {id: number of open leases} for all given pieces in one cache round trip
+	slots = range(settings.LEASE_SLOTS)
+	found = cache.get_many([_slotKey(i, slot) for i in puzzlepieceIds for slot in slots])
+	return {i: sum(1 for slot in slots if _slotKey(i, slot) in found) for i in puzzlepieceIds}
+
+
+def lease(puzzlepieceId, client):
+	now = time.time()
+	held = cache.get(_clientKey(client))
+	if held is not None:
+		if held[0] == puzzlepieceId and now < held[2] - 1:
+			# Same piece again, keep the slot for another LEASE_SECONDS
+			cache.set(_slotKey(puzzlepieceId, held[1]), client, settings.LEASE_SECONDS)
+			_remember(client, puzzlepieceId, held[1], now)
+			return
+		_drop(client, held, now)
+	for slot in range(settings.LEASE_SLOTS):
+		if cache.add(_slotKey(puzzlepieceId, slot), client, settings.LEASE_SECONDS):
+			_remember(client, puzzlepieceId, slot, now)
+			return
+	# Every slot is taken, the piece is covered many times over already
+
+
+def release(puzzlepieceId, client):
+	# A transcription came in, give back this transcriber's lease on the piece
+	held = cache.get(_clientKey(client))
+	if held is not None and held[0] == puzzlepieceId:
+		_drop(client, held, time.time())
+
+
+def _remember(client, puzzlepieceId, slot, now):
+	cache.set(_clientKey(client), (puzzlepieceId, slot, now + settings.LEASE_SECONDS), settings.LEASE_SECONDS)
+
+
+def _drop(client, held, now):
+	puzzlepieceId, slot, expiry = held
+	cache.delete(_clientKey(client))
+	# Once it expired the slot may belong to someone else, leave it alone then
+	if now < expiry - 1:
+		cache.delete(_slotKey(puzzlepieceId, slot))
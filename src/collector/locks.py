@@ -0,0 +1,83 @@
+from contextlib import contextmanager
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from .models import PuzzlePiece
+import time
+import uuid
+
+# Per-piece lock for recomputing confidence, shared by all web nodes. On
+# MySQL a named lock (GET_LOCK), held by the connection and gone with it if
+# the process dies. Other databases fall back to a cache entry that expires
+# after PIECE_LOCK_SECONDS, which needs a shared cache with several nodes.
+#
+# Whoever doesn't get the lock leaves a dirty flag instead and the holder
+# recomputes once more, so a burst of submissions for one piece costs two
+# recomputations instead of one each. The flag is a column on the piece, so
+# the holder sees it whichever node set it, even with a per-process cache.
+
+
+def _name(puzzlepieceId):
+	return "puzzlepieces:confidence:{}".format(puzzlepieceId)
+
+
+def _markDirty(puzzlepieceId):
+	PuzzlePiece.objects.filter(id=puzzlepieceId).update(confidenceDirty=True)
+
+
+def _isDirty(puzzlepieceId):
+	return PuzzlePiece.objects.filter(id=puzzlepieceId, confidenceDirty=True).exists()
+
+
+def _takeDirty(puzzlepieceId):
+	# Clears the flag, True if it was set. One statement, so two holders in a
+	# row can't both take the same request.
+	return PuzzlePiece.objects.filter(id=puzzlepieceId, confidenceDirty=True).update(confidenceDirty=False) > 0
+
+
+@contextmanager
+def pieceLock(puzzlepieceId):
+	# Yields whether the lock was acquired within PIECE_LOCK_WAIT seconds
+	name = _name(puzzlepieceId)
+	if connection.vendor == "mysql":
+		with connection.cursor() as cursor:
+			cursor.execute("SELECT GET_LOCK(%s, %s)", [name, settings.PIECE_LOCK_WAIT])
+			acquired = cursor.fetchone()[0] == 1
+		try:
+			yield acquired
+		finally:
+			if acquired:
+				with connection.cursor() as cursor:
+					cursor.execute("SELECT RELEASE_LOCK(%s)", [name])
+		return
+
+	token = uuid.uuid4().hex
+	deadline = time.monotonic() + settings.PIECE_LOCK_WAIT
+	acquired = cache.add(name, token, settings.PIECE_LOCK_SECONDS)
+	while not acquired and time.monotonic() < deadline:
+		time.sleep(0.05)
+		acquired = cache.add(name, token, settings.PIECE_LOCK_SECONDS)
+	try:
+		yield acquired
+	finally:
+		# Not if it expired and someone else has it by now
+		if acquired and cache.get(name) == token:
+			cache.delete(name)
+
+
+def coalesced(puzzlepieceId, work):
+	# Runs work(puzzlepieceId) under the piece lock until nobody asked for it
+	# again. A caller that can't get the lock returns right away, the holder
+	# picks up its request.
+	_markDirty(puzzlepieceId)
+	while True:
+		with pieceLock(puzzlepieceId) as acquired:
+			if not acquired:
+				return
+			# Cleared before the work starts, a request arriving during it
+			# sets the flag again and gets another round
+			while _takeDirty(puzzlepieceId):
+				work(puzzlepieceId)
+		# Someone may have given up on the lock right before we let go
+		if not _isDirty(puzzlepieceId):
+			return
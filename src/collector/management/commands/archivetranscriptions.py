@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from collector.archive import archiveBatch
+import time
+
+
+class Command(BaseCommand):
+	help = "Move transcriptions of solved and bad pieces out of the live table into the archive"
+
+	def add_arguments(self, parser):
+		parser.add_argument("--batch", type=int, default=1000, help="transcriptions moved per transaction")
+		parser.add_argument("--limit", type=int, default=0, help="stop after this many, 0 for all")
+		parser.add_argument("--pause", type=float, default=0.1, help="seconds between batches, leaves room for live traffic")
+
+	def handle(self, *args, **options):
+		moved = 0
+		while not options["limit"] or moved < options["limit"]:
+			batch = options["batch"]
+			if options["limit"]:
+				batch = min(batch, options["limit"] - moved)
+			count = archiveBatch(batch)
+			moved += count
+			if count < batch:
+				break
+			time.sleep(options["pause"])
+		self.stdout.write("archived {} transcriptions".format(moved))
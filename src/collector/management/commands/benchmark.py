@@ -0,0 +1,172 @@
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings
+from collector.models import PuzzlePiece, TranscriptionData, ConfidentSolution
+from collector.solver import piecesFromCSV
+from .seedbench import DEFAULT_CSV
+import itertools
+import json
+import random
+import threading
+import time
+
+SYMBOL_NAMES = {"B": "Blank", "P": "Plus", "C": "Clover", "H": "Hex", "S": "Snake", "D": "Diamond", "T": "Cauldron"}
+
+
+def submissionText(layout):
+	openings = ",".join(str(i + 1) for i in range(6) if not layout.walls[i]) or "1"
+	return "{} {} {}".format(SYMBOL_NAMES.get(layout.center, "Blank"), openings, " ".join(layout.links))
+
+
+def percentile(values, q):
+	# Nearest rank on an already sorted list
+	if not values:
+		return 0
+	return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class Command(BaseCommand):
+	help = "Drive the hot paths with concurrent clients and report latency, throughput and query counts as JSON"
+
+	scenarios = [
+		"transcribe",
+		"processTranscription",
+		"apiPieces",
+		"getRandom",
+		"exportVerifiedCSV",
+		"exportPiecesCSV",
+		"exportTranscriptionsCSV",
+	]
+
+	def add_arguments(self, parser):
+		parser.add_argument("--scenario", action="append", choices=self.scenarios, help="run only this scenario, can be repeated")
+		parser.add_argument("--clients", type=int, default=8, help="concurrent clients")
+		parser.add_argument("--requests", type=int, default=200, help="requests per scenario")
+		parser.add_argument("--cold", action="store_true", help="clear the cache before every request, measuring cache misses")
+		parser.add_argument("--csv", default=DEFAULT_CSV, help="verified.csv export to build submissions from")
+		parser.add_argument("--output", help="write the JSON report to this file instead of stdout")
+		parser.add_argument("--seed", type=int, default=2020)
+
+	def handle(self, *args, **options):
+		self.rng = random.Random(options["seed"])
+		self.rngLock = threading.Lock()
+		try:
+			self.layouts = list(piecesFromCSV(options["csv"]))
+		except OSError as ex:
+			raise CommandError(str(ex))
+		self.pieceCount = PuzzlePiece.objects.count()
+		if not self.pieceCount:
+			raise CommandError("No puzzle pieces, run seedbench first")
+		self.openPieces = list(PuzzlePiece.objects.exclude(
+			id__in=ConfidentSolution.objects.values("puzzlePiece_id")).values_list("id", flat=True)[:10000])
+
+		report = {
+			"database": connection.vendor,
+			"pieces": self.pieceCount,
+			"transcriptions": TranscriptionData.objects.count(),
+			"clients": options["clients"],
+			"cold": options["cold"],
+			"scenarios": {},
+		}
+		# The benchmark clients would hit the per-ip rate limits immediately
+		with override_settings(RATE_LIMITS_ENABLED=False):
+			for scenario in options["scenario"] or self.scenarios:
+				self.stderr.write("running {}".format(scenario))
+				report["scenarios"][scenario] = self.run(scenario, options["clients"], options["requests"], options["cold"])
+
+		output = json.dumps(report, indent=2)
+		if options["output"]:
+			with open(options["output"], "w") as outfile:
+				outfile.write(output + "\n")
+		else:
+			self.stdout.write(output)
+
+	def request(self, client, scenario):
+		with self.rngLock:
+			pieceId = self.rng.choice(self.openPieces) if self.openPieces else 1
+			layout = self.rng.choice(self.layouts)
+			offset = self.rng.randrange(max(1, self.pieceCount - 100))
+		if scenario == "transcribe":
+			return client.get("/transcribe")
+		if scenario == "processTranscription":
+			return client.post("/transcribe/{}".format(pieceId), {"data": submissionText(layout)})
+		if scenario == "apiPieces":
+			return client.get("/api/pieces/", {"limit": 100, "offset": offset})
+		if scenario == "getRandom":
+			return client.get("/api/pieces/get_random/")
+		if scenario == "exportVerifiedCSV":
+			return client.get("/export/verified/csv")
+		if scenario == "exportPiecesCSV":
+			return client.get("/export/pieces/csv")
+		if scenario == "exportTranscriptionsCSV":
+			return client.get("/export/transcriptions/csv")
+
+	def run(self, scenario, clients, requests, cold):
+		counter = itertools.count()
+		latencies = []
+		queries = []
+		errors = []
+		lock = threading.Lock()
+
+		def worker(number):
+			# Every client looks like a different person
+			client = Client(REMOTE_ADDR="10.{}.{}.{}".format(number // 65536 % 256, number // 256 % 256, number % 256))
+			executed = [0]
+
+			def countQueries(execute, sql, params, many, context):
+				executed[0] += 1
+				return execute(sql, params, many, context)
+
+			try:
+				with connection.execute_wrapper(countQueries):
+					while next(counter) < requests:
+						if cold:
+							cache.clear()
+						executed[0] = 0
+						start = time.perf_counter()
+						try:
+							response = self.request(client, scenario)
+							# Streaming responses only do their work when consumed
+							if response.streaming:
+								b"".join(response.streaming_content)
+							failed = response.status_code >= 500
+						except Exception:
+							failed = True
+						elapsed = time.perf_counter() - start
+						with lock:
+							latencies.append(elapsed)
+							queries.append(executed[0])
+							if failed:
+								errors.append(elapsed)
+			finally:
+				connection.close()
+
+		start = time.perf_counter()
+		threads = [threading.Thread(target=worker, args=(i,)) for i in range(clients)]
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+		wall = time.perf_counter() - start
+
+		latencies.sort()
+		queries.sort()
+		return {
+			"requests": len(latencies),
+			"errors": len(errors),
+			"seconds": round(wall, 4),
+			"throughput": round(len(latencies) / wall, 2) if wall else 0,
+			"latency_ms": {
+				"mean": round(1000 * sum(latencies) / len(latencies), 3) if latencies else 0,
+				"p50": round(1000 * percentile(latencies, 0.50), 3),
+				"p95": round(1000 * percentile(latencies, 0.95), 3),
+				"p99": round(1000 * percentile(latencies, 0.99), 3),
+				"max": round(1000 * latencies[-1], 3) if latencies else 0,
+			},
+			"queries": {
+				"mean": round(sum(queries) / len(queries), 2) if queries else 0,
+				"max": queries[-1] if queries else 0,
+			},
+		}
@@ -0,0 +1,55 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+from collector.imaging import fetchImage, normalizeImage, storeCachedImage
+from collector.models import PuzzlePiece, ConfidentSolution, BadImage
+import datetime
+import requests
+import time
+
+# Stored for images that could be fetched but not decoded, so they are not retried
+UNREADABLE = "-"
+
+
+class Command(BaseCommand):
+	help = "Fetch queued images once and keep a normalized copy on local disk for the transcription page"
+
+	def add_arguments(self, parser):
+		parser.add_argument("--limit", type=int, default=500, help="images to fetch per run")
+		parser.add_argument("--follow", type=int, default=0, metavar="SECONDS", help="keep running, checking for new images every SECONDS")
+		parser.add_argument("--retry", type=int, default=1, metavar="HOURS", help="wait HOURS before fetching an image that failed again")
+
+	def handle(self, *args, **options):
+		session = requests.Session()
+		while True:
+			cached = self.process(session, options["limit"], datetime.timedelta(hours=options["retry"]))
+			self.stdout.write("cached {} images".format(cached))
+			if not options["follow"]:
+				break
+			if cached < options["limit"]:
+				time.sleep(options["follow"])
+
+	def process(self, session, limit, retry=datetime.timedelta(hours=1)):
+		# Same order as the transcription queue, so the images served next are
+		# cached first. Images that failed to fetch sit out retry, or they would
+		# be first again on every run and hold up the rest.
+		now = timezone.now()
+		pending = PuzzlePiece.objects.filter(approved=True, cachedImage="", deadLink=False) \
+			.filter(Q(cacheAttempted__isnull=True) | Q(cacheAttempted__lt=now - retry)) \
+			.exclude(id__in=ConfidentSolution.objects.values("puzzlePiece_id")) \
+			.exclude(id__in=BadImage.objects.values("puzzlePiece_id")) \
+			.order_by("-priority", "-transCount")[:limit]
+		cached = 0
+		for piece in pending:
+			data = fetchImage(session, piece.url)
+			if data is None:
+				PuzzlePiece.objects.filter(id=piece.id).update(cacheAttempted=now)
+				continue
+			try:
+				piece.cachedImage = storeCachedImage(normalizeImage(data, settings.IMAGE_CACHE_MAX_SIZE))
+				cached += 1
+			except Exception:
+				piece.cachedImage = UNREADABLE
+			piece.save(update_fields=["cachedImage"])
+		return cached
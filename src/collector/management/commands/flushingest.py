@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+from collector import ingest
+from collector.views import determineConfidence
+import time
+
+
+class Command(BaseCommand):
+	help = "Move queued transcriptions from the ingest queue (INGEST_QUEUE_PATH) into the database"
+
+	def add_arguments(self, parser):
+		parser.add_argument("--batch", type=int, default=500, help="submissions per transaction")
+		parser.add_argument("--interval", type=float, default=1.0, help="seconds to wait when the queue is empty")
+		parser.add_argument("--once", action="store_true", help="exit once the queue is empty instead of waiting for more")
+
+	def handle(self, *args, **options):
+		if not ingest.enabled():
+			raise CommandError("INGEST_QUEUE_PATH is not set")
+		# One flusher per queue file, batches are taken from the front
+		flushed = 0
+		while True:
+			count = ingest.flushBatch(options["batch"], determineConfidence)
+			flushed += count
+			if count:
+				self.stdout.write("flushed {} transcriptions".format(count))
+			elif options["once"]:
+				break
+			else:
+				time.sleep(options["interval"])
+		self.stdout.write("flushed {} transcriptions in total".format(flushed))
@@ -0,0 +1,151 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from collector.models import PuzzlePiece
+from collector.testing import StubHTTPServer
+from .benchmark import percentile
+import asyncio
+import httpx
+import itertools
+import json
+import os
+import re
+import shlex
+import socket
+import subprocess
+import sys
+import time
+
+# Submissions point at this made up path, so they can be cleaned up after
+URL_PREFIX = "http://i.imgur.com/loadtest-"
+csrfPattern = re.compile(r'name="csrfmiddlewaretoken" value="([^"]+)"')
+
+
+def freePort():
+	with socket.socket() as sock:
+		sock.bind(("127.0.0.1", 0))
+		return sock.getsockname()[1]
+
+
+class Command(BaseCommand):
+	help = "Compare piece submissions per second under WSGI and ASGI while the image hosts are slow"
+
+	modes = ["wsgi", "asgi"]
+
+	def add_arguments(self, parser):
+		parser.add_argument("--mode", action="append", choices=self.modes, help="run only this mode, can be repeated")
+		parser.add_argument("--delay", type=float, default=0.5, help="seconds the stub image host takes to answer")
+		parser.add_argument("--workers", type=int, default=5, help="server processes, production runs 5")
+		parser.add_argument("--clients", type=int, default=50, help="concurrent clients")
+		parser.add_argument("--requests", type=int, default=500, help="submissions per mode")
+		parser.add_argument("--wsgi-command", default="uwsgi --http-socket 127.0.0.1:{port} --processes {workers} --module puzzlepieces.wsgi:application --master --disable-logging --die-on-term",
+			help="starts the WSGI server, {port} and {workers} are filled in")
+		parser.add_argument("--asgi-command", default="uvicorn puzzlepieces.asgi:application --host 127.0.0.1 --port {port} --workers {workers} --no-access-log",
+			help="starts the ASGI server, {port} and {workers} are filled in")
+		parser.add_argument("--output", help="write the JSON report to this file instead of stdout")
+
+	def handle(self, *args, **options):
+		report = {
+			"database": settings.DATABASES["default"]["ENGINE"],
+			"upstreamDelay": options["delay"],
+			"workers": options["workers"],
+			"clients": options["clients"],
+			"modes": {},
+		}
+		# The stub stands in for every image host: the servers send their
+		# outbound requests through it as their HTTP proxy
+		with StubHTTPServer(delay=options["delay"], default=(200, "image/png", b"")) as stub:
+			try:
+				for mode in options["mode"] or self.modes:
+					self.stderr.write("running {}".format(mode))
+					report["modes"][mode] = self.run(mode, options[mode + "_command"], stub, options)
+			finally:
+				PuzzlePiece.objects.filter(url__startswith=URL_PREFIX).delete()
+
+		output = json.dumps(report, indent=2)
+		if options["output"]:
+			with open(options["output"], "w") as outfile:
+				outfile.write(output + "\n")
+		else:
+			self.stdout.write(output)
+
+	def run(self, mode, command, stub, options):
+		port = freePort()
+		env = dict(os.environ)
+		env.update({
+			"HTTP_PROXY": stub.url(""),
+			"http_proxy": stub.url(""),
+			"NO_PROXY": "",
+			"no_proxy": "",
+			# Every client comes from 127.0.0.1
+			"RATE_LIMITS_ENABLED": "0",
+			"PYTHONPATH": os.pathsep.join(sys.path),
+		})
+		args = shlex.split(command.format(port=port, workers=options["workers"]))
+		try:
+			server = subprocess.Popen(args, cwd=settings.BASE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+		except OSError as ex:
+			raise CommandError("Could not start {}: {}".format(args[0], ex))
+		try:
+			return asyncio.run(self.load("http://127.0.0.1:{}".format(port), server, options["clients"], options["requests"]))
+		finally:
+			server.terminate()
+			server.wait()
+
+	async def load(self, base, server, clients, requests):
+		async with httpx.AsyncClient(base_url=base, timeout=60, trust_env=False) as probe:
+			deadline = time.monotonic() + 30
+			while True:
+				if server.poll() is not None:
+					raise CommandError("The server exited with {}".format(server.returncode))
+				try:
+					await probe.get("/puzzlepieces/submit")
+					break
+				except httpx.TransportError:
+					if time.monotonic() > deadline:
+						raise CommandError("The server did not come up within 30 seconds")
+					await asyncio.sleep(0.2)
+
+		counter = itertools.count()
+		latencies = []
+		failures = []
+
+		async def client():
+			# uwsgi's http-socket doesn't do keep-alive, a new connection per
+			# request keeps both servers on equal terms
+			async with httpx.AsyncClient(base_url=base, timeout=60, headers={"Connection": "close"}, trust_env=False) as http:
+				form = await http.get("/puzzlepieces/submit")
+				token = csrfPattern.search(form.text).group(1)
+				while True:
+					number = next(counter)
+					if number >= requests:
+						return
+					start = time.perf_counter()
+					try:
+						response = await http.post("/puzzlepieces/submit", data={
+							"csrfmiddlewaretoken": token,
+							"url": "{}{}-{}.png".format(URL_PREFIX, time.time_ns(), number),
+						})
+						ok = response.status_code == 200 and "submitted successfully" in response.text
+					except httpx.HTTPError:
+						ok = False
+					elapsed = time.perf_counter() - start
+					latencies.append(elapsed)
+					if not ok:
+						failures.append(elapsed)
+
+		start = time.perf_counter()
+		await asyncio.gather(*[client() for _ in range(clients)])
+		wall = time.perf_counter() - start
+
+		latencies.sort()
+		return {
+			"requests": len(latencies),
+			"failures": len(failures),
+			"seconds": round(wall, 3),
+			"throughput": round(len(latencies) / wall, 2) if wall else 0,
+			"latency_ms": {
+				"p50": round(1000 * percentile(latencies, 0.50), 1),
+				"p95": round(1000 * percentile(latencies, 0.95), 1),
+				"max": round(1000 * latencies[-1], 1) if latencies else 0,
+			},
+		}
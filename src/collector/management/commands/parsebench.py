@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand
+from collector.parsing import parseSubmission, ParseError
+from collector.testing import legacyParse
+import json
+import time
+
+
+def timePerCall(func, text, minimum=0.2):
+	# Microseconds per call, repeating until minimum seconds have passed
+	calls = 0
+	start = time.perf_counter()
+	while True:
+		for _ in range(100):
+			try:
+				func(text)
+			except ParseError:
+				pass
+		calls += 100
+		elapsed = time.perf_counter() - start
+		if elapsed >= minimum:
+			return 1e6 * elapsed / calls
+
+
+class Command(BaseCommand):
+	help = "Time the transcription parser and the old regex on normal and adversarial input"
+
+	def add_arguments(self, parser):
+		parser.add_argument("--adversarial-length", type=int, default=20000, help="length of the adversarial inputs")
+
+	def handle(self, *args, **options):
+		self.benchmark(options["adversarial_length"])
+
+	def benchmark(self, length):
+		typical = {
+			"short text": "Blank 1,4 BPCHSDT BPCHSDT BPCHSDT BPCHSDT BPCHSDT BPCHSDT",
+			"long text": " Cauldron 1 , 2 , 3 , 4 , 5 , 6  BPCHSDT  BPCHSDT  BPCHSDT  BPCHSDT  BPCHSDT  BPCHSDT ",
+			"json": json.dumps({"center": "B", "walls": [True, False, True, True, False, True], "nodes": [list("BPCHSDT")] * 6}),
+			"invalid": "Blank 1,4 BPCHSDT BPCHSDT BPCHSDT BPCHSDT BPCHSDT BPCHSDX",
+		}
+		# Worst cases for the old regex: lots of whitespace where the nested
+		# quantifiers can split it many ways, failing at the very end
+		adversarial = {
+			"whitespace before links": "B 1" + " " * length + "BPCHSDT" * 5 + "BPCHSD!",
+			"whitespace between links": "B 1 " + (" " * (length // 6) + "BPCHSDT") * 6 + "!",
+			"long garbage": "B" * length,
+		}
+		self.stdout.write("{:<28} {:>14} {:>14}".format("input", "parser us", "legacy us"))
+		for name, text in list(typical.items()) + list(adversarial.items()):
+			minimum = 0.2 if name in typical else 0.05
+			self.stdout.write("{:<28} {:>14.2f} {:>14.2f}".format(
+				name, timePerCall(parseSubmission, text, minimum), timePerCall(legacyParse, text, minimum)))
@@ -0,0 +1,69 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F, Q
+from django.utils import timezone
+from collector.imaging import MultiIndexHash, differenceHash, fetchImage
+from collector.models import PuzzlePiece
+import datetime
+import requests
+import time
+
+# Stored for images that could be fetched but not decoded, so they are not retried
+UNREADABLE = "-"
+
+
+class Command(BaseCommand):
+	help = "Fetch approved images once, store their perceptual hash and link re-uploads of the same screenshot"
+
+	def add_arguments(self, parser):
+		parser.add_argument("--limit", type=int, default=500, help="images to fetch per run")
+		parser.add_argument("--distance", type=int, default=3, help="max hamming distance for two images to count as the same")
+		parser.add_argument("--follow", type=int, default=0, metavar="SECONDS", help="keep running, checking for new images every SECONDS")
+		parser.add_argument("--retry", type=int, default=6, metavar="HOURS", help="wait HOURS before fetching an image that failed again")
+
+	def handle(self, *args, **options):
+		index = MultiIndexHash(options["distance"])
+		known = PuzzlePiece.objects.exclude(phash__in=["", UNREADABLE]).values_list("id", "phash", "duplicateOf_id")
+		for pieceId, phash, duplicateOf in known.iterator():
+			index.add(phash, duplicateOf or pieceId)
+
+		session = requests.Session()
+		while True:
+			hashed, duplicates = self.process(session, index, options["limit"], datetime.timedelta(hours=options["retry"]))
+			self.stdout.write("hashed {} images, {} duplicates".format(hashed, duplicates))
+			if not options["follow"]:
+				break
+			if hashed < options["limit"]:
+				time.sleep(options["follow"])
+
+	def process(self, session, index, limit, retry=datetime.timedelta(hours=6)):
+		# Images that failed to fetch wait out retry, and then come after the
+		# ones never tried, so a dead host can't hold up the rest
+		now = timezone.now()
+		pending = PuzzlePiece.objects.filter(approved=True, phash="") \
+			.filter(Q(phashAttempted__isnull=True) | Q(phashAttempted__lt=now - retry)) \
+			.order_by(F("phashAttempted").asc(nulls_first=True), "id")[:limit]
+		hashed = 0
+		duplicates = 0
+		for piece in pending:
+			data = fetchImage(session, piece.url)
+			if data is None:
+				# Host unreachable right now, try again later
+				PuzzlePiece.objects.filter(id=piece.id).update(phashAttempted=now)
+				continue
+			try:
+				piece.phash = differenceHash(data)
+			except Exception:
+				piece.phash = UNREADABLE
+				piece.save(update_fields=["phash", "last_modified"])
+				continue
+			hashed += 1
+
+			match = index.find(piece.phash)
+			if match:
+				# Keep it around, but out of the queue
+				piece.duplicateOf_id = match[1]
+				piece.priority = 0
+				duplicates += 1
+			index.add(piece.phash, piece.duplicateOf_id or piece.id)
+			piece.save(update_fields=["phash", "duplicateOf", "priority", "last_modified"])
+		return hashed, duplicates
@@ -0,0 +1,31 @@
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+from collector import progress
+from collector.models import PuzzlePiece, ConfidentSolution, BadImage, TranscriptionData, ArchivedTranscription, ProgressCounter
+
+
+class Command(BaseCommand):
+	help = "Recount the progress counters from the tables, once after deploying or after manual changes"
+
+	def handle(self, *args, **options):
+		counters = {
+			progress.PIECES: PuzzlePiece.objects.count(),
+			progress.SOLVED: ConfidentSolution.objects.values("puzzlePiece_id").distinct().count(),
+			progress.BAD: BadImage.objects.values("puzzlePiece_id").distinct().count(),
+			progress.TRANSCRIPTIONS: TranscriptionData.objects.count() + ArchivedTranscription.objects.count(),
+		}
+		for model in (TranscriptionData, ArchivedTranscription):
+			perDay = model.objects.annotate(day=TruncDate("submitted_date")).values("day").annotate(total=Count("id"))
+			for row in perDay:
+				name = progress.dailyCounter(progress.TRANSCRIPTIONS, row["day"])
+				counters[name] = counters.get(name, 0) + row["total"]
+
+		with transaction.atomic():
+			ProgressCounter.objects.all().delete()
+			ProgressCounter.objects.bulk_create([ProgressCounter(name=name, value=value) for name, value in counters.items()])
+		cache.delete(progress.PAYLOAD_KEY)
+		for name in (progress.PIECES, progress.SOLVED, progress.BAD, progress.TRANSCRIPTIONS):
+			self.stdout.write("{}: {}".format(name, counters[name]))
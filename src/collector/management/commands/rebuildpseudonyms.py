@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from collector.models import ArchivedTranscription, PuzzlePiece, SubmitterPseudonym, TranscriberStats, TranscriptionData
+from collector.pseudonyms import keyId, pseudonym
+
+BATCH = 1000
+
+
+class Command(BaseCommand):
+	help = "Recompute the submitter pseudonyms of everyone with the current PSEUDONYM_KEY, run after rotating the key"
+
+	def handle(self, *args, **options):
+		addresses = set()
+		for model in (PuzzlePiece, TranscriptionData, ArchivedTranscription, TranscriberStats):
+			addresses.update(model.objects.values_list("ip_address", flat=True).distinct().iterator())
+
+		current = keyId()
+		with transaction.atomic():
+			SubmitterPseudonym.objects.all().delete()
+			SubmitterPseudonym.objects.bulk_create(
+				(SubmitterPseudonym(ip_address=ip, pseudonym=pseudonym(ip), keyId=current) for ip in addresses),
+				batch_size=BATCH)
+		self.stdout.write("rebuilt pseudonyms for {} submitters".format(len(addresses)))
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, Max, Q
+from collector.models import TranscriberStats, TranscriptionData, ArchivedTranscription
+
+BATCH = 500
+
+
+class Command(BaseCommand):
+	help = "Recompute the per-transcriber statistics from all transcriptions, live and archived"
+
+	def handle(self, *args, **options):
+		stats = {}
+		for model in (TranscriptionData, ArchivedTranscription):
+			totals = model.objects.values("ip_address").annotate(
+				total=Count("id"),
+				bad=Count("id", filter=Q(bad_image=True)),
+				last=Max("submitted_date"),
+			)
+			for row in totals.iterator():
+				entry = stats.setdefault(row["ip_address"], TranscriberStats(ip_address=row["ip_address"]))
+				entry.transcriptionCount += row["total"]
+				entry.badImageCount += row["bad"]
+				if entry.last_active is None or (row["last"] and row["last"] > entry.last_active):
+					entry.last_active = row["last"]
+
+			resolved = model.objects.filter(bad_image=False, puzzlePiece__confidentsolutions__isnull=False) \
+				.values("ip_address") \
+				.annotate(total=Count("id"), agreed=Count("id", filter=Q(datahash=F("puzzlePiece__confidentsolutions__datahash"))))
+			for row in resolved.iterator():
+				entry = stats[row["ip_address"]]
+				entry.resolvedCount += row["total"]
+				entry.agreedCount += row["agreed"]
+
+		for entry in stats.values():
+			if entry.resolvedCount:
+				entry.agreementRate = 100.0 * entry.agreedCount / entry.resolvedCount
+
+		with transaction.atomic():
+			TranscriberStats.objects.all().delete()
+			TranscriberStats.objects.bulk_create(stats.values(), batch_size=BATCH)
+		self.stdout.write("rebuilt statistics for {} transcribers".format(len(stats)))
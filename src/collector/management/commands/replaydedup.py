@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+from collector.UtilityOps import UtilityOps
+from collector.solver import piecesFromCSV
+import csv
+
+
+class Command(BaseCommand):
+	help = "Replay a verified.csv export and count the transcriptions the duplicate-solution check would have saved"
+
+	def add_arguments(self, parser):
+		parser.add_argument("csv", help="verified.csv export, in the order the solutions were found")
+		parser.add_argument("--votes", type=int, default=3, help="agreeing votes needed to resolve a known solution")
+
+	def handle(self, *args, **options):
+		try:
+			with open(options["csv"], newline="") as infile:
+				counts = [int(row["Transcription count"]) for row in csv.DictReader(infile)]
+			pieces = list(piecesFromCSV(options["csv"]))
+		except (OSError, KeyError, ValueError) as ex:
+			raise CommandError("Could not read {}: {}".format(options["csv"], ex))
+
+		solved = set()
+		solvedCanonical = set()
+		duplicates = 0
+		rotatedDuplicates = 0
+		total = 0
+		saved = 0
+		for piece, count in zip(pieces, counts):
+			canonical = UtilityOps.CanonicalSolutionHash(piece.center, piece.walls, piece.links)
+			total += count
+			if piece.key in solved:
+				duplicates += 1
+				saved += max(0, count - options["votes"])
+			elif canonical in solvedCanonical:
+				rotatedDuplicates += 1
+			solved.add(piece.key)
+			solvedCanonical.add(canonical)
+
+		self.stdout.write("solutions: {}, unique: {}, unique ignoring rotation: {}".format(len(pieces), len(solved), len(solvedCanonical)))
+		self.stdout.write("exact duplicates: {}, rotated duplicates: {}".format(duplicates, rotatedDuplicates))
+		self.stdout.write("transcriptions: {}, saved: {} ({:.1f}%)".format(total, saved, 100.0 * saved / total if total else 0))
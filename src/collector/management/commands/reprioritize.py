@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+from collector.priority import CHUNK, SelectionError, reprioritize, selectPieces
+
+
+class Command(BaseCommand):
+	help = "Set the queue priority of many pieces at once, selected by url, hash, submitter or submission date"
+
+	def add_arguments(self, parser):
+		parser.add_argument("priority", type=int, help="new priority, higher is served first (site submissions get 10)")
+		parser.add_argument("--url-file", help="file with one image url per line")
+		parser.add_argument("--hash", action="append", default=[], help="piece hash, can be repeated")
+		parser.add_argument("--submitter", action="append", default=[], help="submitter pseudonym from the exports or ip hash, can be repeated")
+		parser.add_argument("--since", help="submitted on or after this date / ISO datetime")
+		parser.add_argument("--until", help="submitted up to this date / before this ISO datetime")
+		parser.add_argument("--chunk", type=int, default=CHUNK, help="pieces per UPDATE")
+		parser.add_argument("--dry-run", action="store_true", help="only count the matching pieces")
+
+	def handle(self, *args, **options):
+		if options["priority"] < 0:
+			raise CommandError("Priority can't be negative")
+		urls = []
+		if options["url_file"]:
+			with open(options["url_file"]) as infile:
+				urls = [line.strip() for line in infile if line.strip()]
+		try:
+			pieces = selectPieces(urls, options["hash"], options["submitter"], options["since"], options["until"])
+			if options["dry_run"]:
+				self.stdout.write("{} pieces match".format(pieces.count()))
+				return
+			updated = reprioritize(pieces, options["priority"], options["chunk"])
+		except SelectionError as ex:
+			raise CommandError(str(ex))
+		self.stdout.write("set priority {} on {} pieces".format(options["priority"], updated))
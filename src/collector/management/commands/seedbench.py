@@ -0,0 +1,148 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from collector.models import PuzzlePiece, TranscriptionData, ConfidenceTracking, ConfidentSolution, BadImage, RotatedImage
+from collector.solver import piecesFromCSV
+from collector.UtilityOps import UtilityOps
+import hashlib
+import os
+import random
+
+# Shape of the January 2020 event, see README.md and the shipped CSV:
+# 26336 images, 1453 confident solutions, 50885 transcriptions,
+# about 10 transcriptions per person
+DEFAULT_CSV = os.path.join(os.path.dirname(__file__), "..", "..", "..", "..", "CorridorCrunch_Final_ConfidentSolutions.csv")
+SOLVED_RATIO = 1453 / 26336
+BAD_RATIO = 0.03
+ROTATED_RATIO = 0.02
+TRANSCRIPTIONS_PER_PERSON = 10
+SYMBOLS = "BPCHSDT"
+BATCH = 500
+
+
+def layoutHash(center, walls, links):
+	hashStr = center + " " + "".join("1" if w else "0" for w in walls) + " " + " ".join(links)
+	return hashlib.sha256(hashStr.upper().encode("utf-8")).hexdigest()
+
+
+class Command(BaseCommand):
+	help = "Fill an empty database with realistic benchmark data derived from the final CSV export"
+
+	def add_arguments(self, parser):
+		parser.add_argument("--pieces", type=int, default=26000)
+		parser.add_argument("--transcriptions", type=int, default=50000)
+		parser.add_argument("--csv", default=DEFAULT_CSV, help="verified.csv export to take the piece layouts from")
+		parser.add_argument("--seed", type=int, default=2020, help="random seed, the same seed gives the same data")
+		parser.add_argument("--force", action="store_true", help="seed even if the database already has pieces")
+
+	def handle(self, *args, **options):
+		if PuzzlePiece.objects.exists() and not options["force"]:
+			raise CommandError("The database already has puzzle pieces, this is meant for a benchmark database. Use --force to seed anyway.")
+		try:
+			layouts = list(piecesFromCSV(options["csv"]))
+		except OSError as ex:
+			raise CommandError(str(ex))
+		if not layouts:
+			raise CommandError("No solutions in {}".format(options["csv"]))
+
+		rng = random.Random(options["seed"])
+		pieceCount = options["pieces"]
+		transcriptionCount = options["transcriptions"]
+		submitters = ["bench-{:08x}".format(i) for i in range(max(1, transcriptionCount // TRANSCRIPTIONS_PER_PERSON))]
+
+		self.stdout.write("seeding {} pieces".format(pieceCount))
+		firstId = self.seedPieces(rng, pieceCount, submitters)
+		pieceIds = list(range(firstId, firstId + pieceCount))
+
+		# Solved pieces got most of the work, the rest is spread over the queue
+		# weighted towards the front, like the priority ordering did
+		solved = pieceIds[:int(pieceCount * SOLVED_RATIO)]
+		unsolved = pieceIds[len(solved):]
+		perSolved = [rng.choice(layouts) for _ in solved]
+		solvedShare = min(transcriptionCount, 10 * len(solved))
+
+		self.stdout.write("seeding {} transcriptions".format(transcriptionCount))
+		counts = {}
+		batch = []
+		for i in range(transcriptionCount):
+			if i < solvedShare and solved:
+				index = i % len(solved)
+				pieceId = solved[index]
+				layout = perSolved[index]
+			else:
+				pieceId = unsolved[min(len(unsolved) - 1, int(rng.expovariate(8.0 / len(unsolved))))] if unsolved else rng.choice(solved)
+				layout = rng.choice(layouts)
+			counts[pieceId] = counts.get(pieceId, 0) + 1
+			batch.append(self.makeTranscription(rng, pieceId, layout, rng.choice(submitters)))
+			if len(batch) >= BATCH:
+				TranscriptionData.objects.bulk_create(batch)
+				batch = []
+		TranscriptionData.objects.bulk_create(batch)
+
+		self.stdout.write("seeding solutions and trackers")
+		with transaction.atomic():
+			for pieceId, count in counts.items():
+				PuzzlePiece.objects.filter(id=pieceId).update(transCount=count)
+			ConfidenceTracking.objects.bulk_create(
+				[ConfidenceTracking(puzzlePiece_id=pieceId, confidence=min(100, count * 10)) for pieceId, count in counts.items()],
+				batch_size=BATCH)
+			ConfidentSolution.objects.bulk_create(
+				[self.makeSolution(pieceId, layout) for pieceId, layout in zip(solved, perSolved)],
+				batch_size=BATCH)
+			BadImage.objects.bulk_create(
+				[BadImage(puzzlePiece_id=pieceId, badCount=4) for pieceId in rng.sample(unsolved, int(len(unsolved) * BAD_RATIO))],
+				batch_size=BATCH)
+			RotatedImage.objects.bulk_create(
+				[RotatedImage(puzzlePiece_id=pieceId, rotatedCount=1) for pieceId in rng.sample(unsolved, int(len(unsolved) * ROTATED_RATIO))],
+				batch_size=BATCH)
+		self.stdout.write("done")
+
+	def seedPieces(self, rng, count, submitters):
+		start = PuzzlePiece.objects.order_by("-id").values_list("id", flat=True).first() or 0
+		batch = []
+		for i in range(count):
+			url = "https://cdn.discordapp.com/attachments/bench/{}/{:08d}.png".format(start + i, rng.randrange(10 ** 8))
+			batch.append(PuzzlePiece(
+				id=start + i + 1,
+				url=url,
+				hash=hashlib.sha256(url.encode("utf-8")).hexdigest(),
+				ip_address=rng.choice(submitters),
+				approved=True,
+				priority=10 if rng.random() < 0.2 else 0,
+			))
+			if len(batch) >= BATCH:
+				PuzzlePiece.objects.bulk_create(batch)
+				batch = []
+		PuzzlePiece.objects.bulk_create(batch)
+		return start + 1
+
+	def makeTranscription(self, rng, pieceId, layout, submitter):
+		links = list(layout.links)
+		if rng.random() < 0.15:
+			# A typo somewhere, like real transcriptions have
+			side = rng.randrange(6)
+			pos = rng.randrange(7)
+			links[side] = links[side][:pos] + rng.choice(SYMBOLS) + links[side][pos + 1:]
+		walls = layout.walls
+		return TranscriptionData(
+			puzzlePiece_id=pieceId,
+			ip_address=submitter,
+			bad_image=False,
+			orientation="",
+			datahash=layoutHash(layout.center, walls, links),
+			center=layout.center,
+			wall1=walls[0], wall2=walls[1], wall3=walls[2], wall4=walls[3], wall5=walls[4], wall6=walls[5],
+			link1=links[0], link2=links[1], link3=links[2], link4=links[3], link5=links[4], link6=links[5],
+		)
+
+	def makeSolution(self, pieceId, layout):
+		walls = layout.walls
+		links = layout.links
+		return ConfidentSolution(
+			puzzlePiece_id=pieceId,
+			confidence=90,
+			datahash=layoutHash(layout.center, walls, links),
+			canonicalhash=UtilityOps.CanonicalSolutionHash(layout.center, walls, links),
+			center=layout.center,
+			wall1=walls[0], wall2=walls[1], wall3=walls[2], wall4=walls[3], wall5=walls[4], wall6=walls[5],
+			link1=links[0], link2=links[1], link3=links[2], link4=links[3], link5=links[4], link6=links[5],
+		)
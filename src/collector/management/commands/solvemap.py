@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand, CommandError
+from collector.solver import MapSolver, OPPOSITE_SIDE, BLANK_LINK, piecesFromCSV
+import time
+
+
+class Command(BaseCommand):
+	help = "Assemble the map from confident solutions and report the connected components"
+
+	def add_arguments(self, parser):
+		parser.add_argument("--csv", help="read solutions from a verified.csv export instead of the database")
+		parser.add_argument("--top", type=int, default=10, help="number of components to list")
+		parser.add_argument("--compare", action="store_true", help="also time the naive pairwise scan")
+
+	def handle(self, *args, **options):
+		solver = MapSolver()
+		start = time.perf_counter()
+		if options["csv"]:
+			try:
+				pieces = list(piecesFromCSV(options["csv"]))
+			except OSError as ex:
+				raise CommandError(str(ex))
+			loaded = time.perf_counter()
+			links = sum(len(solver.addPiece(piece)) for piece in pieces)
+			rows = len(pieces)
+		else:
+			loaded = start
+			rows = solver.catchUp()
+			links = sum(len(solver.neighbours(key)) for key in solver.pieces) // 2
+			pieces = list(solver.pieces.values())
+		done = time.perf_counter()
+
+		components = solver.components()
+		self.stdout.write("rows: {}, unique pieces: {}, links: {}".format(rows, len(solver), links))
+		self.stdout.write("components: {}, singletons: {}".format(len(components), sum(1 for c in components if len(c) == 1)))
+		self.stdout.write("indexed assembly: {:.2f} ms".format((done - loaded) * 1000))
+
+		for component in components[:options["top"]]:
+			positions, conflicts = solver.layout(component[0])
+			self.stdout.write("  size {:4d}, conflicts {:3d}, e.g. {}".format(len(component), len(conflicts), solver.pieces[component[0]].url))
+
+		if options["compare"]:
+			unique = list({piece.key: piece for piece in pieces}.values())
+			start = time.perf_counter()
+			naive = 0
+			for a in unique:
+				for b in unique:
+					if a.key >= b.key:
+						continue
+					for side in range(1, 7):
+						link = a.links[side - 1]
+						if link and link != BLANK_LINK and link == b.links[OPPOSITE_SIDE[side] - 1]:
+							naive += 1
+			done = time.perf_counter()
+			self.stdout.write("pairwise scan: {:.2f} ms, links: {}".format((done - start) * 1000, naive))
@@ -0,0 +1,88 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+from collector.models import PuzzlePiece, ConfidentSolution, BadImage
+from collector.outbound import outboundClient
+from asgiref.sync import sync_to_async
+import asyncio
+import datetime
+import httpx
+import time
+
+DEAD = "dead"
+ALIVE = "alive"
+UNKNOWN = "unknown"
+
+
+def classify(response):
+	if response.status_code in (404, 410):
+		return DEAD
+	# imgur answers deleted images with a redirect to its placeholder
+	if response.is_redirect and response.headers.get("location", "").endswith("/removed.png"):
+		return DEAD
+	if response.status_code == 200:
+		return ALIVE
+	# Rate limits, outages, hosts that don't do HEAD: try again next time
+	return UNKNOWN
+
+
+class Command(BaseCommand):
+	help = "Check the links of queued pieces and take the ones that are gone out of the queue"
+
+	def add_arguments(self, parser):
+		parser.add_argument("--limit", type=int, default=1000, help="links to check per run")
+		parser.add_argument("--concurrency", type=int, default=20, help="requests in flight at once")
+		parser.add_argument("--max-age", type=float, default=24, metavar="HOURS", help="check a link again after this long")
+		parser.add_argument("--retry", type=float, default=1, metavar="HOURS", help="check a link without a clear answer again after this long")
+		parser.add_argument("--follow", type=int, default=0, metavar="SECONDS", help="keep running, sweeping every SECONDS")
+
+	def handle(self, *args, **options):
+		while True:
+			checked, dead = asyncio.run(self.sweep(options))
+			self.stdout.write("checked {} links, {} dead".format(checked, dead))
+			if not options["follow"]:
+				break
+			time.sleep(options["follow"])
+
+	def pending(self, limit, maxAge):
+		# Same order as the transcription queue, so what is served next is
+		# checked first
+		stale = timezone.now() - datetime.timedelta(hours=maxAge)
+		return list(PuzzlePiece.objects.filter(approved=True, deadLink=False) \
+			.filter(Q(linkChecked__isnull=True) | Q(linkChecked__lt=stale)) \
+			.exclude(id__in=ConfidentSolution.objects.values("puzzlePiece_id")) \
+			.exclude(id__in=BadImage.objects.values("puzzlePiece_id")) \
+			.order_by("-priority", "-transCount") \
+			.values_list("id", "url")[:limit])
+
+	async def sweep(self, options):
+		pieces = await sync_to_async(self.pending)(options["limit"], options["max_age"])
+		slots = asyncio.Semaphore(options["concurrency"])
+
+		async def check(client, url):
+			async with slots:
+				try:
+					return classify(await client.head(url))
+				except httpx.HTTPError:
+					return UNKNOWN
+
+		async with outboundClient() as client:
+			results = await asyncio.gather(*[check(client, url) for _, url in pieces])
+
+		dead = [pieceId for (pieceId, _), result in zip(pieces, results) if result == DEAD]
+		alive = [pieceId for (pieceId, _), result in zip(pieces, results) if result == ALIVE]
+		unknown = [pieceId for (pieceId, _), result in zip(pieces, results) if result == UNKNOWN]
+		await sync_to_async(self.record)(dead, alive, unknown, datetime.timedelta(hours=options["max_age"] - options["retry"]))
+		return len(pieces), len(dead)
+
+	def record(self, dead, alive, unknown=(), retryEarlier=datetime.timedelta(0)):
+		now = timezone.now()
+		if dead:
+			PuzzlePiece.objects.filter(id__in=dead).update(deadLink=True, linkChecked=now, last_modified=now)
+		if alive:
+			PuzzlePiece.objects.filter(id__in=alive).update(linkChecked=now)
+		if unknown:
+			# Stamped too, or they would be first again on every run and hold
+			# up the rest. Back dated so they are due after --retry instead of
+			# --max-age.
+			PuzzlePiece.objects.filter(id__in=unknown).update(linkChecked=now - max(retryEarlier, datetime.timedelta(0)))
@@ -0,0 +1,36 @@
+# Generated by Django 3.0.14 on 2026-10-19 06:52
+
+from django.db import migrations, models
+from collector.UtilityOps import UtilityOps
+
+
+def fill_canonicalhash(apps, schema_editor):
+    ConfidentSolution = apps.get_model('collector', 'ConfidentSolution')
+    for solution in ConfidentSolution.objects.all().iterator():
+        solution.canonicalhash = UtilityOps.CanonicalSolutionHash(
+            solution.center,
+            [solution.wall1, solution.wall2, solution.wall3, solution.wall4, solution.wall5, solution.wall6],
+            [solution.link1, solution.link2, solution.link3, solution.link4, solution.link5, solution.link6],
+        )
+        solution.save(update_fields=['canonicalhash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('collector', '0020_auto_20200119_2156'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='confidentsolution',
+            name='canonicalhash',
+            field=models.CharField(db_index=True, default='', max_length=64, verbose_name='sha256 hash of the layout, independent of rotation'),
+        ),
+        migrations.AlterField(
+            model_name='confidentsolution',
+            name='datahash',
+            field=models.CharField(db_index=True, default='', max_length=64, verbose_name='sha256 hash for easier comparisons'),
+        ),
+        migrations.RunPython(fill_canonicalhash, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 3.0.14 on 2026-10-19 06:53
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('collector', '0021_confidentsolution_canonicalhash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='puzzlepiece',
+            name='duplicateOf',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='duplicates', to='collector.PuzzlePiece', verbose_name='piece showing the same image'),
+        ),
+        migrations.AddField(
+            model_name='puzzlepiece',
+            name='phash',
+            field=models.CharField(db_index=True, default='', max_length=16, verbose_name='perceptual hash of the image'),
+        ),
+    ]
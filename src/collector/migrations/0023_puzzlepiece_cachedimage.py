@@ -0,0 +1,18 @@
+# Generated by Django 3.0.14 on 2026-10-19 06:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('collector', '0022_puzzlepiece_phash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='puzzlepiece',
+            name='cachedImage',
+            field=models.CharField(db_index=True, default='', max_length=80, verbose_name='file name of the locally cached copy'),
+        ),
+    ]
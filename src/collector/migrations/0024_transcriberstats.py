@@ -0,0 +1,34 @@
+# Generated by Django 3.0.14 on 2026-10-19 06:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('collector', '0023_puzzlepiece_cachedimage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TranscriberStats',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ip_address', models.CharField(max_length=64, unique=True, verbose_name='hash of submitter ip address')),
+                ('last_active', models.DateTimeField(null=True, verbose_name='last transcription date')),
+                ('transcriptionCount', models.PositiveIntegerField(default=0, verbose_name='number of transcriptions submitted')),
+                ('badImageCount', models.PositiveIntegerField(default=0, verbose_name='number of images reported as bad')),
+                ('resolvedCount', models.PositiveIntegerField(default=0, verbose_name='transcriptions of images that got a confident solution')),
+                ('agreedCount', models.PositiveIntegerField(default=0, verbose_name='transcriptions that matched the confident solution')),
+                ('agreementRate', models.FloatField(default=0, verbose_name='agreedCount / resolvedCount in percent')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='transcriberstats',
+            index=models.Index(fields=['-transcriptionCount'], name='transcriber_count_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transcriberstats',
+            index=models.Index(fields=['-agreementRate'], name='transcriber_agreement_idx'),
+        ),
+    ]
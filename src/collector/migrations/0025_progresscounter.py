@@ -0,0 +1,21 @@
+# Generated by Django 3.0.14 on 2026-10-19 06:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('collector', '0024_transcriberstats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProgressCounter',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=64, unique=True, verbose_name='counter name')),
+                ('value', models.BigIntegerField(default=0, verbose_name='current value')),
+            ],
+        ),
+    ]
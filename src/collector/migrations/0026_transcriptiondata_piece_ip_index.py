@@ -0,0 +1,17 @@
+# Generated by Django 3.0.14 on 2026-10-19 07:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('collector', '0025_progresscounter'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transcriptiondata',
+            index=models.Index(fields=['puzzlePiece', 'ip_address'], name='piece_ip_address_idx'),
+        ),
+    ]
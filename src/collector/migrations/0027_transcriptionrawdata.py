@@ -0,0 +1,55 @@
+# Generated by Django 3.0.14 on 2026-10-19 07:09
+
+from django.db import migrations, models
+import django.db.models.deletion
+import zlib
+
+
+def move_rawdata(apps, schema_editor):
+    TranscriptionData = apps.get_model('collector', 'TranscriptionData')
+    TranscriptionRawData = apps.get_model('collector', 'TranscriptionRawData')
+    batch = []
+    for transcriptionId, rawdata in TranscriptionData.objects.exclude(rawdata='').values_list('id', 'rawdata').iterator():
+        data = rawdata.encode('utf-8')
+        packed = zlib.compress(data)
+        if len(packed) < len(data):
+            batch.append(TranscriptionRawData(transcription_id=transcriptionId, compressed=True, payload=packed))
+        else:
+            batch.append(TranscriptionRawData(transcription_id=transcriptionId, compressed=False, payload=data))
+        if len(batch) >= 500:
+            TranscriptionRawData.objects.bulk_create(batch)
+            batch = []
+    TranscriptionRawData.objects.bulk_create(batch)
+
+
+def restore_rawdata(apps, schema_editor):
+    TranscriptionData = apps.get_model('collector', 'TranscriptionData')
+    TranscriptionRawData = apps.get_model('collector', 'TranscriptionRawData')
+    for raw in TranscriptionRawData.objects.all().iterator():
+        data = bytes(raw.payload)
+        if raw.compressed:
+            data = zlib.decompress(data)
+        TranscriptionData.objects.filter(id=raw.transcription_id).update(rawdata=data.decode('utf-8', errors='replace'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('collector', '0026_transcriptiondata_piece_ip_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TranscriptionRawData',
+            fields=[
+                ('transcription', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='raw', serialize=False, to='collector.TranscriptionData')),
+                ('compressed', models.BooleanField(default=False, verbose_name='payload is zlib compressed')),
+                ('payload', models.BinaryField(verbose_name='raw submission as sent')),
+            ],
+        ),
+        migrations.RunPython(move_rawdata, restore_rawdata),
+        migrations.RemoveField(
+            model_name='transcriptiondata',
+            name='rawdata',
+        ),
+    ]
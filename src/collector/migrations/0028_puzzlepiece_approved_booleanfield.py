@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-19 07:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('collector', '0027_transcriptionrawdata'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='puzzlepiece',
+            name='approved',
+            field=models.BooleanField(null=True, verbose_name='is image approved for verification'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 3.2.25 on 2026-10-19 07:18
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('collector', '0028_puzzlepiece_approved_booleanfield'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedTranscription',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('ip_address', models.CharField(default='?.?.?.?', max_length=64, verbose_name='hash of submitter ip address')),
+                ('submitted_date', models.DateTimeField(verbose_name='submitted date')),
+                ('bad_image', models.BooleanField(verbose_name='image is bad or hard to read')),
+                ('orientation', models.CharField(default='', max_length=10, verbose_name='orientation direction from image')),
+                ('datahash', models.CharField(default='', max_length=64, verbose_name='sha256 hash for easier comparisons')),
+                ('center', models.CharField(max_length=20, verbose_name='center')),
+                ('wall1', models.BooleanField(verbose_name='wall 1 (top)')),
+                ('wall2', models.BooleanField(verbose_name='wall 2 (top-right)')),
+                ('wall3', models.BooleanField(verbose_name='wall 3 (bottom-right)')),
+                ('wall4', models.BooleanField(verbose_name='wall 4 (bottom)')),
+                ('wall5', models.BooleanField(verbose_name='wall 5 (bottom-left)')),
+                ('wall6', models.BooleanField(verbose_name='wall 6 (top-left)')),
+                ('link1', models.CharField(max_length=7, verbose_name='link 1 (top)')),
+                ('link2', models.CharField(max_length=7, verbose_name='link 2 (top-right)')),
+                ('link3', models.CharField(max_length=7, verbose_name='link 3 (bottom-right)')),
+                ('link4', models.CharField(max_length=7, verbose_name='link 4 (bottom)')),
+                ('link5', models.CharField(max_length=7, verbose_name='link 5 (bottom-left)')),
+                ('link6', models.CharField(max_length=7, verbose_name='link 6 (top-left)')),
+                ('rawCompressed', models.BooleanField(default=False, verbose_name='raw payload is zlib compressed')),
+                ('rawPayload', models.BinaryField(null=True, verbose_name='raw submission as sent, if there was one')),
+                ('puzzlePiece', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archivedtranscriptions', to='collector.puzzlepiece')),
+            ],
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 3.2.25 on 2026-10-19 07:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('collector', '0029_archivedtranscription'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='confidentsolution',
+            index=models.Index(fields=['last_modified', 'id'], name='solution_last_modified_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='puzzlepiece',
+            index=models.Index(fields=['last_modified', 'id'], name='piece_last_modified_idx'),
+        ),
+    ]
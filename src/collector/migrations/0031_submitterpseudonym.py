@@ -0,0 +1,22 @@
+# Generated by Django 3.2.25 on 2026-10-19 07:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('collector', '0030_changes_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SubmitterPseudonym',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ip_address', models.CharField(max_length=64, unique=True, verbose_name='hash of submitter ip address')),
+                ('pseudonym', models.CharField(max_length=64, verbose_name='keyed hash of ip_address, safe to publish')),
+                ('keyId', models.CharField(db_index=True, max_length=16, verbose_name='fingerprint of the key used')),
+            ],
+        ),
+    ]
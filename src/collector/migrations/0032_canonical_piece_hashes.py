@@ -0,0 +1,85 @@
+from django.db import migrations
+from django.utils import timezone
+from urllib.parse import urlsplit, urlunsplit
+import hashlib
+
+
+def canonical_url(url):
+    # Frozen copy of UtilityOps.CanonicalUrl as of this migration
+    parts = urlsplit(url.strip())
+    host = (parts.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    path = parts.path.rstrip("/")
+    if host in ("imgur.com", "i.imgur.com", "m.imgur.com") and path.count("/") == 1:
+        return "https://i.imgur.com/" + path[1:].split(".")[0]
+    if host in ("gyazo.com", "i.gyazo.com") and path.count("/") == 1:
+        return "https://i.gyazo.com/" + path[1:].split(".")[0].lower()
+    if host in ("cdn.discordapp.com", "media.discordapp.net"):
+        return "https://cdn.discordapp.com" + path
+    return urlunsplit(("https", host + (":{}".format(parts.port) if parts.port else ""), path, parts.query, ""))
+
+
+def url_hash(url):
+    return hashlib.sha256(canonical_url(url).encode("utf-8")).hexdigest()
+
+
+def merge_duplicates(apps, schema_editor):
+    # Rehash every piece from its canonical URL. Pieces that turn out to be the
+    # same image are merged into the oldest one: it takes over the
+    # transcriptions and whatever tracker, solution or report rows it lacks.
+    # The others stay, pointing to it with duplicateOf so the changes feed
+    # reports the merge, and keep the rows that weren't moved (the queue skips
+    # anything with a duplicateOf). Everything touched gets a new
+    # last_modified. Run rebuildprogress afterwards.
+    PuzzlePiece = apps.get_model('collector', 'PuzzlePiece')
+    TranscriptionData = apps.get_model('collector', 'TranscriptionData')
+    ArchivedTranscription = apps.get_model('collector', 'ArchivedTranscription')
+    perPiece = [apps.get_model('collector', name) for name in ('ConfidentSolution', 'ConfidenceTracking', 'BadImage', 'RotatedImage')]
+
+    groups = {}
+    hashes = {}
+    for pieceId, url, hash in PuzzlePiece.objects.order_by('id').values_list('id', 'url', 'hash').iterator():
+        groups.setdefault(url_hash(url), []).append(pieceId)
+        hashes[pieceId] = hash
+
+    now = timezone.now()
+    rehashed = []
+    for hash, ids in groups.items():
+        keep, duplicates = ids[0], ids[1:]
+        if duplicates:
+            TranscriptionData.objects.filter(puzzlePiece_id__in=duplicates).update(puzzlePiece_id=keep)
+            ArchivedTranscription.objects.filter(puzzlePiece_id__in=duplicates).update(puzzlePiece_id=keep)
+            for model in perPiece:
+                if not model.objects.filter(puzzlePiece_id=keep).exists():
+                    moved = model.objects.filter(puzzlePiece_id__in=duplicates).order_by('id').first()
+                    if moved is not None:
+                        model.objects.filter(id=moved.id).update(puzzlePiece_id=keep, last_modified=now)
+            PuzzlePiece.objects.filter(duplicateOf_id__in=duplicates).exclude(id=keep).update(duplicateOf_id=keep, last_modified=now)
+            pieces = {p.id: p for p in PuzzlePiece.objects.filter(id__in=ids)}
+            PuzzlePiece.objects.filter(id=keep).update(
+                priority=max(p.priority for p in pieces.values()),
+                approved=True if any(p.approved for p in pieces.values()) else pieces[keep].approved,
+                transCount=TranscriptionData.objects.filter(puzzlePiece_id=keep).count() + ArchivedTranscription.objects.filter(puzzlePiece_id=keep).count(),
+                last_modified=now,
+            )
+            # The hash is unique, the duplicates need one of their own that no
+            # url can have
+            for duplicate in duplicates:
+                PuzzlePiece.objects.filter(id=duplicate).update(
+                    hash="duplicate:{}".format(duplicate), duplicateOf_id=keep,
+                    priority=0, transCount=0, last_modified=now)
+        if hashes[keep] != hash:
+            rehashed.append(PuzzlePiece(id=keep, hash=hash, last_modified=now))
+    PuzzlePiece.objects.bulk_update(rehashed, ['hash', 'last_modified'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('collector', '0031_submitterpseudonym'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+    ]
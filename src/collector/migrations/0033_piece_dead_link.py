@@ -0,0 +1,23 @@
+# Generated by Django 3.2.25 on 2026-10-19 07:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('collector', '0032_canonical_piece_hashes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='puzzlepiece',
+            name='deadLink',
+            field=models.BooleanField(default=False, verbose_name='image link is gone, out of the queue'),
+        ),
+        migrations.AddField(
+            model_name='puzzlepiece',
+            name='linkChecked',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='last time sweepdeadlinks checked the link'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-19 07:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('collector', '0033_piece_dead_link'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='puzzlepiece',
+            name='phashAttempted',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='last time phashpieces failed to fetch the image'),
+        ),
+    ]
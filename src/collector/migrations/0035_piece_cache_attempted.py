@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-19 07:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('collector', '0034_piece_phash_attempted'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='puzzlepiece',
+            name='cacheAttempted',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='last time cacheimages failed to fetch the image'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-19 07:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('collector', '0035_piece_cache_attempted'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='confidentsolution',
+            name='canonicalhash',
+            field=models.CharField(default='', max_length=64, verbose_name='sha256 hash of the layout, independent of rotation'),
+        ),
+    ]
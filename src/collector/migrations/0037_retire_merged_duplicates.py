@@ -0,0 +1,15 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    # Used to mark the pieces merged by 0032 as dead links. The queue leaves
+    # out duplicates on its own now and deadLink only means the link is gone,
+    # 0039 undoes this where it already ran.
+
+    dependencies = [
+        ('collector', '0036_confidentsolution_canonicalhash_no_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop, migrations.RunPython.noop, elidable=True),
+    ]
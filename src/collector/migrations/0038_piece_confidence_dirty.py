@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-19 07:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('collector', '0037_retire_merged_duplicates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='puzzlepiece',
+            name='confidenceDirty',
+            field=models.BooleanField(default=False, verbose_name='confidence needs another evaluation, see collector/locks.py'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+from django.db import migrations
+from django.utils import timezone
+
+
+def revive_merged_duplicates(apps, schema_editor):
+    # An earlier 0037 marked the pieces merged by 0032 as dead links. Only
+    # sweepdeadlinks may do that, and it always sets linkChecked.
+    PuzzlePiece = apps.get_model('collector', 'PuzzlePiece')
+    PuzzlePiece.objects.filter(hash__startswith='duplicate:', deadLink=True, linkChecked__isnull=True) \
+        .update(deadLink=False, last_modified=timezone.now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('collector', '0038_piece_confidence_dirty'),
+    ]
+
+    operations = [
+        migrations.RunPython(revive_merged_duplicates, migrations.RunPython.noop),
+    ]
@@ -1,15 +1,30 @@
 from django.db import models
+import zlib
 
 
 class PuzzlePiece(models.Model):
+	class Meta:
+		indexes = [
+			# Cursor of the changes feed, see collector/changes.py
+			models.Index(fields=['last_modified', 'id'], name='piece_last_modified_idx'),
+		]
+
 	url = models.URLField(verbose_name="image url")
 	hash = models.CharField(max_length=64, unique=True, default="empty", verbose_name="sha256 hash of the url")
 	ip_address = models.CharField(max_length=64, default="?.?.?.?", verbose_name="hash of submitter ip address")
 	submitted_date = models.DateTimeField(verbose_name="submitted date", auto_now_add=True)
 	last_modified = models.DateTimeField(verbose_name="last modified date", auto_now=True)
-	approved = models.NullBooleanField(verbose_name="is image approved for verification")
+	approved = models.BooleanField(null=True, verbose_name="is image approved for verification")
 	priority = models.PositiveIntegerField(default=0,verbose_name="Priority value in transcription queue")
 	transCount = models.PositiveIntegerField(default=0,verbose_name="Number of transcriptions received for this image")
+	phash = models.CharField(max_length=16, default="", db_index=True, verbose_name="perceptual hash of the image")
+	phashAttempted = models.DateTimeField(null=True, blank=True, verbose_name="last time phashpieces failed to fetch the image")
+	cachedImage = models.CharField(max_length=80, default="", db_index=True, verbose_name="file name of the locally cached copy")
+	cacheAttempted = models.DateTimeField(null=True, blank=True, verbose_name="last time cacheimages failed to fetch the image")
+	duplicateOf = models.ForeignKey("self", null=True, blank=True, on_delete=models.SET_NULL, related_name="duplicates", verbose_name="piece showing the same image")
+	deadLink = models.BooleanField(default=False, verbose_name="image link is gone, out of the queue")
+	linkChecked = models.DateTimeField(null=True, blank=True, verbose_name="last time sweepdeadlinks checked the link")
+	confidenceDirty = models.BooleanField(default=False, verbose_name="confidence needs another evaluation, see collector/locks.py")
 
 	def __str__(self):
 		data = []
@@ -30,7 +45,9 @@ class PuzzlePiece(models.Model):
 class TranscriptionData(models.Model):
 	class Meta:
 		indexes = [
-			models.Index(fields=['ip_address'], name='ip_address_idx')
+			models.Index(fields=['ip_address'], name='ip_address_idx'),
+			# One transcription per person and piece, see alreadyTranscribed
+			models.Index(fields=['puzzlePiece', 'ip_address'], name='piece_ip_address_idx'),
 		]
 	
 	puzzlePiece = models.ForeignKey(PuzzlePiece, on_delete=models.CASCADE, related_name="transcriptions")
@@ -39,7 +56,6 @@ class TranscriptionData(models.Model):
 
 	bad_image = models.BooleanField(verbose_name="image is bad or hard to read")
 	orientation = models.CharField(max_length=10, default="", verbose_name="orientation direction from image")
-	rawdata = models.TextField(default="", verbose_name="Raw JSON taken in for later debugging.")
 	datahash = models.CharField(max_length=64, default="", verbose_name="sha256 hash for easier comparisons")
 
 	center = models.CharField(max_length=20, verbose_name="center")
@@ -62,6 +78,76 @@ class TranscriptionData(models.Model):
 		return "{} {} {}".format(self.center, self.wall1, self.link1)
 
 
+class TranscriptionRawData(models.Model):
+	# Raw submissions for later debugging. Kept out of TranscriptionData so the
+	# hot table stays narrow, written once and only read when someone looks.
+	MAX_LENGTH = 65536
+
+	transcription = models.OneToOneField(TranscriptionData, on_delete=models.CASCADE, primary_key=True, related_name="raw")
+	compressed = models.BooleanField(default=False, verbose_name="payload is zlib compressed")
+	payload = models.BinaryField(verbose_name="raw submission as sent")
+
+	@classmethod
+	def store(cls, transcription, text):
+		data = text[:cls.MAX_LENGTH].encode("utf-8")
+		packed = zlib.compress(data)
+		# Short submissions often grow when compressed
+		if len(packed) < len(data):
+			return cls.objects.create(transcription=transcription, compressed=True, payload=packed)
+		return cls.objects.create(transcription=transcription, compressed=False, payload=data)
+
+	def text(self):
+		return unpackRawData(self.payload, self.compressed)
+
+
+def unpackRawData(payload, compressed):
+	data = bytes(payload)
+	if compressed:
+		data = zlib.decompress(data)
+	return data.decode("utf-8", errors="replace")
+
+
+class ArchivedTranscription(models.Model):
+	# TranscriptionData of resolved pieces, moved here by the
+	# archivetranscriptions command so the live table only holds open work.
+	# Rows keep their id, the raw submission comes along.
+	id = models.IntegerField(primary_key=True)
+	puzzlePiece = models.ForeignKey(PuzzlePiece, on_delete=models.CASCADE, related_name="archivedtranscriptions")
+	ip_address = models.CharField(max_length=64, default="?.?.?.?", verbose_name="hash of submitter ip address")
+	submitted_date = models.DateTimeField(verbose_name="submitted date")
+
+	bad_image = models.BooleanField(verbose_name="image is bad or hard to read")
+	orientation = models.CharField(max_length=10, default="", verbose_name="orientation direction from image")
+	datahash = models.CharField(max_length=64, default="", verbose_name="sha256 hash for easier comparisons")
+
+	center = models.CharField(max_length=20, verbose_name="center")
+
+	wall1 = models.BooleanField(verbose_name="wall 1 (top)")
+	wall2 = models.BooleanField(verbose_name="wall 2 (top-right)")
+	wall3 = models.BooleanField(verbose_name="wall 3 (bottom-right)")
+	wall4 = models.BooleanField(verbose_name="wall 4 (bottom)")
+	wall5 = models.BooleanField(verbose_name="wall 5 (bottom-left)")
+	wall6 = models.BooleanField(verbose_name="wall 6 (top-left)")
+
+	link1 = models.CharField(max_length=7, verbose_name="link 1 (top)")
+	link2 = models.CharField(max_length=7, verbose_name="link 2 (top-right)")
+	link3 = models.CharField(max_length=7, verbose_name="link 3 (bottom-right)")
+	link4 = models.CharField(max_length=7, verbose_name="link 4 (bottom)")
+	link5 = models.CharField(max_length=7, verbose_name="link 5 (bottom-left)")
+	link6 = models.CharField(max_length=7, verbose_name="link 6 (top-left)")
+
+	rawCompressed = models.BooleanField(default=False, verbose_name="raw payload is zlib compressed")
+	rawPayload = models.BinaryField(null=True, verbose_name="raw submission as sent, if there was one")
+
+	def __str__(self):
+		return "{} {} {}".format(self.center, self.wall1, self.link1)
+
+	def rawText(self):
+		if self.rawPayload is None:
+			return None
+		return unpackRawData(self.rawPayload, self.rawCompressed)
+
+
 class BadImage(models.Model):
 	puzzlePiece = models.ForeignKey(PuzzlePiece, on_delete=models.CASCADE, related_name="badimages")
 	last_modified = models.DateTimeField(verbose_name="last modified date", auto_now=True)
@@ -88,10 +174,16 @@ class ConfidenceTracking(models.Model):
 
 
 class ConfidentSolution(models.Model):
+	class Meta:
+		indexes = [
+			models.Index(fields=['last_modified', 'id'], name='solution_last_modified_idx'),
+		]
+
 	puzzlePiece = models.ForeignKey(PuzzlePiece, on_delete=models.CASCADE, related_name="confidentsolutions")
 	last_modified = models.DateTimeField(verbose_name="last modified date", auto_now=True)
 	confidence = models.PositiveIntegerField(default=0,verbose_name="how confident are we in this image, 0 to 100")
-	datahash = models.CharField(max_length=64, default="", verbose_name="sha256 hash for easier comparisons")
+	datahash = models.CharField(max_length=64, default="", db_index=True, verbose_name="sha256 hash for easier comparisons")
+	canonicalhash = models.CharField(max_length=64, default="", verbose_name="sha256 hash of the layout, independent of rotation")
 
 	center = models.CharField(max_length=20, verbose_name="center")
 
@@ -125,3 +217,41 @@ class ConfidentSolution(models.Model):
 		self.link4 = transcription.link4
 		self.link5 = transcription.link5
 		self.link6 = transcription.link6
+
+	def walls(self):
+		return [self.wall1, self.wall2, self.wall3, self.wall4, self.wall5, self.wall6]
+
+	def links(self):
+		return [self.link1, self.link2, self.link3, self.link4, self.link5, self.link6]
+
+
+class TranscriberStats(models.Model):
+	class Meta:
+		indexes = [
+			models.Index(fields=['-transcriptionCount'], name='transcriber_count_idx'),
+			models.Index(fields=['-agreementRate'], name='transcriber_agreement_idx'),
+		]
+
+	ip_address = models.CharField(max_length=64, unique=True, verbose_name="hash of submitter ip address")
+	last_active = models.DateTimeField(null=True, verbose_name="last transcription date")
+	transcriptionCount = models.PositiveIntegerField(default=0, verbose_name="number of transcriptions submitted")
+	badImageCount = models.PositiveIntegerField(default=0, verbose_name="number of images reported as bad")
+	resolvedCount = models.PositiveIntegerField(default=0, verbose_name="transcriptions of images that got a confident solution")
+	agreedCount = models.PositiveIntegerField(default=0, verbose_name="transcriptions that matched the confident solution")
+	agreementRate = models.FloatField(default=0, verbose_name="agreedCount / resolvedCount in percent")
+
+
+class SubmitterPseudonym(models.Model):
+	# Published submitter id per ip hash, so exports don't compute an HMAC per
+	# row. keyId tells which PSEUDONYM_KEY made it, see collector/pseudonyms.py
+	ip_address = models.CharField(max_length=64, unique=True, verbose_name="hash of submitter ip address")
+	pseudonym = models.CharField(max_length=64, verbose_name="keyed hash of ip_address, safe to publish")
+	keyId = models.CharField(max_length=16, db_index=True, verbose_name="fingerprint of the key used")
+
+
+class ProgressCounter(models.Model):
+	name = models.CharField(max_length=64, unique=True, verbose_name="counter name")
+	value = models.BigIntegerField(default=0, verbose_name="current value")
+
+	def __str__(self):
+		return "{}: {}".format(self.name, self.value)
@@ -0,0 +1,40 @@
+from contextlib import asynccontextmanager
+from django.conf import settings
+import httpx
+
+# Async HTTP client for views that wait on the image hosts. Under ASGI the
+# lifespan handler in puzzlepieces/asgi.py creates one client per process, so
+# connections to the hosts are reused. Without it (WSGI, management commands)
+# every use gets a short lived client of its own.
+_shared = None
+
+
+def _newClient():
+	return httpx.AsyncClient(
+		timeout=httpx.Timeout(settings.OUTBOUND_HTTP_TIMEOUT),
+		limits=httpx.Limits(max_connections=settings.OUTBOUND_HTTP_MAX_CONNECTIONS),
+	)
+
+
+@asynccontextmanager
+async def outboundClient():
+	if _shared is not None:
+		yield _shared
+	else:
+		async with _newClient() as client:
+			yield client
+
+
+async def lifespan(receive, send):
+	global _shared
+	while True:
+		message = await receive()
+		if message["type"] == "lifespan.startup":
+			_shared = _newClient()
+			await send({"type": "lifespan.startup.complete"})
+		elif message["type"] == "lifespan.shutdown":
+			if _shared is not None:
+				await _shared.aclose()
+				_shared = None
+			await send({"type": "lifespan.shutdown.complete"})
+			return
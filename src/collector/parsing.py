@@ -0,0 +1,164 @@
+import json
+import re
+
+# Parser for transcription submissions, either the raw JSON from tjl.co or the
+# short text form "Blank 1,4 BPCHSDT BPCHSDT BPCHSDT BPCHSDT BPCHSDT BPCHSDT".
+# Both produce the same canonical dict: a one letter center, six walls and six
+# links as 7 letter strings.
+SYMBOLS = "BPCHSDT"
+CENTER_NAMES = {
+	"BLANK": "B",
+	"PLUS": "P",
+	"CLOVER": "C",
+	"HEX": "H",
+	"SNAKE": "S",
+	"DIAMOND": "D",
+	"CAULDRON": "T",
+}
+LINK_LENGTH = 7
+LONGEST_CENTER = max(len(name) for name in CENTER_NAMES)
+
+# Only ever used anchored at a position, these can't backtrack
+spacePattern = re.compile(r"\s*")
+wordPattern = re.compile(r"[^\W\d_]{1,%d}" % (LONGEST_CENTER + 1))
+
+
+class ParseError(ValueError):
+	def __init__(self, message, position):
+		super().__init__("{} (at character {})".format(message, position + 1))
+		self.message = message
+		self.position = position
+
+
+def parseSubmission(text):
+	pos = _skipSpace(text, 0)
+	if text.startswith("{", pos):
+		return _parseJSON(text, pos)
+	# Nearly everything is well formed, split() handles that in C. Anything
+	# odd goes through the scanner, which also knows the error positions.
+	return _parseTokens(text) or _parseText(text, pos)
+
+
+def _skipSpace(text, pos):
+	return spacePattern.match(text, pos).end()
+
+
+def _center(word, position):
+	word = word.upper()
+	if word in CENTER_NAMES:
+		return CENTER_NAMES[word]
+	if len(word) == 1 and word in SYMBOLS:
+		return word
+	raise ParseError("Unknown center '{}'".format(word), position)
+
+
+def _link(link, number, position):
+	# Returns the upper case link or raises at the first bad symbol
+	upper = link.upper()
+	if len(upper) == LINK_LENGTH and not upper.strip(SYMBOLS):
+		return upper
+	for offset, symbol in enumerate(link):
+		if symbol.upper() not in SYMBOLS or len(symbol.upper()) != 1:
+			raise ParseError("Link {} has '{}', expected one of {}".format(number, symbol, SYMBOLS), position + offset)
+	raise ParseError("Link {} needs {} symbols, found {}".format(number, LINK_LENGTH, len(link)), position)
+
+
+def _parseTokens(text):
+	tokens = text.split()
+	if len(tokens) < 8:
+		return None
+	center = CENTER_NAMES.get(tokens[0].upper())
+	if center is None:
+		center = tokens[0].upper()
+		if len(center) != 1 or center not in SYMBOLS:
+			return None
+	openings = "".join(tokens[1:-6]).split(",")
+	if len(openings) > 6:
+		return None
+	walls = [True] * 6
+	for opening in openings:
+		if len(opening) != 1 or opening not in "123456":
+			return None
+		walls[ord(opening) - ord("1")] = False
+	nodes = [link.upper() for link in tokens[-6:]]
+	for link in nodes:
+		if len(link) != LINK_LENGTH or link.strip(SYMBOLS):
+			return None
+	return {"center": center, "walls": walls, "nodes": nodes}
+
+
+def _parseText(text, pos):
+	end = len(text)
+
+	word = wordPattern.match(text, pos)
+	if not word:
+		raise ParseError("Expected the center symbol", pos)
+	center = _center(word.group(), pos)
+	pos = word.end()
+
+	# Openings: 1 to 6 side numbers separated by commas
+	walls = [True] * 6
+	pos = _skipSpace(text, pos)
+	for count in range(6):
+		if pos >= end or text[pos] not in "123456":
+			raise ParseError("Expected an opening between 1 and 6", pos)
+		walls[ord(text[pos]) - ord("1")] = False
+		comma = _skipSpace(text, pos + 1)
+		if count == 5 or comma >= end or text[comma] != ",":
+			pos += 1
+			break
+		pos = _skipSpace(text, comma + 1)
+
+	nodes = []
+	for number in range(1, 7):
+		pos = _skipSpace(text, pos)
+		if pos >= end:
+			raise ParseError("Expected 6 links, found {}".format(number - 1), pos)
+		nodes.append(_link(text[pos:pos + LINK_LENGTH], number, pos))
+		pos += LINK_LENGTH
+
+	pos = _skipSpace(text, pos)
+	if pos != end:
+		raise ParseError("Unexpected '{}' after the last link".format(text[pos]), pos)
+	return {"center": center, "walls": walls, "nodes": nodes}
+
+
+def _parseJSON(text, pos):
+	try:
+		data = json.loads(text)
+	except ValueError as ex:
+		raise ParseError("Invalid JSON: {}".format(getattr(ex, "msg", ex)), getattr(ex, "pos", pos))
+	except RecursionError:
+		raise ParseError("Invalid JSON: nested too deeply", pos)
+	if not isinstance(data, dict):
+		raise ParseError("Expected a JSON object", pos)
+
+	center = data.get("center")
+	if not isinstance(center, str) or not center:
+		raise ParseError("No center value was found in the JSON. This is required.", pos)
+	center = _center(center, pos)
+
+	walls = data.get("walls")
+	if not isinstance(walls, list) or len(walls) != 6:
+		raise ParseError("There should be 6 walls in the JSON.", pos)
+	if not all(isinstance(wall, bool) or wall in (0, 1) for wall in walls):
+		raise ParseError("Walls in the JSON must be true or false.", pos)
+
+	edges = data.get("nodes")
+	if not isinstance(edges, list) or len(edges) != 6:
+		raise ParseError("There should be 6 edges/nodes in the JSON.", pos)
+	nodes = []
+	for number, edge in enumerate(edges, 1):
+		if isinstance(edge, list):
+			try:
+				edge = "".join(edge)
+			except TypeError:
+				pass
+		if not isinstance(edge, str):
+			raise ParseError("Node {} in the JSON must be a list of symbols".format(number), pos)
+		try:
+			nodes.append(_link(edge, number, 0))
+		except ParseError as ex:
+			# Positions inside a JSON string don't mean much to anyone
+			raise ParseError(ex.message, pos)
+	return {"center": center, "walls": [bool(wall) for wall in walls], "nodes": nodes}
@@ -0,0 +1,70 @@
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from .models import PuzzlePiece, SubmitterPseudonym
+from .UtilityOps import UtilityOps
+from .pseudonyms import keyId
+import datetime
+
+# Bulk reprioritization for streamer campaigns, shared by the reprioritize
+# command and POST /api/pieces/reprioritize/. The queue orders by priority on
+# every request, so updated rows are served right away. Updates go in
+# chunks of primary keys, each its own short statement, so the table is
+# never locked for long.
+CHUNK = 1000
+
+
+class SelectionError(ValueError):
+	pass
+
+
+def parseMoment(value, endOfDay=False):
+	# "2020-11-20" or a full ISO datetime. A bare date as the upper end of a
+	# range includes that whole day.
+	try:
+		moment = parse_datetime(value)
+		day = parse_date(value) if moment is None else None
+	except ValueError:
+		moment = day = None
+	if moment is None:
+		if day is None:
+			raise SelectionError("Not a date: {!r}".format(value))
+		moment = datetime.datetime.combine(day + datetime.timedelta(days=1) if endOfDay else day, datetime.time())
+	if timezone.is_naive(moment):
+		moment = timezone.make_aware(moment, datetime.timezone.utc)
+	return moment
+
+
+def selectPieces(urls=(), hashes=(), submitters=(), since=None, until=None):
+	# Pieces matching any of the urls / hashes / submitters, within the date
+	# range if one is given. Urls match under any spelling (canonical hash),
+	# submitters by the pseudonym from the exports or the stored ip hash.
+	if not (urls or hashes or submitters or since or until):
+		raise SelectionError("Select pieces by url, hash, submitter or date")
+	match = Q()
+	wanted = set(hashes) | {UtilityOps.UrlHash(url) for url in urls}
+	if wanted:
+		match |= Q(hash__in=wanted)
+	if submitters:
+		addresses = set(submitters) | set(SubmitterPseudonym.objects.filter(pseudonym__in=submitters, keyId=keyId()).values_list("ip_address", flat=True))
+		match |= Q(ip_address__in=addresses)
+	pieces = PuzzlePiece.objects.filter(match)
+	if since:
+		pieces = pieces.filter(submitted_date__gte=parseMoment(since))
+	if until:
+		pieces = pieces.filter(submitted_date__lt=parseMoment(until, endOfDay=True))
+	return pieces
+
+
+def reprioritize(pieces, priority, chunk=CHUNK):
+	# Returns how many pieces changed. Walks the selection by id, so rows
+	# added while it runs don't shift the chunks.
+	updated = 0
+	lastId = 0
+	now = timezone.now()
+	while True:
+		ids = list(pieces.filter(id__gt=lastId).order_by("id").values_list("id", flat=True)[:chunk])
+		if not ids:
+			return updated
+		updated += PuzzlePiece.objects.filter(id__in=ids).exclude(priority=priority).update(priority=priority, last_modified=now)
+		lastId = ids[-1]
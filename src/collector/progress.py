@@ -0,0 +1,143 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import ProgressCounter
+import asyncio
+import json
+
+# Counters maintained on write, so the progress numbers never need a COUNT(*)
+PIECES = "pieces"
+SOLVED = "solved"
+BAD = "bad"
+TRANSCRIPTIONS = "transcriptions"
+
+PAYLOAD_KEY = "progress:payload"
+
+
+def dailyCounter(name, day=None):
+	return "{}:{}".format(name, (day or timezone.now().date()).isoformat())
+
+
+def increment(name, amount=1):
+	if not ProgressCounter.objects.filter(name=name).update(value=F("value") + amount):
+		try:
+			with transaction.atomic():
+				ProgressCounter.objects.create(name=name, value=amount)
+		except IntegrityError:
+			ProgressCounter.objects.filter(name=name).update(value=F("value") + amount)
+	cache.delete(PAYLOAD_KEY)
+
+
+def pieceSubmitted():
+	increment(PIECES)
+
+
+def transcriptionSubmitted(count=1):
+	increment(TRANSCRIPTIONS, count)
+	increment(dailyCounter(TRANSCRIPTIONS), count)
+
+
+def pieceSolved():
+	increment(SOLVED)
+
+
+def pieceMarkedBad():
+	increment(BAD)
+
+
+def progressPayload():
+	payload = cache.get(PAYLOAD_KEY)
+	if payload is None:
+		today = dailyCounter(TRANSCRIPTIONS)
+		values = dict(ProgressCounter.objects.filter(name__in=[PIECES, SOLVED, BAD, TRANSCRIPTIONS, today]).values_list("name", "value"))
+		payload = {
+			"pieces": values.get(PIECES, 0),
+			"solved": values.get(SOLVED, 0),
+			"bad": values.get(BAD, 0),
+			"remaining": max(0, values.get(PIECES, 0) - values.get(SOLVED, 0) - values.get(BAD, 0)),
+			"transcriptions": values.get(TRANSCRIPTIONS, 0),
+			"transcriptionsToday": values.get(today, 0),
+		}
+		cache.set(PAYLOAD_KEY, payload, settings.PROGRESS_CACHE_SECONDS)
+	return payload
+
+
+class ProgressBroadcaster:
+	# One poller per process reads the cached payload and wakes every open
+	# stream when it changed, so a thousand dashboards cost one cache read per
+	# interval instead of a thousand. The poller stops with the last stream.
+	def __init__(self):
+		self.payload = None
+		self.listeners = 0
+		self._changed = None
+		self._poller = None
+
+	async def wait(self, known, timeout):
+		if self._poller is None or self._poller.done():
+			self._changed = asyncio.Event()
+			self._poller = asyncio.ensure_future(self._poll())
+		if self.payload is not None and self.payload != known:
+			return self.payload
+		changed = self._changed
+		try:
+			await asyncio.wait_for(changed.wait(), timeout)
+		except asyncio.TimeoutError:
+			pass
+		return self.payload
+
+	async def _poll(self):
+		while self.listeners > 0:
+			payload = await sync_to_async(progressPayload)()
+			if payload != self.payload:
+				self.payload = payload
+				changed, self._changed = self._changed, asyncio.Event()
+				changed.set()
+			await asyncio.sleep(settings.PROGRESS_STREAM_INTERVAL)
+
+
+broadcaster = ProgressBroadcaster()
+
+
+async def progressStream(scope, receive, send):
+	# Server-Sent Events stream of the progress payload, served straight from
+	# puzzlepieces/asgi.py
+	await send({
+		"type": "http.response.start",
+		"status": 200,
+		"headers": [
+			(b"content-type", b"text/event-stream"),
+			(b"cache-control", b"no-cache"),
+			(b"x-accel-buffering", b"no"),
+		],
+	})
+
+	disconnected = asyncio.Event()
+
+	async def watchDisconnect():
+		while True:
+			message = await receive()
+			if message["type"] == "http.disconnect":
+				disconnected.set()
+				return
+
+	watcher = asyncio.ensure_future(watchDisconnect())
+	broadcaster.listeners += 1
+	sent = None
+	try:
+		while not disconnected.is_set():
+			payload = await broadcaster.wait(sent, settings.PROGRESS_STREAM_KEEPALIVE)
+			if disconnected.is_set():
+				break
+			if payload is not None and payload != sent:
+				body = "data: {}\n\n".format(json.dumps(payload))
+				sent = payload
+			else:
+				# Comment line, keeps proxies from closing an idle connection
+				body = ": keepalive\n\n"
+			await send({"type": "http.response.body", "body": body.encode("utf-8"), "more_body": True})
+	finally:
+		broadcaster.listeners -= 1
+		watcher.cancel()
@@ -0,0 +1,49 @@
+from django.conf import settings
+from .models import SubmitterPseudonym
+from .UtilityOps import UtilityOps
+import hashlib
+
+# Submitter ids for the exports and the transcriber API, HMAC of the stored
+# ip hash with PSEUDONYM_KEY. Computed once per submitter and kept in
+# SubmitterPseudonym. After changing the key run `manage.py rebuildpseudonyms`,
+# until then rows made with the old key are ignored, recomputed and replaced.
+
+
+def keyId():
+	return hashlib.sha256(settings.PSEUDONYM_KEY.encode("utf-8")).hexdigest()[:16]
+
+
+def pseudonym(ip_address):
+	return UtilityOps.SecretlyHash(ip_address)
+
+
+class PseudonymMap(dict):
+	# ip hash -> pseudonym for one export run or API page, all submitters or
+	# just the given ones. Submitters missing from the table are computed on
+	# first use and stored by save().
+	def __init__(self, ipAddresses=None):
+		known = SubmitterPseudonym.objects.filter(keyId=keyId())
+		if ipAddresses is not None:
+			known = known.filter(ip_address__in=set(ipAddresses))
+		super().__init__(known.values_list("ip_address", "pseudonym"))
+		self.added = []
+
+	def __missing__(self, ip_address):
+		value = self[ip_address] = pseudonym(ip_address)
+		self.added.append(ip_address)
+		return value
+
+	def save(self, batchSize=1000):
+		# Rows left from an older key are overwritten, the rest inserted
+		current = keyId()
+		for start in range(0, len(self.added), batchSize):
+			batch = self.added[start:start + batchSize]
+			stale = dict(SubmitterPseudonym.objects.filter(ip_address__in=batch).values_list("ip_address", "id"))
+			SubmitterPseudonym.objects.bulk_update(
+				[SubmitterPseudonym(id=stale[ip], pseudonym=self[ip], keyId=current) for ip in batch if ip in stale],
+				["pseudonym", "keyId"])
+			# Conflicts are other requests storing the same submitter just now
+			SubmitterPseudonym.objects.bulk_create(
+				[SubmitterPseudonym(ip_address=ip, pseudonym=self[ip], keyId=current) for ip in batch if ip not in stale],
+				ignore_conflicts=True)
+		self.added = []
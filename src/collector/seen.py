@@ -0,0 +1,54 @@
+from django.conf import settings
+from django.core.cache import cache
+from .models import TranscriptionData
+import hashlib
+
+# Per person Bloom filter of the pieces they transcribed, kept in the cache so
+# the queue can skip them without asking the database on every request.
+# 64k bits and 4 hashes: about 0.5% false positives at 5000 pieces, a false
+# positive only means a piece is skipped for that person.
+FILTER_BITS = 65536
+FILTER_HASHES = 4
+
+
+def _key(client_ip_address):
+	return "seen:" + client_ip_address
+
+
+def _positions(puzzlepieceId):
+	digest = hashlib.blake2b(str(puzzlepieceId).encode("utf-8"), digest_size=2 * FILTER_HASHES).digest()
+	return [int.from_bytes(digest[i:i + 2], "big") % FILTER_BITS for i in range(0, 2 * FILTER_HASHES, 2)]
+
+
+class SeenFilter:
+	def __init__(self, bits=None):
+		self.bits = bytearray(bits or FILTER_BITS // 8)
+
+	def add(self, puzzlepieceId):
+		for pos in _positions(puzzlepieceId):
+			self.bits[pos >> 3] |= 1 << (pos & 7)
+
+	def __contains__(self, puzzlepieceId):
+		return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in _positions(puzzlepieceId))
+
+
+def seenFilter(client_ip_address):
+	bits = cache.get(_key(client_ip_address))
+	if bits is not None:
+		return SeenFilter(bits)
+	# Not cached (yet), one indexed read of everything this person did
+	seen = SeenFilter()
+	for puzzlepieceId in TranscriptionData.objects.filter(ip_address=client_ip_address).values_list("puzzlePiece_id", flat=True).iterator():
+		seen.add(puzzlepieceId)
+	cache.set(_key(client_ip_address), bytes(seen.bits), settings.SEEN_FILTER_SECONDS)
+	return seen
+
+
+def markSeen(client_ip_address, puzzlepieceId):
+	# Only updates a cached filter, a missing one is rebuilt from the database
+	bits = cache.get(_key(client_ip_address))
+	if bits is None:
+		return
+	seen = SeenFilter(bits)
+	seen.add(puzzlepieceId)
+	cache.set(_key(client_ip_address), bytes(seen.bits), settings.SEEN_FILTER_SECONDS)
@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from . import models
+from . import pseudonyms
 
 class TranscriptionDataSerializer(serializers.ModelSerializer):
     class Meta:
@@ -52,7 +53,37 @@ class BadImageSerializer(serializers.ModelSerializer):
         fields = ['puzzlePiece', 'badCount']
 
 
+class TranscriberStatsSerializer(serializers.ModelSerializer):
+    submitter = serializers.SerializerMethodField()
+
+    class Meta:
+        model = models.TranscriberStats
+        fields = [
+            'submitter', 'last_active',
+            'transcriptionCount', 'badImageCount',
+            'resolvedCount', 'agreedCount', 'agreementRate',
+        ]
+
+    def get_submitter(self, stats):
+        # same pseudonym as in the CSV exports, never the stored ip hash. The
+        # view passes a PseudonymMap for the page.
+        submitters = self.context.get('pseudonyms')
+        if submitters is None:
+            return pseudonyms.pseudonym(stats.ip_address)
+        return submitters[stats.ip_address]
+
+
 class ConfidentSolutionSerializer(serializers.ModelSerializer):
     class Meta:
         model = models.PuzzlePiece
         fields = ['url', 'approved']
+
+
+class ReprioritizeSerializer(serializers.Serializer):
+    # Body of POST /api/pieces/reprioritize/, see collector/priority.py
+    priority = serializers.IntegerField(min_value=0)
+    urls = serializers.ListField(child=serializers.CharField(), required=False, default=list)
+    hashes = serializers.ListField(child=serializers.CharField(), required=False, default=list)
+    submitters = serializers.ListField(child=serializers.CharField(), required=False, default=list)
+    since = serializers.CharField(required=False, default=None)
+    until = serializers.CharField(required=False, default=None)
@@ -0,0 +1,170 @@
+from collections import namedtuple, deque
+from contextlib import contextmanager
+import csv
+import threading
+
+# Side n of a piece touches side n+3 of its neighbour, and both sides show the
+# same seven symbols. Sides are numbered like the wall/link fields: 1 is the
+# top edge, going clockwise.
+OPPOSITE_SIDE = {1: 4, 2: 5, 3: 6, 4: 1, 5: 2, 6: 3}
+
+# Axial hex coordinates (q, r) of the neighbour behind each side
+SIDE_OFFSETS = {1: (0, -1), 2: (1, -1), 3: (1, 0), 4: (0, 1), 5: (-1, 1), 6: (-1, 0)}
+
+# A side without symbols, shared by hundreds of pieces and never a real link
+BLANK_LINK = "BBBBBBB"
+
+SolverPiece = namedtuple("SolverPiece", ["key", "center", "walls", "links", "url"])
+
+
+def pieceFromSolution(solution):
+	return SolverPiece(
+		key=solution.datahash,
+		center=solution.center,
+		walls=(solution.wall1, solution.wall2, solution.wall3, solution.wall4, solution.wall5, solution.wall6),
+		links=(solution.link1, solution.link2, solution.link3, solution.link4, solution.link5, solution.link6),
+		url=solution.puzzlePiece.url,
+	)
+
+
+def piecesFromCSV(path):
+	# Reads the format written by exportVerifiedCSV
+	with open(path, newline="") as infile:
+		for row in csv.DictReader(infile):
+			openings = [int(o) for o in row["Openings"].split(",") if o.strip()]
+			yield SolverPiece(
+				key=row["Transcription hash"],
+				center=row["Center"],
+				walls=tuple((i + 1) not in openings for i in range(6)),
+				links=tuple(row["Link{}".format(i + 1)].upper() for i in range(6)),
+				url=row["Image"],
+			)
+
+
+class MapSolver:
+	def __init__(self):
+		self.pieces = {}
+		# (link code, side) -> keys of all pieces showing that code on that side
+		self._linkIndex = {}
+		# union-find over piece keys, one set per connected component
+		self._parent = {}
+		self._size = {}
+		self.lastSolutionId = 0
+		# Solutions read from the database so far
+		self.solutionCount = 0
+
+	def __len__(self):
+		return len(self.pieces)
+
+	def addPiece(self, piece):
+		# Returns the (side, neighbour key) links the new piece created.
+		# Identical transcriptions of the same in-game piece share a key and
+		# are only added once.
+		if piece.key in self.pieces:
+			return []
+		self.pieces[piece.key] = piece
+		self._parent[piece.key] = piece.key
+		self._size[piece.key] = 1
+
+		found = []
+		for side, link in enumerate(piece.links, start=1):
+			if not link or link == BLANK_LINK:
+				continue
+			for other in self._linkIndex.get((link, OPPOSITE_SIDE[side]), ()):
+				found.append((side, other))
+				self._union(piece.key, other)
+			self._linkIndex.setdefault((link, side), set()).add(piece.key)
+		return found
+
+	def addSolution(self, solution):
+		if solution.id > self.lastSolutionId:
+			self.lastSolutionId = solution.id
+		return self.addPiece(pieceFromSolution(solution))
+
+	def catchUp(self):
+		# Pull in solutions created since the last call, the primary key works
+		# as a cursor. Solutions are nearly always appended, but when some were
+		# deleted (admin, a merge) the indexes start over from scratch.
+		from .models import ConfidentSolution
+		if self.solutionCount and ConfidentSolution.objects.filter(id__lte=self.lastSolutionId).count() < self.solutionCount:
+			self.__init__()
+		solutions = ConfidentSolution.objects.filter(id__gt=self.lastSolutionId).select_related("puzzlePiece").order_by("id")
+		added = 0
+		for solution in solutions.iterator():
+			self.addSolution(solution)
+			added += 1
+		self.solutionCount += added
+		return added
+
+	def neighbours(self, key):
+		piece = self.pieces[key]
+		result = []
+		for side, link in enumerate(piece.links, start=1):
+			if not link or link == BLANK_LINK:
+				continue
+			for other in self._linkIndex.get((link, OPPOSITE_SIDE[side]), ()):
+				result.append((side, other))
+		return result
+
+	def componentOf(self, key):
+		return self._find(key)
+
+	def components(self):
+		groups = {}
+		for key in self.pieces:
+			groups.setdefault(self._find(key), []).append(key)
+		return sorted(groups.values(), key=len, reverse=True)
+
+	def layout(self, key):
+		# Place the component containing key on a hex grid, starting at (0, 0).
+		# Returns positions per key plus the keys whose links disagree with
+		# the placement (usually a bad transcription).
+		positions = {key: (0, 0)}
+		conflicts = set()
+		queue = deque([key])
+		while queue:
+			current = queue.popleft()
+			q, r = positions[current]
+			for side, other in self.neighbours(current):
+				dq, dr = SIDE_OFFSETS[side]
+				target = (q + dq, r + dr)
+				if other not in positions:
+					positions[other] = target
+					queue.append(other)
+				elif positions[other] != target:
+					conflicts.add(other)
+		return positions, conflicts
+
+	def _find(self, key):
+		root = key
+		while self._parent[root] != root:
+			root = self._parent[root]
+		while self._parent[key] != root:
+			self._parent[key], key = root, self._parent[key]
+		return root
+
+	def _union(self, a, b):
+		a = self._find(a)
+		b = self._find(b)
+		if a == b:
+			return
+		if self._size[a] < self._size[b]:
+			a, b = b, a
+		self._parent[b] = a
+		self._size[a] += self._size[b]
+
+
+# Every process keeps one solver and tops it up from the database on access.
+# Hold the lock while reading from it, catchUp mutates the indexes.
+_solver = None
+_solverLock = threading.Lock()
+
+
+@contextmanager
+def sharedSolver():
+	global _solver
+	with _solverLock:
+		if _solver is None:
+			_solver = MapSolver()
+		_solver.catchUp()
+		yield _solver
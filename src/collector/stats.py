@@ -0,0 +1,42 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+from .models import TranscriberStats, TranscriptionData
+
+
+def _increment(ip_address, **counts):
+	# Atomic increments, so concurrent submissions by the same person can't
+	# lose updates. The first submission creates the row.
+	updates = {field: F(field) + value for field, value in counts.items()}
+	if "transcriptionCount" in counts:
+		updates["last_active"] = timezone.now()
+	if TranscriberStats.objects.filter(ip_address=ip_address).update(**updates):
+		return
+	try:
+		with transaction.atomic():
+			TranscriberStats.objects.create(ip_address=ip_address, last_active=updates.get("last_active"), **counts)
+	except IntegrityError:
+		# Someone else created it in the meantime
+		TranscriberStats.objects.filter(ip_address=ip_address).update(**updates)
+
+
+def recordTranscription(ip_address, bad_image):
+	_increment(ip_address, transcriptionCount=1, badImageCount=1 if bad_image else 0)
+
+
+def recordResolution(puzzlepieceId, datahash):
+	# A piece just got its confident solution: everyone who transcribed it
+	# either agreed with it or not
+	perSubmitter = TranscriptionData.objects.filter(puzzlePiece_id=puzzlepieceId, bad_image=False) \
+		.values("ip_address") \
+		.annotate(total=Count("id"), agreed=Count("id", filter=Q(datahash=datahash)))
+	for row in perSubmitter:
+		_increment(row["ip_address"], resolvedCount=row["total"], agreedCount=row["agreed"])
+	updateAgreementRates([row["ip_address"] for row in perSubmitter])
+
+
+def updateAgreementRates(ip_addresses):
+	# Only the accuracy leaderboard reads it so far, evaluateConfidence still
+	# counts every vote the same
+	TranscriberStats.objects.filter(ip_address__in=ip_addresses, resolvedCount__gt=0) \
+		.update(agreementRate=F("agreedCount") * 100.0 / F("resolvedCount"))
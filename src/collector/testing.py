@@ -0,0 +1,100 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import re
+import threading
+import time
+
+# Small HTTP server standing in for Discord/imgur/gyazo in tests and
+# benchmarks, so nothing has to reach out to the real image hosts.
+#
+#	with StubHTTPServer({"/a.png": (200, "image/png", data)}) as server:
+#		requests.get(server.url("/a.png"))
+#
+# Unknown paths answer 404, or default if given. A route can carry a dict of
+# extra headers as a fourth item. Set delay to simulate a slow host. Used as HTTP_PROXY it answers for every host.
+
+
+class StubHTTPServer:
+	def __init__(self, routes=None, delay=0, default=(404, "text/plain", b"not found")):
+		self.routes = dict(routes or {})
+		self.default = default
+		self.delay = delay
+		self.requests = []
+		self._server = None
+		self._thread = None
+
+	def url(self, path):
+		return "http://127.0.0.1:{}{}".format(self._server.server_address[1], path)
+
+	def start(self):
+		stub = self
+
+		class Handler(BaseHTTPRequestHandler):
+			def _respond(self, body):
+				stub.requests.append((self.command, self.path))
+				if stub.delay:
+					time.sleep(stub.delay)
+				status, contentType, data, *headers = stub.routes.get(self.path, stub.default)
+				self.send_response(status)
+				self.send_header("Content-Type", contentType)
+				for name, value in (headers[0] if headers else {}).items():
+					self.send_header(name, value)
+				self.send_header("Content-Length", str(len(data)))
+				self.end_headers()
+				if body:
+					self.wfile.write(data)
+
+			def do_GET(self):
+				self._respond(True)
+
+			def do_HEAD(self):
+				self._respond(False)
+
+			def log_message(self, format, *args):
+				pass
+
+		self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+		self._server.daemon_threads = True
+		self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+		self._thread.start()
+		return self
+
+	def stop(self):
+		self._server.shutdown()
+		self._server.server_close()
+		self._thread.join()
+
+	def __enter__(self):
+		return self.start()
+
+	def __exit__(self, *exc):
+		self.stop()
+
+
+# How the web form parsed submissions before collector/parsing.py, unchanged,
+# as the reference for the parser tests and parsebench. The parser differs on
+# purpose where this was wrong, see ParserTests.
+legacyPattern = re.compile(r"^\s*(?P<center>(Blank|Plus|Clover|Hex|Snake|Diamond|Cauldron|B|P|C|H|S|D|T))\s*(?P<sides>([1-6])(\s*,\s*[1-6]){0,5})(?P<links>(\s*[BPCHSDT]{7}){6})\s*$", re.IGNORECASE)
+
+
+def legacyParse(text):
+	try:
+		return json.loads(text)
+	except Exception:
+		match = legacyPattern.match(text)
+		if match:
+			return legacyParseDataString(match)
+		return None
+
+
+def legacyParseDataString(matchedData):
+	data_dict = {}
+	data_dict["center"] = "T" if matchedData.group('center') == "Cauldron" else matchedData.group('center').upper()[0]
+	data_dict["walls"] = [True] * 6
+	for opening in matchedData.group('sides').split(","):
+		data_dict["walls"][int(opening) - 1] = False
+	data_dict["nodes"] = []
+	side_list = matchedData.group('links').split()
+	for side in side_list:
+		data_dict["nodes"].append(list(side.upper()))
+	return data_dict
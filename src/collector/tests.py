@@ -1,3 +1,870 @@
-from django.test import TestCase
+from asgiref.sync import sync_to_async
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connections
+from django.http import HttpResponse
+from django.test import AsyncClient, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from io import BytesIO
+from PIL import Image
+from puzzlepieces import metrics
+from .imaging import MultiIndexHash
+from .management.commands import cacheimages, phashpieces, sweepdeadlinks
+from .models import ArchivedTranscription, ConfidenceTracking, ConfidentSolution, PuzzlePiece, SubmitterPseudonym, TranscriberStats, TranscriptionData
+from .parsing import parseSubmission, ParseError, CENTER_NAMES, SYMBOLS
+from .priority import selectPieces
+from .solver import MapSolver
+from .testing import StubHTTPServer, legacyParse, legacyPattern
+from .views import QUEUE_WINDOW, evaluateConfidence, hash_my_data, oneVotePerSubmitter
+from .UtilityOps import UtilityOps
+from . import archive
+from . import dbrouting
+from . import ingest
+from . import leases
+from . import locks
+from . import pseudonyms
+from . import stats
+import datetime
+import gzip
+import importlib
+import json
+import random
+import requests
+import tempfile
+import time
 
-# Create your tests here.
+
+def pngImage(size=(64, 48), color=(200, 40, 40)):
+	image = Image.new("RGB", size, color)
+	for x in range(size[0] // 2):
+		image.putpixel((x, x % size[1]), (0, 0, 0))
+	output = BytesIO()
+	image.save(output, "PNG")
+	return output.getvalue()
+
+
+def stubSession():
+	# Straight to the stub, not through whatever proxy the environment sets
+	session = requests.Session()
+	session.trust_env = False
+	return session
+
+
+def addPiece(url, **fields):
+	fields.setdefault("approved", True)
+	fields.setdefault("hash", url)
+	return PuzzlePiece.objects.create(url=url, **fields)
+
+
+class PhashPiecesTests(TestCase):
+	def run_process(self, limit=10):
+		return phashpieces.Command().process(stubSession(), MultiIndexHash(3), limit)
+
+	def test_hashes_fetched_images(self):
+		with StubHTTPServer({"/a.png": (200, "image/png", pngImage())}) as server:
+			piece = addPiece(server.url("/a.png"))
+			self.assertEqual(self.run_process(), (1, 0))
+		piece.refresh_from_db()
+		self.assertEqual(len(piece.phash), 16)
+		self.assertIsNone(piece.phashAttempted)
+
+	def test_undecodable_image_is_marked(self):
+		with StubHTTPServer({"/a.png": (200, "image/png", b"not an image")}) as server:
+			piece = addPiece(server.url("/a.png"))
+			self.assertEqual(self.run_process(), (0, 0))
+		piece.refresh_from_db()
+		self.assertEqual(piece.phash, phashpieces.UNREADABLE)
+
+	def test_failed_fetch_is_not_retried_right_away(self):
+		with StubHTTPServer() as server:
+			piece = addPiece(server.url("/gone.png"))
+			self.run_process()
+			piece.refresh_from_db()
+			self.assertEqual(piece.phash, "")
+			self.assertIsNotNone(piece.phashAttempted)
+
+			self.run_process()
+			self.assertEqual(len(server.requests), 1)
+
+			# Once the retry time is over it is fetched again
+			PuzzlePiece.objects.filter(id=piece.id).update(phashAttempted=timezone.now() - datetime.timedelta(days=1))
+			self.run_process()
+			self.assertEqual(len(server.requests), 2)
+
+	def test_failures_do_not_starve_the_queue(self):
+		with StubHTTPServer({"/ok.png": (200, "image/png", pngImage())}) as server:
+			failing = addPiece(server.url("/gone.png"))
+			working = addPiece(server.url("/ok.png"))
+			self.run_process(limit=1)
+			self.run_process(limit=1)
+		failing.refresh_from_db()
+		working.refresh_from_db()
+		self.assertEqual(failing.phash, "")
+		self.assertNotIn(working.phash, ("", phashpieces.UNREADABLE))
+
+
+class CacheImagesTests(TestCase):
+	def setUp(self):
+		directory = tempfile.TemporaryDirectory()
+		self.addCleanup(directory.cleanup)
+		override = override_settings(IMAGE_CACHE_ROOT=directory.name)
+		override.enable()
+		self.addCleanup(override.disable)
+
+	def run_process(self, limit=10):
+		return cacheimages.Command().process(stubSession(), limit)
+
+	def test_caches_fetched_images(self):
+		with StubHTTPServer({"/a.png": (200, "image/png", pngImage())}) as server:
+			piece = addPiece(server.url("/a.png"))
+			self.assertEqual(self.run_process(), 1)
+		piece.refresh_from_db()
+		self.assertNotIn(piece.cachedImage, ("", cacheimages.UNREADABLE))
+
+	def test_failures_do_not_starve_the_queue(self):
+		with StubHTTPServer({"/ok.png": (200, "image/png", pngImage())}) as server:
+			failing = addPiece(server.url("/gone.png"), priority=10)
+			working = addPiece(server.url("/ok.png"))
+			self.assertEqual(self.run_process(limit=1), 0)
+			self.assertEqual(self.run_process(limit=1), 1)
+			self.assertEqual(len(server.requests), 2)
+		failing.refresh_from_db()
+		working.refresh_from_db()
+		self.assertEqual(failing.cachedImage, "")
+		self.assertIsNotNone(failing.cacheAttempted)
+		self.assertNotEqual(working.cachedImage, "")
+
+
+@override_settings(REQUEST_METRICS_ENABLED=True)
+class RequestMetricsTests(TestCase):
+	def setUp(self):
+		metrics._stats.clear()
+		# The test database was connected before any middleware was loaded
+		for connection in connections.all():
+			metrics.installQueryCounter(connection)
+		self.piece = addPiece("https://i.imgur.com/a.png")
+
+	def queriesOf(self, view):
+		return metrics._stats[view].queries
+
+	def test_counts_queries_of_sync_views(self):
+		self.client.get("/puzzlepieces/{}/".format(self.piece.id))
+		self.assertGreater(self.queriesOf("puzzlepieceView"), 0)
+
+	async def test_counts_queries_of_async_views(self):
+		await AsyncClient().get("/api/changes/pieces")
+		self.assertGreater(self.queriesOf("changesFeed"), 0)
+
+
+class LeaseTests(TestCase):
+	def setUp(self):
+		cache.clear()
+
+	def test_counts_one_lease_per_transcriber(self):
+		leases.lease(1, "alice")
+		leases.lease(1, "alice")
+		leases.lease(1, "bob")
+		self.assertEqual(leases.inFlight([1, 2]), {1: 2, 2: 0})
+
+	def test_new_piece_gives_back_the_old_one(self):
+		leases.lease(1, "alice")
+		leases.lease(2, "alice")
+		self.assertEqual(leases.inFlight([1, 2]), {1: 0, 2: 1})
+
+	def test_release_gives_back_the_submitters_lease(self):
+		leases.lease(1, "alice")
+		leases.lease(1, "bob")
+		leases.release(1, "carol")
+		leases.release(2, "bob")
+		self.assertEqual(leases.inFlight([1]), {1: 2})
+		leases.release(1, "bob")
+		self.assertEqual(leases.inFlight([1]), {1: 1})
+		leases.lease(1, "bob")
+		self.assertEqual(leases.inFlight([1]), {1: 2})
+
+	@override_settings(LEASE_SLOTS=2)
+	def test_full_piece_takes_no_more_leases(self):
+		for client in ("alice", "bob", "carol"):
+			leases.lease(1, client)
+		self.assertEqual(leases.inFlight([1]), {1: 2})
+
+
+def randomSubmission(rng):
+	center = rng.choice(list(CENTER_NAMES) + list(SYMBOLS))
+	center = "".join(c.lower() if rng.random() < 0.3 else c for c in center)
+	openings = rng.sample("123456", rng.randint(1, 6))
+	links = ["".join(rng.choice(SYMBOLS + SYMBOLS.lower()) for _ in range(7)) for _ in range(6)]
+	space = lambda: rng.choice(["", " ", "  ", "\t", "\n"])
+	gap = lambda: rng.choice([" ", "  ", "\t", "\n"])
+	return center + space() + (space() + "," + space()).join(openings) + "".join(gap() + link for link in links) + space()
+
+
+def mutate(rng, text):
+	noise = "BPCHSDTbpchsdt123456780, \t\n\x1c\xa0{}[]\":xyzſK"
+	for _ in range(rng.randint(1, 3)):
+		pos = rng.randrange(len(text) + 1)
+		action = rng.random()
+		if action < 0.4:
+			text = text[:pos] + rng.choice(noise) + text[pos:]
+		elif action < 0.8:
+			text = text[:pos] + text[pos + 1:]
+		else:
+			text = text[:pos] + rng.choice(noise) + text[pos + 1:]
+	return text
+
+
+def intendedDifference(text):
+	# Inputs where the old code was wrong and the parser is not supposed to
+	# agree with it, each pinned by a test in ParserTests
+	match = legacyPattern.match(text)
+	if not match:
+		return False
+	center = match.group("center")
+	if center.upper() == "CAULDRON" and center != "Cauldron":
+		return True
+	try:
+		legacy = legacyParse(text)
+	except ValueError:
+		# int() on separators it doesn't strip
+		return True
+	return len(legacy["nodes"]) != 6
+
+
+class ParserTests(TestCase):
+	SEED = 2020
+	CASES = 5000
+
+	def assertParses(self, text, center, openings, nodes):
+		self.assertEqual(parseSubmission(text), {
+			"center": center,
+			"walls": [str(side) not in openings for side in range(1, 7)],
+			"nodes": nodes,
+		})
+
+	def assertErrorAt(self, text, position):
+		with self.assertRaises(ParseError) as raised:
+			parseSubmission(text)
+		self.assertEqual(raised.exception.position, position, raised.exception.message)
+
+	def test_agrees_with_legacy_parser(self):
+		rng = random.Random(self.SEED)
+		for i in range(self.CASES):
+			text = randomSubmission(rng)
+			if i % 2:
+				text = mutate(rng, text)
+			if intendedDifference(text):
+				continue
+			try:
+				parsed = parseSubmission(text)
+			except ParseError as ex:
+				self.assertTrue(0 <= ex.position <= len(text), text)
+				parsed = None
+			legacy = legacyParse(text)
+			if legacy is not None:
+				legacy["nodes"] = ["".join(node) for node in legacy["nodes"]]
+			self.assertEqual(parsed, legacy, text)
+
+	def test_parses_json(self):
+		text = json.dumps({"center": "T", "walls": [True, False, True, True, False, True], "nodes": [list("BPCHSDT")] * 6})
+		self.assertParses(text, "T", "25", ["BPCHSDT"] * 6)
+
+	def test_rejects_json_the_legacy_parser_passed_through(self):
+		for text in ("5", "[]", '{"center": "X"}', '{"center": "B", "walls": [true], "nodes": []}'):
+			self.assertIsNotNone(legacyParse(text))
+			self.assertRaises(ParseError, parseSubmission, text)
+
+	def test_any_cauldron_spelling_is_t(self):
+		# The old code only knew "Cauldron", the rest became C (Clover)
+		for center in ("Cauldron", "cauldron", "CAULDRON"):
+			text = center + " 1 BPCHSDT BPCHSDT BPCHSDT BPCHSDT BPCHSDT BPCHSDT"
+			self.assertParses(text, "T", "1", ["BPCHSDT"] * 6)
+		self.assertEqual(legacyParse("cauldron 1 BPCHSDT BPCHSDT BPCHSDT BPCHSDT BPCHSDT BPCHSDT")["center"], "C")
+
+	def test_control_character_separator(self):
+		# \x1c is whitespace to the regex but not to int(), the old code crashed
+		text = "B 1\x1c,2 BPCHSDT BPCHSDT BPCHSDT BPCHSDT BPCHSDT BPCHSDT"
+		self.assertRaises(ValueError, legacyParse, text)
+		self.assertParses(text, "B", "12", ["BPCHSDT"] * 6)
+
+	def test_links_without_spaces(self):
+		# The old code made one node of everything not separated by whitespace
+		text = "B 1 " + "BPCHSDT" * 6
+		self.assertEqual(len(legacyParse(text)["nodes"]), 1)
+		self.assertParses(text, "B", "1", ["BPCHSDT"] * 6)
+
+	def test_error_positions(self):
+		links = " BPCHSDT" * 6
+		self.assertErrorAt("", 0)
+		self.assertErrorAt("X 1" + links, 0)
+		self.assertErrorAt("  Blank 7" + links, 8)
+		self.assertErrorAt("B 1," + links, 5)
+		self.assertErrorAt("B 1 BPCHSDT BPCHSDT BPCHSDT BPCHSDT BPCHSDT BPCHXDT", 48)
+		self.assertErrorAt("B 1 BPCHSDT", 11)
+		self.assertErrorAt("B 1" + links + " !", 52)
+		self.assertErrorAt('{"center": "B"', 14)
+
+	def test_adversarial_input_fails_fast(self):
+		# Whitespace the old regex could split many ways before failing at the end
+		length = 20000
+		for text in (
+			"B 1" + " " * length + "BPCHSDT" * 5 + "BPCHSD!",
+			"B 1 " + (" " * (length // 6) + "BPCHSDT") * 6 + "!",
+			"B" * length,
+			'{"center":"B","walls":[[1],1,1,1,1,1],"nodes":[]}',
+			'{"a":' + "[" * 200000,
+		):
+			start = time.perf_counter()
+			self.assertRaises(ParseError, parseSubmission, text)
+			self.assertLess(time.perf_counter() - start, 0.5)
+
+
+class ChangesFeedTests(TestCase):
+	async def test_rejects_wait_that_is_not_a_number(self):
+		client = AsyncClient()
+		for wait in ("nan", "inf", "-inf", "soon"):
+			response = await client.get("/api/changes/pieces?wait=" + wait)
+			self.assertEqual(response.status_code, 400, wait)
+
+	async def test_returns_right_away_without_wait(self):
+		response = await AsyncClient().get("/api/changes/pieces?wait=0")
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(response["X-Next-Cursor"], "")
+
+
+class PseudonymTests(TestCase):
+	def test_save_replaces_rows_of_an_old_key(self):
+		SubmitterPseudonym.objects.create(ip_address="alice", pseudonym="old", keyId="oldkey")
+		submitters = pseudonyms.PseudonymMap()
+		self.assertEqual(submitters["alice"], pseudonyms.pseudonym("alice"))
+		submitters["bob"]
+		submitters.save()
+		self.assertEqual(
+			set(SubmitterPseudonym.objects.values_list("ip_address", "pseudonym", "keyId")),
+			{(ip, pseudonyms.pseudonym(ip), pseudonyms.keyId()) for ip in ("alice", "bob")})
+
+	def test_transcriber_api_uses_stored_pseudonyms(self):
+		TranscriberStats.objects.create(ip_address="alice", transcriptionCount=3)
+		response = self.client.get("/api/transcribers/")
+		self.assertEqual(response.json()[0]["submitter"], pseudonyms.pseudonym("alice"))
+		self.assertEqual(SubmitterPseudonym.objects.get(ip_address="alice").keyId, pseudonyms.keyId())
+
+	def test_selection_ignores_pseudonyms_of_an_old_key(self):
+		piece = addPiece("https://i.imgur.com/a.png", ip_address="alice")
+		SubmitterPseudonym.objects.create(ip_address="alice", pseudonym="old", keyId="oldkey")
+		self.assertFalse(selectPieces(submitters=["old"]).exists())
+		current = pseudonyms.pseudonym("alice")
+		self.assertFalse(selectPieces(submitters=[current]).exists())
+		submitters = pseudonyms.PseudonymMap(["alice"])
+		submitters["alice"]
+		submitters.save()
+		self.assertEqual(list(selectPieces(submitters=[current])), [piece])
+
+
+def addSolution(piece, datahash, links=("BPCHSDT",) * 6):
+	walls = {"wall{}".format(i): True for i in range(1, 7)}
+	linkFields = {"link{}".format(i): link for i, link in enumerate(links, 1)}
+	return ConfidentSolution.objects.create(puzzlePiece=piece, datahash=datahash, center="B", **walls, **linkFields)
+
+
+def newTranscription(piece, ip, datahash="a" * 64, bad_image=False):
+	# Unsaved, the way the views build them
+	walls = {"wall{}".format(i): True for i in range(1, 7)}
+	links = {"link{}".format(i): "BPCHSDT" for i in range(1, 7)}
+	return TranscriptionData(puzzlePiece=piece, ip_address=ip, datahash=datahash, bad_image=bad_image, center="B", **walls, **links)
+
+
+class MergeDuplicatesTests(TestCase):
+	def merge(self):
+		migration = importlib.import_module("collector.migrations.0032_canonical_piece_hashes")
+		migration.merge_duplicates(apps, None)
+
+	def test_marks_duplicates_instead_of_deleting_them(self):
+		keep = addPiece("https://i.imgur.com/abc.png")
+		duplicate = addPiece("https://imgur.com/abc")
+		solution = addSolution(duplicate, "a")
+		before = timezone.now()
+		self.merge()
+
+		keep.refresh_from_db()
+		duplicate.refresh_from_db()
+		solution.refresh_from_db()
+		self.assertEqual(keep.hash, UtilityOps.UrlHash(keep.url))
+		self.assertEqual(duplicate.duplicateOf_id, keep.id)
+		self.assertEqual(duplicate.hash, "duplicate:{}".format(duplicate.id))
+		self.assertGreaterEqual(duplicate.last_modified, before)
+		self.assertEqual(solution.puzzlePiece_id, keep.id)
+		self.assertGreaterEqual(solution.last_modified, before)
+		# Not dead, just out of the queue
+		self.assertFalse(duplicate.deadLink)
+
+	def test_revives_duplicates_marked_dead(self):
+		migration = importlib.import_module("collector.migrations.0039_revive_merged_duplicates")
+		keep = addPiece("https://i.imgur.com/abc.png")
+		merged = addPiece("https://imgur.com/abc", hash="duplicate:1", duplicateOf=keep, deadLink=True)
+		swept = addPiece("https://imgur.com/def", hash="duplicate:2", duplicateOf=keep, deadLink=True, linkChecked=timezone.now())
+		migration.revive_merged_duplicates(apps, None)
+		merged.refresh_from_db()
+		swept.refresh_from_db()
+		self.assertFalse(merged.deadLink)
+		self.assertTrue(swept.deadLink)
+
+
+class SolverTests(TestCase):
+	def test_rebuilds_when_solutions_were_deleted(self):
+		first = addSolution(addPiece("https://i.imgur.com/a.png"), "a", ("BPCHSDT",) * 6)
+		addSolution(addPiece("https://i.imgur.com/b.png"), "b", ("PPPPPPP",) * 6)
+		solver = MapSolver()
+		self.assertEqual(solver.catchUp(), 2)
+		self.assertEqual(solver.catchUp(), 0)
+
+		first.delete()
+		solver.catchUp()
+		self.assertEqual(set(solver.pieces), {"b"})
+
+
+class SweepDeadLinksTests(TestCase):
+	OPTIONS = {"limit": 100, "concurrency": 5, "max_age": 24, "retry": 1}
+
+	async def sweep(self):
+		return await sweepdeadlinks.Command().sweep(self.OPTIONS)
+
+	async def test_classifies_responses(self):
+		routes = {
+			"/ok.png": (200, "image/png", b""),
+			"/gone.png": (410, "text/plain", b""),
+			"/removed.png": (302, "text/plain", b"", {"Location": "https://i.imgur.com/removed.png"}),
+			"/moved.png": (302, "text/plain", b"", {"Location": "https://i.imgur.com/other.png"}),
+			"/error.png": (503, "text/plain", b""),
+		}
+		with StubHTTPServer(routes) as server:
+			paths = ["/ok.png", "/missing.png", "/gone.png", "/removed.png", "/moved.png", "/error.png"]
+			pieces = {}
+			for path in paths:
+				pieces[path] = await sync_to_async(addPiece)(server.url(path))
+			self.assertEqual(await self.sweep(), (6, 3))
+
+		states = {}
+		for path, piece in pieces.items():
+			await sync_to_async(piece.refresh_from_db)()
+			states[path] = piece.deadLink
+			self.assertIsNotNone(piece.linkChecked, path)
+		self.assertEqual(states, {
+			"/ok.png": False, "/missing.png": True, "/gone.png": True,
+			"/removed.png": True, "/moved.png": False, "/error.png": False,
+		})
+
+	async def test_unknown_results_are_retried_later(self):
+		with StubHTTPServer({"/error.png": (503, "text/plain", b"")}) as server:
+			piece = await sync_to_async(addPiece)(server.url("/error.png"))
+			await self.sweep()
+			self.assertEqual(await self.sweep(), (0, 0))
+			self.assertEqual(len(server.requests), 1)
+
+		await sync_to_async(piece.refresh_from_db)()
+		due = piece.linkChecked + datetime.timedelta(hours=self.OPTIONS["max_age"])
+		self.assertLess(due, timezone.now() + datetime.timedelta(hours=self.OPTIONS["retry"], minutes=1))
+		self.assertFalse(piece.deadLink)
+
+
+class ReprioritizeApiTests(TestCase):
+	def setUp(self):
+		self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "admin"))
+		self.piece = addPiece("https://i.imgur.com/abc.png")
+		self.piece.hash = UtilityOps.UrlHash(self.piece.url)
+		self.piece.save()
+
+	def post(self, body):
+		return self.client.post("/api/pieces/reprioritize/", json.dumps(body), content_type="application/json")
+
+	def test_updates_selected_pieces(self):
+		response = self.post({"priority": 20, "urls": ["https://imgur.com/abc"]})
+		self.assertEqual(response.json(), {"priority": 20, "updated": 1})
+		self.piece.refresh_from_db()
+		self.assertEqual(self.piece.priority, 20)
+
+	def test_rejects_malformed_bodies(self):
+		for body in (
+			[{"priority": 20}],
+			"priority",
+			{"priority": 20, "urls": "https://imgur.com/abc"},
+			{"priority": 20, "hashes": [["x"]]},
+			{"priority": -1, "urls": ["https://imgur.com/abc"]},
+			{"priority": "high", "urls": ["https://imgur.com/abc"]},
+			{"priority": 20},
+			{"priority": 20, "since": "2020-13-01"},
+		):
+			self.assertEqual(self.post(body).status_code, 400, body)
+		self.piece.refresh_from_db()
+		self.assertEqual(self.piece.priority, 0)
+
+	def test_needs_an_admin(self):
+		self.client.logout()
+		self.assertEqual(self.post({"priority": 20, "urls": ["https://imgur.com/abc"]}).status_code, 403)
+
+
+@override_settings(PIECE_LOCK_WAIT=0)
+class CoalescedTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.piece = addPiece("https://i.imgur.com/a.png")
+		self.runs = 0
+
+	def test_runs_the_work_once(self):
+		locks.coalesced(self.piece.id, self.work)
+		self.assertEqual(self.runs, 1)
+
+	def test_waiters_leave_the_work_to_the_holder(self):
+		# Requests arriving while the holder works find the lock taken, they
+		# only flag the piece and the holder runs once more for all of them
+		def work(puzzlepieceId):
+			self.work(puzzlepieceId)
+			if self.runs == 1:
+				for _ in range(3):
+					locks.coalesced(puzzlepieceId, self.work)
+				self.assertEqual(self.runs, 1)
+
+		locks.coalesced(self.piece.id, work)
+		self.assertEqual(self.runs, 2)
+		self.piece.refresh_from_db()
+		self.assertFalse(self.piece.confidenceDirty)
+
+	def test_waiter_flag_is_in_the_database(self):
+		# What the holder on another node reads, whatever its cache
+		with locks.pieceLock(self.piece.id) as acquired:
+			self.assertTrue(acquired)
+			locks.coalesced(self.piece.id, self.work)
+		self.assertEqual(self.runs, 0)
+		self.piece.refresh_from_db()
+		self.assertTrue(self.piece.confidenceDirty)
+
+	def work(self, puzzlepieceId):
+		self.assertEqual(puzzlepieceId, self.piece.id)
+		self.runs += 1
+
+
+@override_settings(RATE_LIMITS_ENABLED=True, RATE_LIMITS={
+	"processTranscription": {"burst": 1, "per_minute": 1},
+	"transcriptionApi": {"burst": 1, "per_minute": 1},
+})
+class RateLimitTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.piece = addPiece("https://i.imgur.com/a.png")
+
+	def assertThrottled(self, post):
+		post()
+		with self.assertNumQueries(0):
+			response = post()
+		self.assertEqual(response.status_code, 429)
+		self.assertGreater(int(response["Retry-After"]), 0)
+
+	def test_web_form(self):
+		self.assertThrottled(lambda: self.client.post("/transcribe/{}".format(self.piece.id), {"data": "nonsense"}))
+
+	def test_api(self):
+		self.assertThrottled(lambda: self.client.post("/api/transcriptions/", {}, content_type="application/json"))
+
+
+# Same shape as the replica settings.py builds from SQL_REPLICA_*. Nothing is
+# sent to it, the tests only look at where the router sends queries.
+@override_settings(DATABASES=dict(settings.DATABASES, replica=dict(settings.DATABASES["default"], TEST={"MIRROR": "default"})))
+class DbRoutingTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.factory = RequestFactory()
+		self.view = dbrouting.replica_reads(lambda request: PuzzlePiece.objects.all().db)
+
+	def test_reads(self):
+		self.assertEqual(self.view(self.factory.get("/", REMOTE_ADDR="10.0.0.1")), "replica")
+		self.assertEqual(self.view(self.factory.head("/", REMOTE_ADDR="10.0.0.1")), "replica")
+		self.assertEqual(self.view(self.factory.post("/", REMOTE_ADDR="10.0.0.1")), "default")
+		# Outside the view everything is back on the primary
+		self.assertEqual(PuzzlePiece.objects.all().db, "default")
+
+	def test_writes(self):
+		router = dbrouting.ReplicaRouter()
+		self.assertEqual(dbrouting.replica_reads(lambda request: router.db_for_write(PuzzlePiece))(self.factory.get("/")), "default")
+		self.assertFalse(router.allow_migrate("replica", "collector"))
+		self.assertTrue(router.allow_migrate("default", "collector"))
+
+	def test_pin(self):
+		def write(request):
+			dbrouting.pinToPrimary(request)
+			return HttpResponse()
+		response = dbrouting.PinToPrimaryMiddleware(write)(self.factory.post("/", REMOTE_ADDR="10.0.0.1"))
+		cookie = response.cookies[dbrouting.PIN_COOKIE]
+		self.assertEqual(int(cookie["max-age"]), settings.REPLICA_LAG_SECONDS)
+
+		# Same ip, with or without the cookie
+		self.assertEqual(self.view(self.factory.get("/", REMOTE_ADDR="10.0.0.1")), "default")
+		# The cookie alone is enough, on whatever worker the next request lands
+		cache.clear()
+		request = self.factory.get("/", REMOTE_ADDR="10.0.0.2")
+		request.COOKIES[dbrouting.PIN_COOKIE] = cookie.value
+		self.assertEqual(self.view(request), "default")
+		# A forged one isn't
+		request = self.factory.get("/", REMOTE_ADDR="10.0.0.2")
+		request.COOKIES[dbrouting.PIN_COOKIE] = "1"
+		self.assertEqual(self.view(request), "replica")
+		self.assertEqual(self.view(self.factory.get("/", REMOTE_ADDR="10.0.0.3")), "replica")
+
+	def test_without_replica(self):
+		with self.settings(DATABASES={"default": settings.DATABASES["default"]}):
+			self.assertEqual(self.view(self.factory.get("/")), "default")
+			response = dbrouting.PinToPrimaryMiddleware(lambda request: dbrouting.pinToPrimary(request) or HttpResponse())(self.factory.post("/"))
+			self.assertNotIn(dbrouting.PIN_COOKIE, response.cookies)
+
+
+class IngestTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		directory = tempfile.TemporaryDirectory()
+		self.addCleanup(directory.cleanup)
+		queue = override_settings(INGEST_QUEUE_PATH=directory.name + "/queue.sqlite3")
+		queue.enable()
+		self.addCleanup(queue.disable)
+		self.piece = addPiece("https://i.imgur.com/a.png")
+
+	def test_repeat_enqueue(self):
+		self.assertTrue(ingest.enqueue(newTranscription(self.piece, "a"), None))
+		self.assertFalse(ingest.enqueue(newTranscription(self.piece, "a", datahash="b" * 64), None))
+		self.assertTrue(ingest.enqueue(newTranscription(self.piece, "b"), None))
+		self.assertEqual(ingest.pending(), 2)
+
+	def test_flush(self):
+		transcription = newTranscription(self.piece, "a")
+		ingest.enqueue(transcription, "raw text")
+		time.sleep(0.01)
+		evaluated = []
+		self.assertEqual(ingest.flushBatch(10, evaluated.append), 1)
+		self.assertEqual(evaluated, [self.piece.id])
+		self.assertEqual(ingest.pending(), 0)
+		stored = TranscriptionData.objects.get(puzzlePiece=self.piece, ip_address="a")
+		# The time it was queued, not flushed
+		self.assertEqual(stored.submitted_date, transcription.submitted_date)
+		self.assertEqual(stored.raw.text(), "raw text")
+
+	def test_crash_before_dequeue(self):
+		# The transaction committed but the process died before the queue was
+		# cleared: the next flush takes the same rows again
+		ingest.enqueue(newTranscription(self.piece, "a", bad_image=True), None)
+		def crash(pieceId):
+			raise RuntimeError("killed")
+		with self.assertRaises(RuntimeError):
+			ingest.flushBatch(10, crash)
+		self.assertEqual(ingest.pending(), 1)
+		evaluated = []
+		self.assertEqual(ingest.flushBatch(10, evaluated.append), 1)
+		self.assertEqual(evaluated, [self.piece.id])
+		self.assertEqual(ingest.pending(), 0)
+		self.assertEqual(TranscriptionData.objects.filter(puzzlePiece=self.piece).count(), 1)
+		stats = TranscriberStats.objects.get(ip_address="a")
+		self.assertEqual((stats.transcriptionCount, stats.badImageCount), (1, 1))
+
+	def test_api_accepts(self):
+		body = {"puzzlePiece": self.piece.id, "bad_image": False, "orientation": "up", "center": "B"}
+		body.update({"wall{}".format(i): True for i in range(1, 7)})
+		body.update({"link{}".format(i): "BPCHSDT" for i in range(1, 7)})
+		response = self.client.post("/api/transcriptions/", body, content_type="application/json")
+		self.assertEqual(response.status_code, 202)
+		self.assertEqual(ingest.pending(), 1)
+		self.assertFalse(TranscriptionData.objects.exists())
+		# Still queued, but a repeat is turned away all the same
+		response = self.client.post("/api/transcriptions/", body, content_type="application/json")
+		self.assertEqual(response.status_code, 409)
+		self.assertEqual(ingest.pending(), 1)
+
+
+class QueueTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.pieces = [addPiece("https://i.imgur.com/{}.png".format(i), priority=200 - i) for i in range(QUEUE_WINDOW + 20)]
+		self.ip = hash_my_data("127.0.0.1")
+
+	def transcribe(self, pieces):
+		TranscriptionData.objects.bulk_create([newTranscription(piece, self.ip) for piece in pieces])
+
+	def test_top_of_the_queue(self):
+		self.assertIn(self.client.get("/transcribe").context["puzzlepiece"], self.pieces[:QUEUE_WINDOW])
+
+	def test_next_window(self):
+		self.transcribe(self.pieces[:QUEUE_WINDOW])
+		self.assertIn(self.client.get("/transcribe").context["puzzlepiece"], self.pieces[QUEUE_WINDOW:])
+
+	def test_skips_duplicates(self):
+		PuzzlePiece.objects.filter(id__in=[piece.id for piece in self.pieces[1:]]).update(duplicateOf=self.pieces[0])
+		self.transcribe(self.pieces[:1])
+		self.assertIsNone(self.client.get("/transcribe").context["puzzlepiece"])
+
+	def test_all_done(self):
+		self.transcribe(self.pieces)
+		self.assertIsNone(self.client.get("/transcribe").context["puzzlepiece"])
+
+
+class ConditionalTests(TestCase):
+	url = "/export/pieces/csv"
+
+	def setUp(self):
+		cache.clear()
+		for i in range(20):
+			addPiece("https://i.imgur.com/{}.png".format(i))
+
+	def test_etag_per_coding(self):
+		plain = self.client.get(self.url)
+		self.assertEqual(plain.status_code, 200)
+		self.assertNotIn("Content-Encoding", plain)
+		self.assertIn("Accept", plain["Vary"])
+		self.assertIn("Accept-Encoding", plain["Vary"])
+		zipped = self.client.get(self.url, HTTP_ACCEPT_ENCODING="gzip")
+		self.assertEqual(zipped["Content-Encoding"], "gzip")
+		self.assertEqual(zipped["ETag"], plain["ETag"][:-1] + '-gzip"')
+		self.assertEqual(gzip.decompress(zipped.content), plain.content)
+
+	def test_not_modified(self):
+		etag = self.client.get(self.url, HTTP_ACCEPT_ENCODING="gzip")["ETag"]
+		with self.assertNumQueries(1):
+			response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+		self.assertEqual(response.status_code, 304)
+		self.assertEqual(response.content, b"")
+		# The tag of any coding will do, a proxy may have decompressed it
+		self.assertIn("Accept-Encoding", response["Vary"])
+		self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH='"other", W/' + etag).status_code, 304)
+		self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+		addPiece("https://i.imgur.com/new.png")
+		self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+	def test_body_cache(self):
+		first = self.client.get(self.url)
+		with self.assertNumQueries(1):
+			second = self.client.get(self.url, HTTP_ACCEPT_ENCODING="gzip")
+		self.assertEqual(gzip.decompress(second.content), first.content)
+
+	@override_settings(CONDITIONAL_CACHE_MAX_BYTES=100)
+	def test_too_big_to_cache(self):
+		first = self.client.get(self.url)
+		# Not cached, generated again
+		with CaptureQueriesContext(connections["default"]) as queries:
+			second = self.client.get(self.url, HTTP_ACCEPT_ENCODING="gzip")
+		self.assertGreater(len(queries), 1)
+		self.assertEqual(gzip.decompress(second.content), first.content)
+		self.assertEqual(second["ETag"], first["ETag"][:-1] + '-gzip"')
+		with self.assertNumQueries(1):
+			self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=first["ETag"]).status_code, 304)
+
+
+class TranscriberStatsTests(TestCase):
+	def test_record_transcription(self):
+		stats.recordTranscription("a", False)
+		stats.recordTranscription("a", True)
+		row = TranscriberStats.objects.get(ip_address="a")
+		self.assertEqual((row.transcriptionCount, row.badImageCount), (2, 1))
+		self.assertIsNotNone(row.last_active)
+
+	def test_record_resolution(self):
+		piece = addPiece("https://i.imgur.com/a.png")
+		TranscriptionData.objects.bulk_create([
+			newTranscription(piece, "a", datahash="right"),
+			newTranscription(piece, "b", datahash="wrong"),
+			newTranscription(piece, "c", datahash="wrong", bad_image=True),
+		])
+		stats.recordResolution(piece.id, "right")
+		rows = {row.ip_address: row for row in TranscriberStats.objects.all()}
+		self.assertEqual((rows["a"].resolvedCount, rows["a"].agreedCount, rows["a"].agreementRate), (1, 1, 100))
+		self.assertEqual((rows["b"].resolvedCount, rows["b"].agreedCount, rows["b"].agreementRate), (1, 0, 0))
+		# Bad image reports don't count either way
+		self.assertNotIn("c", rows)
+
+	def test_leaderboards(self):
+		for ip, count, resolved, agreed in (("a", 30, 20, 10), ("b", 20, 20, 19), ("c", 10, 5, 5)):
+			TranscriberStats.objects.create(ip_address=ip, transcriptionCount=count, resolvedCount=resolved,
+				agreedCount=agreed, agreementRate=agreed * 100.0 / resolved)
+
+		response = self.client.get("/api/transcribers/?limit=2")
+		self.assertEqual([row["transcriptionCount"] for row in response.json()], [30, 20])
+		self.assertEqual(response.json()[0]["submitter"], pseudonyms.pseudonym("a"))
+		self.assertNotIn("a", [row["submitter"] for row in response.json()])
+
+		response = self.client.get("/api/transcribers/accuracy/")
+		self.assertEqual([row["agreementRate"] for row in response.json()], [95, 50])
+		response = self.client.get("/api/transcribers/accuracy/?min_resolved=1")
+		self.assertEqual([row["agreedCount"] for row in response.json()], [5, 19, 10])
+
+
+class DuplicateSubmissionTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.piece = addPiece("https://i.imgur.com/a.png")
+
+	def test_web_form(self):
+		url = "/transcribe/{}".format(self.piece.id)
+		data = "P 1,4 " + " ".join(["BPCHSDT"] * 6)
+		self.assertEqual(self.client.post(url, {"data": data}).context["errors"], [])
+		errors = self.client.post(url, {"data": data}).context["errors"]
+		self.assertEqual(len(errors), 1)
+		self.assertIn("already transcribed", errors[0])
+		self.assertEqual(TranscriptionData.objects.filter(puzzlePiece=self.piece).count(), 1)
+
+	def test_api(self):
+		body = {"puzzlePiece": self.piece.id, "bad_image": False, "orientation": "up", "center": "B"}
+		body.update({"wall{}".format(i): True for i in range(1, 7)})
+		body.update({"link{}".format(i): "BPCHSDT" for i in range(1, 7)})
+		self.assertEqual(self.client.post("/api/transcriptions/", body, content_type="application/json").status_code, 201)
+		response = self.client.post("/api/transcriptions/", body, content_type="application/json")
+		self.assertEqual(response.status_code, 409)
+		self.assertEqual(TranscriptionData.objects.filter(puzzlePiece=self.piece).count(), 1)
+
+	def test_latest_vote_counts(self):
+		TranscriptionData.objects.bulk_create([
+			newTranscription(self.piece, "a", datahash="x"),
+			newTranscription(self.piece, "?.?.?.?", datahash="x"),
+			newTranscription(self.piece, "a", datahash="y"),
+			newTranscription(self.piece, "?.?.?.?", datahash="y"),
+		])
+		votes = oneVotePerSubmitter(TranscriptionData.objects.filter(puzzlePiece=self.piece).order_by("id"))
+		self.assertEqual([(vote.ip_address, vote.datahash) for vote in votes], [("?.?.?.?", "x"), ("a", "y"), ("?.?.?.?", "y")])
+
+	def test_repeats_dont_skew_the_histogram(self):
+		# From before the check: one person sent the same wrong answer five
+		# times. Counted once, the other nine agree on 90%.
+		TranscriptionData.objects.bulk_create(
+			[newTranscription(self.piece, "a", datahash="x") for _ in range(5)]
+			+ [newTranscription(self.piece, ip, datahash="y") for ip in "bcdefghij"])
+		evaluateConfidence(self.piece.id)
+		self.piece.refresh_from_db()
+		self.assertEqual(self.piece.transCount, 10)
+		solution = ConfidentSolution.objects.get(puzzlePiece=self.piece)
+		self.assertEqual(solution.datahash, "y")
+
+
+class ArchiveTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.piece = addPiece("https://i.imgur.com/solved.png")
+		TranscriptionData.objects.bulk_create(
+			[newTranscription(self.piece, ip, datahash="y") for ip in "abcdefghi"]
+			+ [newTranscription(self.piece, "j", datahash="x")])
+		evaluateConfidence(self.piece.id)
+		# The newest transcription always stays in the live table
+		newTranscription(addPiece("https://i.imgur.com/open.png"), "a").save()
+		self.assertEqual(archive.archiveBatch(100), 10)
+
+	def test_moved(self):
+		self.assertFalse(TranscriptionData.objects.filter(puzzlePiece=self.piece).exists())
+		self.assertEqual(ArchivedTranscription.objects.filter(puzzlePiece=self.piece).count(), 10)
+
+	def test_export(self):
+		rows = self.client.get("/export/transcriptions/csv").content.decode("utf-8").splitlines()[1:]
+		self.assertEqual(len(rows), 11)
+		self.assertEqual(sum(1 for row in rows if row.startswith(self.piece.url)), 10)
+
+	def test_rerun(self):
+		tracker = ConfidenceTracking.objects.get(puzzlePiece=self.piece)
+		ConfidenceTracking.objects.filter(id=tracker.id).update(confidence=0)
+		PuzzlePiece.objects.filter(id=self.piece.id).update(transCount=0)
+		response = self.client.post("/confidence/{}".format(tracker.id), {"rerun": "1"})
+		self.assertEqual(response.context["confidence"].confidence, 90)
+		self.piece.refresh_from_db()
+		self.assertEqual(self.piece.transCount, 10)
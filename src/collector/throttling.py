@@ -0,0 +1,91 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from functools import wraps
+from rest_framework.throttling import BaseThrottle
+from . import UtilityOps as UtilityOps
+import asyncio
+import hashlib
+import time
+
+# Token buckets per hashed client ip and endpoint, kept in the shared cache
+# so all workers see the same budget. A throttled request never touches the
+# database. Read-modify-write is not atomic, under heavy concurrency a client
+# may get a few requests more than the budget - good enough against scripts.
+
+
+def _bucketKey(scope, request):
+	ip = UtilityOps.UtilityOps.GetClientIP(request) or ""
+	return "throttle:{}:{}".format(scope, hashlib.sha256(ip.encode("utf-8")).hexdigest())
+
+
+def consume(scope, request):
+	# Returns 0 if the request may go ahead, otherwise the seconds until the
+	# next token is available
+	if not settings.RATE_LIMITS_ENABLED or scope not in settings.RATE_LIMITS:
+		return 0
+	limits = settings.RATE_LIMITS[scope]
+	burst = limits["burst"]
+	refill = limits["per_minute"] / 60.0
+
+	key = _bucketKey(scope, request)
+	now = time.time()
+	tokens, updated = cache.get(key, (burst, now))
+	tokens = min(burst, tokens + (now - updated) * refill)
+	if tokens < 1:
+		return (1 - tokens) / refill
+	# Full again after this long, no need to keep the bucket any longer
+	cache.set(key, (tokens - 1, now), int((burst - tokens + 1) / refill) + 1)
+	return 0
+
+
+def tooManyRequests(wait):
+	response = HttpResponse("Slow down a little! Try again in {} seconds.".format(int(wait) + 1), status=429, content_type="text/plain")
+	response["Retry-After"] = str(int(wait) + 1)
+	return response
+
+
+def rate_limited(scope, methods=("POST",)):
+	# Throttle a plain Django view, only requests with one of methods count
+	def decorator(view):
+		if asyncio.iscoroutinefunction(view):
+			@wraps(view)
+			async def wrappedAsync(request, *args, **kwargs):
+				if request.method in methods:
+					wait = await sync_to_async(consume, thread_sensitive=False)(scope, request)
+					if wait:
+						return tooManyRequests(wait)
+				return await view(request, *args, **kwargs)
+			return wrappedAsync
+
+		@wraps(view)
+		def wrapped(request, *args, **kwargs):
+			if request.method in methods:
+				wait = consume(scope, request)
+				if wait:
+					return tooManyRequests(wait)
+			return view(request, *args, **kwargs)
+		return wrapped
+	return decorator
+
+
+class TokenBucketThrottle(BaseThrottle):
+	# DRF version. DRF authenticates before throttling, so views using this
+	# should not authenticate (or a session cookie costs a query).
+	scope = None
+
+	def allow_request(self, request, view):
+		self._wait = consume(self.scope, request)
+		return not self._wait
+
+	def wait(self):
+		return self._wait
+
+
+class TranscriptionApiThrottle(TokenBucketThrottle):
+	scope = "transcriptionApi"
+
+
+class ReportApiThrottle(TokenBucketThrottle):
+	scope = "reportApi"
@@ -6,13 +6,18 @@ from . import views
 api_router = routers.DefaultRouter()
 api_router.register(r'pieces', views.PuzzlePieceViewSet)
 api_router.register(r'transcriptions', views.TranscriptionDataViewSet)
+api_router.register(r'map', views.MapViewSet, basename='map')
+api_router.register(r'transcribers', views.TranscriberStatsViewSet)
+api_router.register(r'progress', views.ProgressViewSet, basename='progress')
 
 urlpatterns = [
 	path("", views.index, name="index"),
+	path("api/changes/<str:kind>", views.changesFeed, name="changesFeed"),
         path('api/', include(api_router.urls)),
 	path("puzzlepieces/submit", views.puzzlepieceSubmit, name="puzzlepieceSubmit"),
 	path("puzzlepieces/", views.PuzzlepieceIndex.as_view(), name="puzzlepieceIndex"),
 	path("puzzlepieces/<int:image_id>/", views.puzzlepieceView, name="puzzlepieceView"),
+	path("images/<str:name>", views.cachedImage, name="cachedImage"),
 	path("transcriptions", views.TranscriptionsIndex.as_view(), name="transcriptions"),
 	path("transcriptions/<int:transcription_id>", views.transcriptionsDetail, name="transcriptionsDetail"),
 	path("transcriptions/guide", views.transcriptionGuide, name="transcriptionGuide"),
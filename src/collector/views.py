@@ -1,35 +1,64 @@
-from django.http import HttpResponse
+from django.http import HttpResponse, JsonResponse
 from django.http import Http404
+from django.http import FileResponse, HttpResponseRedirect
 from django.template import loader
 from django.shortcuts import get_object_or_404, render
+from django.urls import reverse
 from django.views import generic
 from django.views.decorators.cache import cache_page
 from django.db.models import Count, F, Max
 from django.utils.decorators import method_decorator
 from django.conf import settings
+from django.utils import timezone
 from .models import *
 from .serializers import (
     PuzzlePieceSerializer,
     TranscriptionDataSerializer,
     BadImageSerializer,
     ConfidentSolutionSerializer,
+    TranscriberStatsSerializer,
+    ReprioritizeSerializer,
 )
-import json
 #from django.db import transaction
 from . import UtilityOps as UtilityOps
+from .dbrouting import pinToPrimary, replica_reads
+from .conditional import conditional_response
+from .solver import sharedSolver
+from .imaging import cachedImagePath
+from . import stats
+from . import progress
+from . import seen
+from . import leases
+from . import archive
+from . import changes
+from . import ingest
+from . import locks
+from . import pseudonyms
+from .priority import selectPieces, reprioritize
+from .parsing import parseSubmission, ParseError
+from .outbound import outboundClient
+from .throttling import rate_limited, ReportApiThrottle, TranscriptionApiThrottle
+from asgiref.sync import sync_to_async
 from urllib.parse import urlparse
-from random import randint
+from random import choice, randint
+import asyncio
 import csv
 import hashlib
-import hmac
-import requests
+import httpx
+import math
 import re
+import time
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework import mixins, status, viewsets
+from rest_framework import mixins, permissions, status, viewsets
 
-# Regex pattern for text submissions
-textSubmissionPattern = re.compile(r"^\s*(?P<center>(Blank|Plus|Clover|Hex|Snake|Diamond|Cauldron|B|P|C|H|S|D|T))\s*(?P<sides>([1-6])(\s*,\s*[1-6]){0,5})(?P<links>(\s*[BPCHSDT]{7}){6})\s*$", re.IGNORECASE)
+# Transcriptions needed before determineConfidence decides on a piece
+MIN_SUBMISSIONS = 10
+ROTATED_MIN_SUBMISSIONS = 15
+# Candidates fetched per query of the transcription queue
+QUEUE_WINDOW = 100
+
+cachedImageNamePattern = re.compile(r"^[0-9a-f]{64}\.jpg$")
 
 def hash_my_data(url):
 	url = url.encode("utf-8")
@@ -37,69 +66,61 @@ def hash_my_data(url):
 	hex_dig = hash_object.hexdigest()
 	return hex_dig
 
-# When exporting data, we shouldn't really make hash(ip) public because it's
-# too easy to reverse. Use HMAC with SECRET_KEY as a keyed hash, to prevent
-# reversing while still being usable as a unique identifier within a single
-# exported set of data
-def secretly_hash_my_data(data):
-	key = settings.SECRET_KEY.encode("utf-8")
-	data = data.encode("utf-8")
-	hash_object = hmac.new(key, data, hashlib.sha256)
-	hex_dig = hash_object.hexdigest()
-	return hex_dig
-
-def findImage(url):
+async def findImage(url):
 	host = urlparse(url).hostname
+	# Can we be clever and figure out an Imgur / Gyazo URL on the fly?
 	if host in ["imgur.com"]:
-	# Can we be clever and figure out an Imgur URL on the fly?
-		turl = "https://i.imgur.com" + urlparse(url).path + ".png"
-		res = requests.head(turl)
-		if res.status_code == 200:
-			return turl
-		turl = "https://i.imgur.com" + urlparse(url).path + ".jpg"
-		res = requests.head(turl)
-		if res.status_code == 200:
-			return turl
-		turl = "https://i.imgur.com" + urlparse(url).path + ".jpeg"
-		res = requests.head(turl)
-		if res.status_code == 200:
-			return turl
-		return None
+		base = "https://i.imgur.com"
 	elif host in ["gyazo.com"]:
-		turl = "https://i.gyazo.com" + urlparse(url).path + ".png"
-		res = requests.head(turl)
-		if res.status_code == 200:
-			return turl
-		turl = "https://i.gyazo.com" + urlparse(url).path + ".jpg"
-		res = requests.head(turl)
-		if res.status_code == 200:
-			return turl
-		turl = "https://i.gyazo.com" + urlparse(url).path + ".jpeg"
-		res = requests.head(turl)
-		if res.status_code == 200:
-			return turl
-		return None
+		base = "https://i.gyazo.com"
 	else:
 		return None
+	candidates = [base + urlparse(url).path + extension for extension in (".png", ".jpg", ".jpeg")]
+	# Ask for all of them at once, first one that exists wins
+	async with outboundClient() as client:
+		results = await asyncio.gather(*[client.head(turl) for turl in candidates], return_exceptions=True)
+	for turl, res in zip(candidates, results):
+		if not isinstance(res, Exception) and res.status_code == 200:
+			return turl
+	return None
 
 def findUnconfidentPuzzlePieces(self):
 	# We want to order by transCount descending to get faster results. We do not show anything definitely flagged as bad; that already has been solved
-	# Allow multiple transcriptions by one person - at the current load the database query is just to expensive
-	result = PuzzlePiece.objects.raw("""
-		SELECT * FROM
-			(SELECT * FROM collector_puzzlepiece WHERE
-				id NOT IN (SELECT puzzlePiece_id FROM collector_confidentsolution) AND
-				id NOT IN (SELECT puzzlePiece_id FROM collector_badimage)
-				ORDER BY priority DESC, transCount DESC
-				LIMIT 100
-			) AS current_transcriptions
-		ORDER BY RAND()
-		LIMIT 1
-	""")
 	# Want less than a certain confidence.
 	# X or more "bad image" records will disqualify from showing up again.
 
-	if len(result) > 0:
+	# Skip what this person already transcribed, from their cached seen filter.
+	# Someone who did the whole top of the queue gets the next window down.
+	client_ip_address = hash_my_data(UtilityOps.UtilityOps.GetClientIP(self.request))
+	done = seen.seenFilter(client_ip_address)
+	offset = 0
+	while True:
+		candidates = list(PuzzlePiece.objects.raw("""
+			SELECT * FROM collector_puzzlepiece WHERE
+				id NOT IN (SELECT puzzlePiece_id FROM collector_confidentsolution) AND
+				id NOT IN (SELECT puzzlePiece_id FROM collector_badimage) AND
+				NOT deadLink AND
+				duplicateOf_id IS NULL
+				ORDER BY priority DESC, transCount DESC, id
+				LIMIT %s OFFSET %s
+		""", [QUEUE_WINDOW, offset]))
+		result = [c for c in candidates if c.id not in done]
+		if result or len(candidates) < QUEUE_WINDOW:
+			break
+		offset += QUEUE_WINDOW
+
+	# Balance by what is already in flight: a piece with 7 transcriptions and
+	# 3 open leases needs nobody else for now. Contested pieces past the
+	# minimum take one more at a time.
+	open_leases = leases.inFlight([c.id for c in result])
+	available = [c for c in result if open_leases[c.id] < max(MIN_SUBMISSIONS - c.transCount, 1)]
+	if not available and result:
+		# Everything is covered, double up where the fewest people are working
+		fewest = min(open_leases.values())
+		available = [c for c in result if open_leases[c.id] == fewest]
+	if len(available) > 0:
+		result = [choice(available)]
+		leases.lease(result[0].id, client_ip_address)
 		# Add an isImage that we'll reference in the template, this allows us to handle generic links
 		parsedUrl = urlparse(result[0].url)
 		if parsedUrl.path.lower().endswith(".jpg") or parsedUrl.path.lower().endswith(".png") or parsedUrl.path.lower().endswith(".jpeg"):
@@ -112,6 +133,11 @@ def findUnconfidentPuzzlePieces(self):
 			result[0].isRotated = True
 		else:
 			result[0].isRotated = False
+		# Serve our own copy if we have one, the original host otherwise
+		if cachedImageNamePattern.match(result[0].cachedImage):
+			result[0].cachedImageUrl = reverse("cachedImage", args=[result[0].cachedImage])
+		else:
+			result[0].cachedImageUrl = None
 		return result[0]
 	return None
 
@@ -126,7 +152,21 @@ def transcriptionGuide(request):
 	template = loader.get_template("collector/transcriptionGuide.html")
 	return HttpResponse(template.render(None, request))
 
-def puzzlepieceSubmit(request):
+def savePuzzlePiece(request, url, priority):
+	newPiece = PuzzlePiece()
+	newPiece.url = url
+	newPiece.hash = UtilityOps.UtilityOps.UrlHash(url)
+	# An IP is personal data as per GDPR, kid you not. Let's hash it, we just need something unique
+	newPiece.ip_address = hash_my_data(UtilityOps.UtilityOps.GetClientIP(request))
+	newPiece.priority = priority
+	newPiece.save()
+	progress.pieceSubmitted()
+	pinToPrimary(request)
+
+# Async, so waiting on the image hosts doesn't block a worker when served
+# through puzzlepieces/asgi.py. Database work goes through sync_to_async.
+@rate_limited("puzzlepieceSubmit")
+async def puzzlepieceSubmit(request):
 	responseMessage = None
 	responseMessageSuccess = None
 	# New submissions are first in queue, but behind specific streamer requests
@@ -142,28 +182,28 @@ def puzzlepieceSubmit(request):
 				raise ValueError('We only accept images from cdn.discordapp.com, media.discordapp.net, (i.)gyazo.com and (i.)imgur.com right now.')
 			if host not in ["gyazo.com", "imgur.com"] and not (url.lower().endswith(".jpg") or url.lower().endswith(".png") or url.lower().endswith(".jpeg")):
 				raise ValueError('Please make sure your link ends with .jpg or .jpeg or .png. Direct links to images work best with our current site.')
+			# Known under any spelling, no need to ask the image host
+			if await sync_to_async(PuzzlePiece.objects.filter(hash=UtilityOps.UtilityOps.UrlHash(url)).exists)():
+				raise ValueError("We already had that. Try another!")
 			if host in ["gyazo.com", "imgur.com"]:
-				turl = findImage(url)
+				turl = await findImage(url)
 				if turl:
 					url = turl
 			if url.find("http",8,len(url)) != -1:
 				raise ValueError('Found http in the middle of the URL - did you paste it twice?' + url)
-			res = requests.head(url)
+			async with outboundClient() as client:
+				res = await client.head(url)
 			if res.status_code != 200:
 				raise ValueError(url + ' -- That URL does not seem to exist. Please verify and try again.')
 
-			newPiece = PuzzlePiece()
-			newPiece.url = url
-			newPiece.hash = hash_my_data(url)
-			# An IP is personal data as per GDPR, kid you not. Let's hash it, we just need something unique
-			newPiece.ip_address = hash_my_data(UtilityOps.UtilityOps.GetClientIP(request))
-			newPiece.priority = priority
-			newPiece.save()
+			await sync_to_async(savePuzzlePiece)(request, url, priority)
 			responseMessageSuccess = "Puzzle Piece image submitted successfully!"
 	except KeyError as ex:
 		responseMessage = "There was an issue with your request. Please try again?"
 	except ValueError as ex:
 		responseMessage = str(ex)
+	except httpx.TimeoutException as ex:
+		responseMessage = "The image host took too long to answer. Please try again in a bit."
 	except Exception as ex:
 		if "unique" in str(ex).lower() or "duplicate" in str(ex).lower():
 			responseMessage = "We already had that. Try another!"
@@ -175,9 +215,11 @@ def puzzlepieceSubmit(request):
 		"error_message": responseMessage,
 		"success_message": responseMessageSuccess,
 	}
-	return HttpResponse(template.render(context, request))
+	# Context processors may load the session and user
+	return HttpResponse(await sync_to_async(template.render)(context, request))
 
 @method_decorator(cache_page(5 * 60), name='dispatch')
+@method_decorator(replica_reads, name='dispatch')
 class PuzzlepieceIndex(generic.ListView):
 	template_name = 'collector/latest.html'
 	context_object_name = 'latest'
@@ -189,19 +231,32 @@ class PuzzlepieceIndex(generic.ListView):
 def puzzlepieceView(request, image_id):
 	piece = get_object_or_404(PuzzlePiece, pk=image_id)
 	if len(piece.hash) == 0 or "empty" == str(piece.hash).lower():
-		piece.hash = hash_my_data(piece.url)
+		piece.hash = UtilityOps.UtilityOps.UrlHash(piece.url)
 		piece.save()
 
-	#transcriptions = TranscriptionData.objects.filter(puzzlePiece_id=image_id)
-
 	context = {
 		"puzzlepiece": piece,
-
+		"transcriptions": archive.pieceTranscriptions(piece.id, "id", "submitted_date", "bad_image"),
 	}
-	#"transcriptions": transcriptions
 	return render(request, 'collector/puzzlepieceDetail.html', context)
 
 
+def cachedImage(request, name):
+	if not cachedImageNamePattern.match(name):
+		raise Http404("No such image")
+	try:
+		response = FileResponse(open(cachedImagePath(name), "rb"), content_type="image/jpeg")
+	except FileNotFoundError:
+		# Not on this node's disk (yet), send the client to the original
+		piece = PuzzlePiece.objects.filter(cachedImage=name).only("url").first()
+		if piece is None:
+			raise Http404("No such image")
+		return HttpResponseRedirect(piece.url)
+	# The name is the hash of the content, it will never change
+	response["Cache-Control"] = "public, max-age=31536000, immutable"
+	return response
+
+
 class TranscribeIndex(generic.ListView):
 	template_name = 'collector/transcribe.html'
 	context_object_name = 'puzzlepiece'
@@ -210,6 +265,7 @@ class TranscribeIndex(generic.ListView):
 		return findUnconfidentPuzzlePieces(self)
 
 
+@rate_limited("processTranscription")
 def processTranscription(request, puzzlepiece_id):
 	data = None
 	errors = None
@@ -224,21 +280,24 @@ def processTranscription(request, puzzlepiece_id):
 			rotated_image = request.POST["rotated_image"]
 		else:
 			rotated_image = False
-		data = request.POST["data"]
+		parseError = None
 		try:
-			data = json.loads(data)
-		except Exception:
-			match = textSubmissionPattern.match(data)
-			if match:
-				data = parse_data_string(match)
-			else:
-				data = None
+			data = parseSubmission(request.POST["data"])
+		except ParseError as ex:
+			data = None
+			parseError = str(ex)
 
 		puzzlePiece = get_object_or_404(PuzzlePiece, pk=puzzlepiece_id)
 		# Hash IP bcs of GDPR
 		client_ip_address = hash_my_data(UtilityOps.UtilityOps.GetClientIP(request))
-		errors, transcriptData = processTransscriptionData(data, bad_image, rotated_image, puzzlePiece, client_ip_address)
-		determineConfidence(puzzlepiece_id)
+		if parseError and not bad_image:
+			errors = [parseError]
+		else:
+			errors, transcriptData = processTransscriptionData(data, bad_image, rotated_image, puzzlePiece, client_ip_address, request.POST["data"])
+		# Queued submissions are evaluated by the flusher
+		if not ingest.enabled():
+			determineConfidence(puzzlepiece_id)
+		pinToPrimary(request)
 
 	context = {
 		"data": data,
@@ -249,31 +308,30 @@ def processTranscription(request, puzzlepiece_id):
 
 
 
-def parse_data_string(matchedData):
-    data_dict = {}
-
-    # Sometimes the center is fully written out. Other times it is not.
-    # This allows for both.
-    data_dict["center"] = "T" if matchedData.group('center') == "Cauldron" else matchedData.group('center').upper()[0]
-
-    # Wall list of length 6. Default is wall true, since string contains list of
-    # openings.
-    data_dict["walls"] = [True] * 6
-    for opening in matchedData.group('sides').split(","):
-        data_dict["walls"][int(opening) - 1] = False
-
-    # Node list. Split string into list of strings, then split each side
-    # into a list of characters.
-    data_dict["nodes"] = []
-    side_list = matchedData.group('links').split()
-    for side in side_list:
-        data_dict["nodes"].append(list(side.upper()))
-
-    return data_dict
-
+def alreadyTranscribed(puzzlepieceId, client_ip_address):
+	return TranscriptionData.objects.filter(puzzlePiece_id=puzzlepieceId, ip_address=client_ip_address).exists()
 
+def saveTranscription(transcriptData, rawText):
+	# Straight into the database, or onto the ingest queue when INGEST_QUEUE_PATH
+	# is set. False if the submission is a repeat.
+	if ingest.enabled():
+		if not ingest.enqueue(transcriptData, rawText):
+			return False
+	else:
+		transcriptData.save()
+		if rawText is not None:
+			TranscriptionRawData.store(transcriptData, rawText)
+		stats.recordTranscription(transcriptData.ip_address, transcriptData.bad_image)
+		progress.transcriptionSubmitted()
+	seen.markSeen(transcriptData.ip_address, transcriptData.puzzlePiece_id)
+	leases.release(transcriptData.puzzlePiece_id, transcriptData.ip_address)
+	return True
+
+def processTransscriptionData(rawData, bad_image, rotated_image, puzzlePiece, client_ip_address, rawText=None):
+	# One vote per person and piece
+	if alreadyTranscribed(puzzlePiece.id, client_ip_address):
+		return ["You already transcribed this piece, thank you! It needs other eyes now."], None
 
-def processTransscriptionData(rawData, bad_image, rotated_image, puzzlePiece, client_ip_address):
 	if bad_image and bool(bad_image) == True:
 		transcriptData = TranscriptionData()
 		transcriptData.ip_address = client_ip_address
@@ -297,7 +355,8 @@ def processTransscriptionData(rawData, bad_image, rotated_image, puzzlePiece, cl
 		if rotated_image and bool(rotated_image) == True:
 			transcriptData.orientation = "wrong"
 
-		transcriptData.save()
+		if not saveTranscription(transcriptData, rawText):
+			return ["You already transcribed this piece, thank you! It needs other eyes now."], None
 		return [], transcriptData
 
 	center = UtilityOps.UtilityOps.GetDictValues(rawData, "center", None)
@@ -344,7 +403,8 @@ def processTransscriptionData(rawData, bad_image, rotated_image, puzzlePiece, cl
 		transcriptData.datahash = hash_my_data(hashStr.upper())
 		if rotated_image and bool(rotated_image) == True:                                                                                                                                                                                                                           transcriptData.orientation = "wrong"
 
-		transcriptData.save()
+		if not saveTranscription(transcriptData, rawText):
+			return ["You already transcribed this piece, thank you! It needs other eyes now."], None
 
 	return errors, transcriptData
 
@@ -358,14 +418,14 @@ class TranscriptionsIndex(generic.ListView):
 
 
 def transcriptionsDetail(request, transcription_id):
-	transcription = get_object_or_404(TranscriptionData, pk=transcription_id)
-
-	if not transcription.datahash:
-		pass
+	transcription = archive.findTranscription(transcription_id)
+	if transcription is None:
+		raise Http404("No such transcription")
 
 	context = {
 		"transcription": transcription,
-		"puzzlepiece": transcription.puzzlePiece
+		"puzzlepiece": transcription.puzzlePiece,
+		"rawdata": archive.rawText(transcription)
 	}
 	return render(request, 'collector/transcriptionDetail.html', context)
 
@@ -383,6 +443,7 @@ def confidenceDetail(request, confidence_id):
 		if "rerun" in request.POST:
 			print("rerun")
 			determineConfidence(confidence.puzzlePiece.id)
+			pinToPrimary(request)
 			confidence = get_object_or_404(ConfidenceTracking, pk=confidence_id)
 
 	context = {
@@ -391,15 +452,33 @@ def confidenceDetail(request, confidence_id):
 	return render(request, 'collector/confidenceDetail.html', context)
 
 
+def oneVotePerSubmitter(data):
+	# Submissions from before the duplicate check can have several votes by the
+	# same person for one piece, only their latest one counts
+	latest = {}
+	for d in data:
+		# Rows without a recorded submitter can't be told apart
+		key = d.ip_address if d.ip_address != "?.?.?.?" else ("row", d.id)
+		latest[key] = d
+	return sorted(latest.values(), key=lambda d: d.id)
+
 def determineConfidence(puzzlepieceId):
-	data = TranscriptionData.objects.filter(puzzlePiece_id=puzzlepieceId)
+	# Concurrent calls for one piece, from any node, are coalesced under a
+	# per-piece lock, see collector/locks.py
+	locks.coalesced(puzzlepieceId, evaluateConfidence)
+
+def evaluateConfidence(puzzlepieceId):
+	# Only what the vote counting needs, keeps the rows narrow. A rerun of a
+	# resolved piece also needs its archived transcriptions.
+	data = oneVotePerSubmitter(archive.pieceTranscriptions(puzzlepieceId, "id", "ip_address", "bad_image", "orientation", "datahash"))
 
 	hashes = {}
 	confidenceRatio = 80
 	rotatedConfidenceRatio = 90
 	confidenceThreshold = 0 # We set this programmatically later
-	minSubmissions = 10
-	rotatedMinSubmissions = 15
+	minSubmissions = MIN_SUBMISSIONS
+	rotatedMinSubmissions = ROTATED_MIN_SUBMISSIONS
+	earlyMatchMinVotes = 3
 	badCount = 0
 	badThreshold = 4
 	rotationCount = 0
@@ -431,6 +510,28 @@ def determineConfidence(puzzlepieceId):
 			totalCount -= 1
 			continue
 
+	for d in data:
+		if d.bad_image:
+			continue
+		if d.datahash not in hashes:
+			hashes[d.datahash] = 0
+		hashes[d.datahash] = hashes[d.datahash] + 1
+
+	# About a quarter of all images show an in-game piece we already solved from
+	# another screenshot. If the leading transcription matches such a solution,
+	# a few agreeing votes are enough and the image leaves the queue early.
+	if not rotationCount and hashes and totalCount < minSubmissions:
+		leadinghash = max(hashes, key=hashes.get)
+		confidence = (hashes[leadinghash] / totalCount) * 100
+		if hashes[leadinghash] >= earlyMatchMinVotes and confidence >= confidenceRatio and \
+				ConfidentSolution.objects.filter(datahash=leadinghash).exists():
+			tracker = setOrUpdateConfidenceTracking(puzzlepieceId, confidence)
+			for d in data:
+				if d.datahash == leadinghash:
+					setOrUpdateConfidenceSolution(puzzlepieceId, confidence, d.id)
+					break
+			return
+
 	# Is there enough data to determine a confidence level?
 	# If no, create or update a tracker entry.
 	if not rotationCount and totalCount < minSubmissions:
@@ -440,10 +541,6 @@ def determineConfidence(puzzlepieceId):
 		tracker = setOrUpdateConfidenceTracking(puzzlepieceId, totalCount)
 		return
 
-	for d in data:
-		if d.datahash not in hashes:
-			hashes[d.datahash] = 0
-		hashes[d.datahash] = hashes[d.datahash] + 1
 	# solution confidence threshold is...
 	if not rotationCount:
 		confidenceThreshold = confidenceRatio
@@ -473,7 +570,7 @@ def determineConfidence(puzzlepieceId):
 def updateTransCount(puzzlepieceId, transCount):
 	try:
 		piece = PuzzlePiece.objects.get(id=puzzlepieceId)
-		piece = PuzzlePiece.objects.filter(id=piece.id).update(transCount=transCount)
+		piece = PuzzlePiece.objects.filter(id=piece.id).update(transCount=transCount, last_modified=timezone.now())
 		return piece
 	except Exception as ex:
 		piece = None
@@ -482,6 +579,7 @@ def setOrUpdateBadImage(puzzlepieceId, badCount):
 	try:
 		bad = BadImage.objects.get(puzzlePiece_id=puzzlepieceId)
 		bad = BadImage.objects.filter(id=bad.id).update(badCount=badCount)
+		changes.touch(PuzzlePiece, id=puzzlepieceId)
 		return bad
 	except Exception as ex:
 		bad = None
@@ -490,6 +588,8 @@ def setOrUpdateBadImage(puzzlepieceId, badCount):
 	bad.puzzlePiece = get_object_or_404(PuzzlePiece, pk=puzzlepieceId)
 	bad.badCount = badCount
 	bad.save()
+	changes.touch(PuzzlePiece, id=puzzlepieceId)
+	progress.pieceMarkedBad()
 	return bad
 
 def setOrUpdateRotatedImage(puzzlepieceId, rotationCount):
@@ -524,7 +624,8 @@ def setOrUpdateConfidenceSolution(puzzlepieceId, confidence, transcriptiondataId
 	try:
 		solution = ConfidentSolution.objects.get(puzzlePiece_id=puzzlepieceId)
 		solution = ConfidentSolution.objects.filter(id=solution.id).update(
-				confidence=confidence
+				confidence=confidence,
+				last_modified=timezone.now(),
 		)
 		return solution
 	except Exception as ex:
@@ -533,7 +634,7 @@ def setOrUpdateConfidenceSolution(puzzlepieceId, confidence, transcriptiondataId
 
 	solution = ConfidentSolution()
 
-	transcription = TranscriptionData.objects.get(id=transcriptiondataId)
+	transcription = archive.findTranscription(transcriptiondataId)
 	print("looking for {} and found {}".format(transcriptiondataId, transcription.id))
 	solution.center = transcription.center
 	solution.wall1 = transcription.wall1
@@ -551,14 +652,18 @@ def setOrUpdateConfidenceSolution(puzzlepieceId, confidence, transcriptiondataId
 	solution.link6 = transcription.link6
 
 	solution.datahash = transcription.datahash
+	solution.canonicalhash = UtilityOps.UtilityOps.CanonicalSolutionHash(solution.center, solution.walls(), solution.links())
 	solution.puzzlePiece = get_object_or_404(PuzzlePiece, pk=puzzlepieceId)
 
 	solution.confidence = confidence
 	solution.save()
+	stats.recordResolution(puzzlepieceId, solution.datahash)
+	progress.pieceSolved()
 
 	return solution
 
 @method_decorator(cache_page(5 * 60), name='dispatch')
+@method_decorator(replica_reads, name='dispatch')
 class ConfidenceSolutionIndex(generic.ListView):
 	model = ConfidentSolution
 	template_name = 'collector/confidenceSolutionIndex.html'
@@ -574,6 +679,8 @@ def confidenceSolutionDetail(request, solution_id):
 	return render(request, 'collector/confidenceSolutionDetail.html', context)
 
 
+@method_decorator(replica_reads, name='dispatch')
+@method_decorator(conditional_response(60 * 5, urlNames=("puzzlepiece-list", "puzzlepiece-detail")), name='dispatch')
 class PuzzlePieceViewSet(viewsets.ReadOnlyModelViewSet):
     # annotate badimages count for serializer performance
     queryset = PuzzlePiece.objects.all().annotate(
@@ -595,48 +702,202 @@ class PuzzlePieceViewSet(viewsets.ReadOnlyModelViewSet):
         serializer = self.get_serializer(rando)
         return Response(serializer.data)
 
-    @action(detail=True, methods=['post'])
+    # no authentication, so a throttled report costs no session lookup
+    @action(detail=True, methods=['post'], authentication_classes=[], throttle_classes=[ReportApiThrottle])
     def report(self, request, *args, **kwargs):
         piece = self.get_object()
         if piece.badimages.count() > 0:
             # atomic increment of the count on all existing BadImages
             piece.badimages.update(badCount=F('badCount')+1)
+            changes.touch(PuzzlePiece, id=piece.id)
         else:
             # create a BadImage... might have a race condition :(
             bad = BadImage(puzzlePiece=piece, badCount=1)
             bad.save()
+            changes.touch(PuzzlePiece, id=piece.id)
+            progress.pieceMarkedBad()
+        pinToPrimary(request)
 
         # go ahead and return the updated piece
         piece = self.get_object()
         serializer = self.get_serializer(piece)
         return Response(serializer.data)
 
+    # {"priority": 20, "urls": [...], "hashes": [...], "submitters": [...],
+    # "since": "2020-11-20", "until": "2020-11-21"}, see collector/priority.py
+    @action(detail=False, methods=['post'], permission_classes=[permissions.IsAdminUser])
+    def reprioritize(self, request):
+        selection = ReprioritizeSerializer(data=request.data)
+        if not selection.is_valid():
+            return Response(selection.errors, status=status.HTTP_400_BAD_REQUEST)
+        options = selection.validated_data
+        try:
+            pieces = selectPieces(
+                urls=options["urls"],
+                hashes=options["hashes"],
+                submitters=options["submitters"],
+                since=options["since"],
+                until=options["until"],
+            )
+            updated = reprioritize(pieces, options["priority"])
+        except ValueError as ex:
+            return Response({"detail": str(ex)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"priority": options["priority"], "updated": updated})
+
+
+@method_decorator(replica_reads, name='dispatch')
+class MapViewSet(viewsets.ViewSet):
+    # Connected map components assembled from the confident solutions,
+    # looked up by transcription hash
+
+    def list(self, request):
+        try:
+            min_size = int(request.query_params.get('min_size', 2))
+        except ValueError:
+            min_size = 2
+
+        with sharedSolver() as solver:
+            components = []
+            for component in solver.components():
+                if len(component) < min_size:
+                    break
+                positions, conflicts = solver.layout(component[0])
+                components.append({
+                    'size': len(component),
+                    'conflicts': sorted(conflicts),
+                    'pieces': [
+                        {'datahash': key, 'url': solver.pieces[key].url, 'q': q, 'r': r}
+                        for key, (q, r) in positions.items()
+                    ],
+                })
+            return Response({'pieces': len(solver), 'components': components})
+
+    def retrieve(self, request, pk=None):
+        with sharedSolver() as solver:
+            if pk not in solver.pieces:
+                return Response({}, status=status.HTTP_404_NOT_FOUND)
+            piece = solver.pieces[pk]
+            return Response({
+                'datahash': piece.key,
+                'url': piece.url,
+                'center': piece.center,
+                'component': solver.componentOf(pk),
+                'neighbours': [
+                    {'side': side, 'datahash': key, 'url': solver.pieces[key].url}
+                    for side, key in solver.neighbours(pk)
+                ],
+            })
+
+
+@method_decorator(replica_reads, name='dispatch')
+class TranscriberStatsViewSet(viewsets.GenericViewSet):
+    # Leaderboards read the top of an index, no aggregation over transcriptions
+    queryset = TranscriberStats.objects.all()
+    serializer_class = TranscriberStatsSerializer
+    max_limit = 100
+
+    def get_limit(self, request):
+        try:
+            return max(1, min(self.max_limit, int(request.query_params.get('limit', 10))))
+        except ValueError:
+            return 10
+
+    def leaderboard(self, top):
+        top = list(top)
+        submitters = pseudonyms.PseudonymMap(stats.ip_address for stats in top)
+        context = dict(self.get_serializer_context(), pseudonyms=submitters)
+        data = self.get_serializer(top, many=True, context=context).data
+        submitters.save()
+        return Response(data)
+
+    def list(self, request):
+        top = TranscriberStats.objects.order_by('-transcriptionCount')[:self.get_limit(request)]
+        return self.leaderboard(top)
+
+    @action(detail=False)
+    def accuracy(self, request):
+        try:
+            min_resolved = int(request.query_params.get('min_resolved', 10))
+        except ValueError:
+            min_resolved = 10
+        top = TranscriberStats.objects.filter(resolvedCount__gte=min_resolved) \
+            .order_by('-agreementRate')[:self.get_limit(request)]
+        return self.leaderboard(top)
+
+
+class ProgressViewSet(viewsets.ViewSet):
+    # Served from counters maintained on write, see collector.progress.
+    # Live updates: /api/progress/stream (Server-Sent Events, ASGI only)
+
+    def list(self, request):
+        response = Response(progress.progressPayload())
+        response['Cache-Control'] = 'public, max-age={}'.format(settings.PROGRESS_CACHE_SECONDS)
+        return response
+
 
 class TranscriptionDataViewSet(viewsets.GenericViewSet, mixins.CreateModelMixin):
     queryset = TranscriptionData.objects.all()
     serializer_class = TranscriptionDataSerializer
+    # no authentication, so a throttled request costs no session lookup
+    authentication_classes = []
+    throttle_classes = [TranscriptionApiThrottle]
 
     # copied code from the mixin, but we need access to request here
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
 
-        x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-        if x_forwarded_for:
-            ip = x_forwarded_for.split(',')[0]
-        else:
-            ip = request.META.get('REMOTE_ADDR')
-
-        # TODO: ALSO MAKE HASH
+        # Hash IP bcs of GDPR, same as the web form
+        ip = hash_my_data(UtilityOps.UtilityOps.GetClientIP(request))
+        if alreadyTranscribed(serializer.validated_data["puzzlePiece"].id, ip):
+            return Response({"detail": "You already transcribed this piece."}, status=status.HTTP_409_CONFLICT)
 
-        # ip_address in kwargs here *should* put it in?
-        serializer.save(ip_address=ip)
+        transcription = TranscriptionData(ip_address=ip, **serializer.validated_data)
+        if not saveTranscription(transcription, None):
+            return Response({"detail": "You already transcribed this piece."}, status=status.HTTP_409_CONFLICT)
+        serializer.instance = transcription
+        pinToPrimary(request)
 
         headers = self.get_success_headers(serializer.data)
 
-        return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
+        # Queued: accepted, but not in the database yet
+        code = status.HTTP_202_ACCEPTED if ingest.enabled() else status.HTTP_201_CREATED
+        return Response(serializer.data, status=code, headers=headers)
+
+async def changesFeed(request, kind):
+	# NDJSON of pieces or solutions changed after ?cursor=, see collector/changes.py.
+	# ?wait=<seconds> holds the request open until something changes (long-poll,
+	# meant for ASGI, under WSGI it ties up a worker for that long)
+	if kind not in changes.FEEDS:
+		raise Http404("No such feed")
+	cursor = request.GET.get("cursor") or None
+	try:
+		limit = min(max(int(request.GET.get("limit", settings.CHANGES_PAGE_SIZE)), 1), settings.CHANGES_PAGE_SIZE)
+		wait = float(request.GET.get("wait", 0))
+		if not math.isfinite(wait):
+			# nan gets through min() and max() and would never time out
+			raise ValueError("wait must be a number of seconds")
+		wait = min(max(wait, 0), settings.CHANGES_MAX_WAIT)
+		if cursor:
+			changes.decodeCursor(cursor)
+	except ValueError as ex:
+		return JsonResponse({"detail": str(ex)}, status=400)
+
+	deadline = time.monotonic() + wait
+	while True:
+		lines, nextCursor = await sync_to_async(changes.changesAfter)(kind, cursor, limit)
+		left = deadline - time.monotonic()
+		if lines or left <= 0:
+			break
+		await asyncio.sleep(min(settings.CHANGES_POLL_INTERVAL, left))
+
+	response = HttpResponse("".join(lines), content_type="application/x-ndjson")
+	response["X-Next-Cursor"] = nextCursor or ""
+	response["Cache-Control"] = "no-cache"
+	return response
 
-@cache_page(60 * 5)
+@replica_reads
+@conditional_response(60 * 5)
 def exportVerifiedCSV(request):
 	response = HttpResponse(content_type = 'text/csv')
 	response['Content-Disposition'] = 'attachment; filename="verified.csv"'
@@ -685,7 +946,8 @@ def exportVerifiedCSV(request):
 
 	return response
 
-@cache_page(60 * 10)
+@replica_reads
+@conditional_response(60 * 10)
 def exportPiecesCSV(request):
 	response = HttpResponse(content_type = 'text/csv')
 	response['Content-Disposition'] = 'attachment; filename="imgurls.csv"'
@@ -699,18 +961,22 @@ def exportPiecesCSV(request):
 		"Transcription count"
 	])
 
+	# hash(ip) is too easy to reverse, exports show a keyed hash of it
+	submitters = pseudonyms.PseudonymMap()
 	for piece in PuzzlePiece.objects.all():
 		writer.writerow([
 			piece.url,
-			secretly_hash_my_data(piece.ip_address),
+			submitters[piece.ip_address],
 			piece.submitted_date,
 			piece.last_modified,
 			piece.transCount
 		])
+	submitters.save()
 
 	return response
 
-@cache_page(60 * 5)
+@replica_reads
+@conditional_response(60 * 5)
 def exportTranscriptionsCSV(request):
 	response = HttpResponse(content_type = 'text/csv')
 	response['Content-Disposition'] = 'attachment; filename="transcriptions.csv"'
@@ -733,13 +999,20 @@ def exportTranscriptionsCSV(request):
 		"Transcription hash"
 	])
 
-	for trans in TranscriptionData.objects.all():
+	# One query for the pieces too, and none of the columns we don't write.
+	# Live transcriptions first, then the archived ones.
+	transcriptions = archive.allTranscriptions(lambda model: model.objects.select_related("puzzlePiece").only(
+		"puzzlePiece__url", "ip_address", "submitted_date", "bad_image", "orientation", "center",
+		"wall1", "wall2", "wall3", "wall4", "wall5", "wall6",
+		"link1", "link2", "link3", "link4", "link5", "link6", "datahash"))
+	submitters = pseudonyms.PseudonymMap()
+	for trans in transcriptions:
 		walls = [trans.wall1, trans.wall2, trans.wall3, trans.wall4, trans.wall5, trans.wall6]
 		openings = ",".join(str(i+1) for i in range(6) if not walls[i])
 
 		writer.writerow([
 			trans.puzzlePiece.url,
-			secretly_hash_my_data(trans.ip_address),
+			submitters[trans.ip_address],
 			trans.submitted_date,
 			trans.bad_image,
 			trans.orientation,
@@ -753,5 +1026,6 @@ def exportTranscriptionsCSV(request):
 			trans.link6,
 			trans.datahash
 		])
+	submitters.save()
 
 	return response
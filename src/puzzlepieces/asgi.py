@@ -4,13 +4,32 @@ ASGI config for puzzlepieces project.
 It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
-https://docs.djangoproject.com/en/3.0/howto/deployment/asgi/
+https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
 """
 
 import os
 
+from asgiref.sync import ThreadSensitiveContext
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'puzzlepieces.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Needs the app registry, so only after Django is set up
+from collector import outbound
+from collector.progress import progressStream
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        # Shared HTTP client for the async views
+        await outbound.lifespan(receive, send)
+    elif scope["type"] == "http" and scope["path"] == "/api/progress/stream":
+        # Long-lived progress streams bypass Django
+        await progressStream(scope, receive, send)
+    else:
+        # Django runs all sync code of all requests on a single thread unless
+        # each request gets its own context
+        async with ThreadSensitiveContext():
+            await django_application(scope, receive, send)
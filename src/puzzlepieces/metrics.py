@@ -0,0 +1,206 @@
+from contextvars import ContextVar
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import Http404, HttpResponse
+import asyncio
+import logging
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the latency histogram buckets, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float("inf"))
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class ViewStats:
+	def __init__(self):
+		self.buckets = [0] * len(BUCKETS)
+		self.count = 0
+		self.seconds = 0.0
+		self.queries = 0
+		self.dbSeconds = 0.0
+		self.cacheHits = 0
+		self.cacheMisses = 0
+
+	def observe(self, seconds, queries, dbSeconds, cacheHit):
+		for i, bound in enumerate(BUCKETS):
+			if seconds <= bound:
+				self.buckets[i] += 1
+				break
+		self.count += 1
+		self.seconds += seconds
+		self.queries += queries
+		self.dbSeconds += dbSeconds
+		if cacheHit is True:
+			self.cacheHits += 1
+		elif cacheHit is False:
+			self.cacheMisses += 1
+
+	def quantile(self, q):
+		# Linear interpolation inside the bucket, like histogram_quantile()
+		rank = q * self.count
+		seen = 0
+		lower = 0.0
+		for bound, count in zip(BUCKETS, self.buckets):
+			if count and seen + count >= rank:
+				if bound == float("inf"):
+					return lower
+				return lower + (bound - lower) * (rank - seen) / count
+			seen += count
+			lower = bound
+		return lower
+
+
+# Stats are kept per process, each uwsgi worker reports its own requests
+_stats = {}
+_statsLock = threading.Lock()
+
+
+class QueryTimer:
+	def __init__(self):
+		self.queries = 0
+		self.seconds = 0.0
+		self._lock = threading.Lock()
+
+	def observe(self, seconds):
+		with self._lock:
+			self.queries += 1
+			self.seconds += seconds
+
+
+# The timer of the request being served. Context variables follow the request
+# into sync_to_async threads, so queries are counted on whichever thread and
+# connection they run.
+_currentTimer = ContextVar("queryTimer", default=None)
+
+
+def countQuery(execute, sql, params, many, context):
+	timer = _currentTimer.get()
+	if timer is None:
+		return execute(sql, params, many, context)
+	start = time.perf_counter()
+	try:
+		return execute(sql, params, many, context)
+	finally:
+		timer.observe(time.perf_counter() - start)
+
+
+def installQueryCounter(connection, **kwargs):
+	# On every connection once, including the ones opened later by other threads
+	if countQuery not in connection.execute_wrappers:
+		connection.execute_wrappers.append(countQuery)
+
+
+class RequestMetricsMiddleware:
+	# Records wall time, query count, DB time and cache_page hits per view.
+	# Removed from the stack entirely when REQUEST_METRICS_ENABLED is off.
+	# Works in both modes, so it doesn't force async views back to sync under
+	# ASGI.
+	sync_capable = True
+	async_capable = True
+
+	def __init__(self, get_response):
+		if not settings.REQUEST_METRICS_ENABLED:
+			raise MiddlewareNotUsed()
+		self.get_response = get_response
+		if asyncio.iscoroutinefunction(get_response):
+			# What Django's MiddlewareMixin does to look like a coroutine function
+			self._is_coroutine = asyncio.coroutines._is_coroutine
+		connection_created.connect(installQueryCounter, dispatch_uid="puzzlepieces.metrics")
+		for connection in connections.all():
+			installQueryCounter(connection)
+
+	def __call__(self, request):
+		if asyncio.iscoroutinefunction(self.get_response):
+			return self.__acall__(request)
+		timer = QueryTimer()
+		token = _currentTimer.set(timer)
+		start = time.perf_counter()
+		try:
+			response = self.get_response(request)
+		finally:
+			_currentTimer.reset(token)
+		self.record(request, response, time.perf_counter() - start, timer)
+		return response
+
+	async def __acall__(self, request):
+		timer = QueryTimer()
+		token = _currentTimer.set(timer)
+		start = time.perf_counter()
+		try:
+			response = await self.get_response(request)
+		finally:
+			_currentTimer.reset(token)
+		self.record(request, response, time.perf_counter() - start, timer)
+		return response
+
+	def record(self, request, response, seconds, timer):
+		match = request.resolver_match
+		view = match.view_name if match else "unresolved"
+		# cache_page leaves this at False on a hit and True on a miss, views
+		# without cache_page never set it
+		cacheHit = None
+		if request.method in ("GET", "HEAD") and hasattr(request, "_cache_update_cache"):
+			cacheHit = not request._cache_update_cache
+
+		with _statsLock:
+			if view not in _stats:
+				_stats[view] = ViewStats()
+			_stats[view].observe(seconds, timer.queries, timer.seconds, cacheHit)
+
+		if seconds >= settings.REQUEST_METRICS_SLOW_SECONDS and random.random() < settings.REQUEST_METRICS_SLOW_SAMPLE_RATE:
+			logger.warning("slow request: %s %s view=%s status=%s time=%.3fs queries=%d db=%.3fs cache=%s",
+				request.method, request.path, view, response.status_code, seconds, timer.queries, timer.seconds,
+				{True: "hit", False: "miss", None: "-"}[cacheHit])
+
+
+def metricsView(request):
+	if not settings.REQUEST_METRICS_ENABLED:
+		raise Http404("Metrics are disabled")
+
+	with _statsLock:
+		snapshot = [(view, stats.buckets[:], stats.count, stats.seconds, stats.queries, stats.dbSeconds, stats.cacheHits, stats.cacheMisses,
+			[stats.quantile(q) for q in QUANTILES]) for view, stats in sorted(_stats.items())]
+
+	lines = [
+		"# HELP puzzlepieces_request_duration_seconds Wall time per request",
+		"# TYPE puzzlepieces_request_duration_seconds histogram",
+	]
+	for view, buckets, count, seconds, queries, dbSeconds, hits, misses, quantiles in snapshot:
+		cumulative = 0
+		for bound, bucket in zip(BUCKETS, buckets):
+			cumulative += bucket
+			le = "+Inf" if bound == float("inf") else repr(bound)
+			lines.append('puzzlepieces_request_duration_seconds_bucket{{view="{}",le="{}"}} {}'.format(view, le, cumulative))
+		lines.append('puzzlepieces_request_duration_seconds_sum{{view="{}"}} {:.6f}'.format(view, seconds))
+		lines.append('puzzlepieces_request_duration_seconds_count{{view="{}"}} {}'.format(view, count))
+
+	lines.append("# HELP puzzlepieces_request_duration_quantile_seconds Latency percentiles estimated from the histogram")
+	lines.append("# TYPE puzzlepieces_request_duration_quantile_seconds gauge")
+	for view, buckets, count, seconds, queries, dbSeconds, hits, misses, quantiles in snapshot:
+		for q, value in zip(QUANTILES, quantiles):
+			lines.append('puzzlepieces_request_duration_quantile_seconds{{view="{}",quantile="{}"}} {:.6f}'.format(view, q, value))
+
+	lines.append("# HELP puzzlepieces_db_queries_total Database queries run by requests")
+	lines.append("# TYPE puzzlepieces_db_queries_total counter")
+	for view, buckets, count, seconds, queries, dbSeconds, hits, misses, quantiles in snapshot:
+		lines.append('puzzlepieces_db_queries_total{{view="{}"}} {}'.format(view, queries))
+
+	lines.append("# HELP puzzlepieces_db_seconds_total Time spent in database queries")
+	lines.append("# TYPE puzzlepieces_db_seconds_total counter")
+	for view, buckets, count, seconds, queries, dbSeconds, hits, misses, quantiles in snapshot:
+		lines.append('puzzlepieces_db_seconds_total{{view="{}"}} {:.6f}'.format(view, dbSeconds))
+
+	lines.append("# HELP puzzlepieces_page_cache_total cache_page lookups by result")
+	lines.append("# TYPE puzzlepieces_page_cache_total counter")
+	for view, buckets, count, seconds, queries, dbSeconds, hits, misses, quantiles in snapshot:
+		if hits or misses:
+			lines.append('puzzlepieces_page_cache_total{{view="{}",result="hit"}} {}'.format(view, hits))
+			lines.append('puzzlepieces_page_cache_total{{view="{}",result="miss"}} {}'.format(view, misses))
+
+	return HttpResponse("\n".join(lines) + "\n", content_type="text/plain; version=0.0.4")
@@ -26,6 +26,10 @@ TEMPLATE_DIRS = (
 # SECURITY WARNING: keep the secret key used in production secret!
 SECRET_KEY = os.getenv("SECRET_KEY")
 
+# Key for the submitter ids in exports and the API (HMAC of the ip hash).
+# Defaults to SECRET_KEY, run `manage.py rebuildpseudonyms` after changing it
+PSEUDONYM_KEY = os.environ.get("PSEUDONYM_KEY") or SECRET_KEY
+
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = False
 #DEBUG = int(os.environ.get("DEBUG", default=0))
@@ -48,9 +52,12 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'puzzlepieces.metrics.RequestMetricsMiddleware',
+    'collector.compression.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
+    'collector.dbrouting.PinToPrimaryMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
@@ -79,7 +86,10 @@ WSGI_APPLICATION = 'puzzlepieces.wsgi.application'
 
 
 # Database
-# https://docs.djangoproject.com/en/3.0/ref/settings/#databases
+# https://docs.djangoproject.com/en/3.2/ref/settings/#databases
+
+# All existing tables use 32 bit ids
+DEFAULT_AUTO_FIELD = "django.db.models.AutoField"
 
 DATABASES = {
     "default": {
@@ -95,6 +105,100 @@ DATABASES = {
     }
 }
 
+# Optional read replica. Heavy read-only views (exports, listings, the pieces
+# API) are routed there by collector.dbrouting, everything else stays on
+# default. Unset values fall back to the primary's settings.
+if os.environ.get("SQL_REPLICA_HOST") or os.environ.get("SQL_REPLICA_DATABASE"):
+    DATABASES["replica"] = dict(
+        DATABASES["default"],
+        NAME=os.environ.get("SQL_REPLICA_DATABASE", DATABASES["default"]["NAME"]),
+        USER=os.environ.get("SQL_REPLICA_USER", DATABASES["default"]["USER"]),
+        PASSWORD=os.environ.get("SQL_REPLICA_PASSWORD", DATABASES["default"]["PASSWORD"]),
+        HOST=os.environ.get("SQL_REPLICA_HOST", DATABASES["default"]["HOST"]),
+        PORT=os.environ.get("SQL_REPLICA_PORT", DATABASES["default"]["PORT"]),
+        TEST={"MIRROR": "default"},
+    )
+
+DATABASE_ROUTERS = ["collector.dbrouting.ReplicaRouter"]
+
+# Rate limits, queue leases and seen filters live in the cache. The default
+# is per process; with several workers point CACHE_BACKEND / CACHE_LOCATION
+# at a shared cache, e.g. django.core.cache.backends.memcached.PyMemcacheCache
+# and memcached:11211 (the service in ops/docker-compose.yml)
+CACHES = {
+    "default": {
+        "BACKEND": os.environ.get("CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.environ.get("CACHE_LOCATION", ""),
+    }
+}
+if "memcached" not in CACHES["default"]["BACKEND"]:
+    # Django's default of 300 entries is far too small for per person state
+    CACHES["default"]["OPTIONS"] = {"MAX_ENTRIES": int(os.environ.get("CACHE_MAX_ENTRIES", 100000))}
+
+# How long a client that just submitted something keeps reading from the
+# primary, should be longer than the usual replication lag
+REPLICA_LAG_SECONDS = int(os.environ.get("REPLICA_LAG_SECONDS", 10))
+
+# Per view latency, query count and page cache stats, served on /metrics.
+# Slow requests are logged, sampled at REQUEST_METRICS_SLOW_SAMPLE_RATE.
+REQUEST_METRICS_ENABLED = bool(int(os.environ.get("REQUEST_METRICS_ENABLED", 0)))
+REQUEST_METRICS_SLOW_SECONDS = float(os.environ.get("REQUEST_METRICS_SLOW_SECONDS", 1.0))
+REQUEST_METRICS_SLOW_SAMPLE_RATE = float(os.environ.get("REQUEST_METRICS_SLOW_SAMPLE_RATE", 0.1))
+
+# Progress dashboard: how long the JSON payload is cached, and how often the
+# Server-Sent Events stream checks for changes / sends keepalives (seconds)
+PROGRESS_CACHE_SECONDS = int(os.environ.get("PROGRESS_CACHE_SECONDS", 5))
+PROGRESS_STREAM_INTERVAL = float(os.environ.get("PROGRESS_STREAM_INTERVAL", 2))
+PROGRESS_STREAM_KEEPALIVE = float(os.environ.get("PROGRESS_STREAM_KEEPALIVE", 15))
+
+# How long a transcriber's seen-pieces filter stays cached (seconds), it is
+# rebuilt from the database after that
+SEEN_FILTER_SECONDS = int(os.environ.get("SEEN_FILTER_SECONDS", 24 * 60 * 60))
+
+# How long a piece handed out by the transcription queue stays reserved for
+# that transcriber (seconds), and how many open leases a piece can have
+LEASE_SECONDS = int(os.environ.get("LEASE_SECONDS", 180))
+LEASE_SLOTS = int(os.environ.get("LEASE_SLOTS", 10))
+
+# Per-piece lock around confidence recomputation: how long a request waits
+# for it before leaving the work to the holder, and when the cache based lock
+# (everything but MySQL) expires if its holder died (seconds)
+PIECE_LOCK_WAIT = float(os.environ.get("PIECE_LOCK_WAIT", 0.5))
+PIECE_LOCK_SECONDS = int(os.environ.get("PIECE_LOCK_SECONDS", 30))
+
+# Token bucket rate limits per hashed client ip on the submission endpoints:
+# up to burst requests at once, refilled at per_minute
+RATE_LIMITS_ENABLED = bool(int(os.environ.get("RATE_LIMITS_ENABLED", 1)))
+RATE_LIMITS = {
+    "puzzlepieceSubmit": {"burst": 10, "per_minute": 10},
+    "processTranscription": {"burst": 10, "per_minute": 30},
+    "transcriptionApi": {"burst": 10, "per_minute": 30},
+    "reportApi": {"burst": 10, "per_minute": 10},
+}
+
+# Outbound requests to the image hosts from the async views: seconds until
+# a slow host gets an error, and connections per process
+OUTBOUND_HTTP_TIMEOUT = float(os.environ.get("OUTBOUND_HTTP_TIMEOUT", 5))
+OUTBOUND_HTTP_MAX_CONNECTIONS = int(os.environ.get("OUTBOUND_HTTP_MAX_CONNECTIONS", 100))
+
+# Write-behind ingestion: with a path set, transcription submissions go to
+# this local SQLite file and `manage.py flushingest` moves them into the
+# database. Empty writes them directly.
+INGEST_QUEUE_PATH = os.environ.get("INGEST_QUEUE_PATH", "")
+
+# Largest body (all compressed variants together) collector.conditional keeps
+# in the cache, memcached refuses items over 1 MB. Bigger exports are
+# generated for every client that lacks the current version.
+CONDITIONAL_CACHE_MAX_BYTES = int(os.environ.get("CONDITIONAL_CACHE_MAX_BYTES", 900 * 1024))
+
+# Changes feed (/api/changes/pieces, /api/changes/solutions): records per
+# response, longest long-poll and how often it checks the database while
+# waiting, and how old a change has to be before it is handed out (seconds)
+CHANGES_PAGE_SIZE = int(os.environ.get("CHANGES_PAGE_SIZE", 1000))
+CHANGES_MAX_WAIT = float(os.environ.get("CHANGES_MAX_WAIT", 30))
+CHANGES_POLL_INTERVAL = float(os.environ.get("CHANGES_POLL_INTERVAL", 1))
+CHANGES_SETTLE_SECONDS = float(os.environ.get("CHANGES_SETTLE_SECONDS", 2))
+
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
 
@@ -133,6 +237,10 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 
+# Local copies of the piece images, filled by the cacheimages command
+IMAGE_CACHE_ROOT = os.environ.get("IMAGE_CACHE_ROOT", os.path.join(BASE_DIR, "imagecache"))
+IMAGE_CACHE_MAX_SIZE = int(os.environ.get("IMAGE_CACHE_MAX_SIZE", 1600))
+
 
 REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.LimitOffsetPagination',
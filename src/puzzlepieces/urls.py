@@ -15,7 +15,9 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import include, path
+from . import metrics
 
 urlpatterns = [
+    path("metrics", metrics.metricsView, name="metrics"),
     path("", include("collector.urls"))
 ]